@@ -20,6 +20,13 @@ if errorlevel 1 (
     exit /b 1
 )
 
+REM 可选参数：打包方式 onefile（默认）/ onedir / zipapp，后两者冷启动更快，由 build.py 构建
+if not "%~1"=="" if not "%~1"=="onefile" (
+    python build.py --mode %~1
+    pause
+    exit /b
+)
+
 echo 正在安装依赖...
 pip install -r requirements.txt
 pip install pyinstaller
@@ -27,8 +34,8 @@ pip install pyinstaller
 echo.
 echo 开始构建可执行文件...
 
-REM 构建可执行文件
-pyinstaller --onefile --name wms-archive-tool.exe --add-data "config.yaml;." --console --clean main.py
+REM 构建可执行文件（main.py 通过 importlib 延迟导入 requests/pymysql/redis/prometheus_client，需要显式声明）
+pyinstaller --onefile --name wms-archive-tool.exe --add-data "config.yaml;." --console --clean --hidden-import requests --hidden-import pymysql --hidden-import redis --hidden-import prometheus_client main.py
 
 REM 创建目标目录
 if not exist "dist\windows" mkdir dist\windows
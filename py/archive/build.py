@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 """
 WMS归档工具 - 可执行文件构建脚本
-用于将Python脚本打包为单个可执行文件
+用于将Python脚本打包为可执行文件，支持三种打包方式：
+  onefile  单个可执行文件（默认），每次启动都要解压到临时目录
+  onedir   可执行文件加依赖目录，启动时无需解压
+  zipapp   .pyz 压缩包，依赖在首次运行时解压到缓存目录，之后直接复用
 """
 
+import argparse
+import hashlib
 import os
 import platform
 import subprocess
@@ -39,9 +44,84 @@ def create_dist_directory():
     dist_dir.mkdir(exist_ok=True)
     return dist_dir
 
-def build_executable():
+# main.py 通过 importlib 延迟导入这些模块，PyInstaller 静态分析不到，需要显式声明
+HIDDEN_IMPORTS = ["requests", "pymysql", "redis", "prometheus_client"]
+
+# zipapp 的启动入口：依赖按构建号解压到缓存目录，同一构建只在首次运行时解压一次
+ZIPAPP_BOOTSTRAP = '''import os
+import sys
+import zipfile
+
+BUILD_ID = {build_id!r}
+
+
+def extract_dependencies():
+    cache_root = os.environ.get('WMS_ARCHIVE_CACHE') or os.path.join(os.path.expanduser('~'), '.cache', 'wms-archive-tool')
+    target = os.path.join(cache_root, BUILD_ID)
+    if not os.path.isdir(target):
+        # 先解压到临时目录再改名，多个进程同时首次启动也不会读到半解压的目录
+        staging = f"{{target}}.{{os.getpid()}}.tmp"
+        with zipfile.ZipFile(os.path.dirname(os.path.abspath(__file__))) as archive:
+            members = [name for name in archive.namelist() if name.startswith('site-packages/')]
+            archive.extractall(staging, members)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # 其他进程已完成解压
+            import shutil
+            shutil.rmtree(staging, ignore_errors=True)
+    return os.path.join(target, 'site-packages')
+
+
+sys.path.insert(0, extract_dependencies())
+import main
+
+main.main()
+'''
+
+
+def get_build_id():
+    """构建号：依赖清单和 Python 版本的摘要，依赖变化后使用新的缓存目录"""
+    digest = hashlib.sha256()
+    digest.update(Path("requirements.txt").read_bytes())
+    digest.update(platform.python_version().encode())
+    digest.update(platform.machine().encode())
+    return digest.hexdigest()[:12]
+
+
+def build_zipapp():
+    """构建 zipapp：源码直接从压缩包导入，第三方依赖（含二进制扩展）在首次运行时解压到缓存目录"""
+    print("正在构建 zipapp...")
+    staging_dir = Path("build") / "zipapp"
+    if staging_dir.exists():
+        shutil.rmtree(staging_dir)
+    staging_dir.mkdir(parents=True)
+
+    try:
+        subprocess.run([sys.executable, "-m", "pip", "install", "-r", "requirements.txt",
+                        "--target", str(staging_dir / "site-packages")], check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"构建失败: {e}")
+        return None
+
+    for source in ("main.py", "logsetup.py", "runhistory.py"):
+        shutil.copy(source, staging_dir / source)
+    with open(staging_dir / "__main__.py", 'w', encoding='utf-8') as f:
+        f.write(ZIPAPP_BOOTSTRAP.format(build_id=get_build_id()))
+
+    create_dist_directory()
+    exe_name = "wms-archive-tool.pyz"
+    subprocess.run([sys.executable, "-m", "zipapp", str(staging_dir), "-o", str(Path("dist") / exe_name),
+                    "-p", "/usr/bin/env python3"], check=True)
+    print(f"zipapp 构建成功: {exe_name}")
+    return exe_name
+
+
+def build_executable(mode="onefile"):
     """构建可执行文件"""
-    print(f"正在为 {platform.system()} 平台构建可执行文件...")
+    print(f"正在为 {platform.system()} 平台构建可执行文件（{mode}）...")
+    if mode == "zipapp":
+        return build_zipapp()
     
     # 确定输出的可执行文件名
     if platform.system() == "Windows":
@@ -56,13 +136,15 @@ def build_executable():
         sys.executable,
         "-m",
         "PyInstaller",
-        "--onefile",  # 打包成单个可执行文件
+        f"--{mode}",  # onefile 打包成单个可执行文件，onedir 打包成目录
         "--name", exe_name,  # 输出文件名
         "--add-data", "config.yaml:.",  # 包含配置文件
         "--console",  # 控制台应用程序
         "--clean",  # 清理临时文件
-        "main.py"  # 主脚本
     ]
+    for module in HIDDEN_IMPORTS:
+        cmd.extend(["--hidden-import", module])
+    cmd.append("main.py")  # 主脚本
     
     try:
         result = subprocess.run(cmd, check=True)
@@ -85,6 +167,8 @@ def organize_distribution(exe_name):
     src_exe = Path("dist") / exe_name
     dst_exe = platform_dir / exe_name
     
+    if dst_exe.is_dir():
+        shutil.rmtree(dst_exe)
     if src_exe.exists():
         shutil.move(str(src_exe), str(dst_exe))
         print(f"可执行文件已移动到: {dst_exe}")
@@ -120,7 +204,14 @@ def organize_distribution(exe_name):
         f.write(readme_content)
     print(f"说明文档已创建: {readme_path}")
 
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='WMS 归档工具可执行文件构建器')
+    parser.add_argument('--mode', choices=['onefile', 'onedir', 'zipapp'], default='onefile',
+                        help='打包方式，默认为 onefile；onedir/zipapp 冷启动更快，可用 startup_benchmark.py 对比')
+    return parser.parse_args()
+
 def main():
+    args = parse_arguments()
     print("WMS 归档工具 - 可执行文件构建器")
     print("=" * 50)
     print(f"当前平台: {platform.system()} {platform.machine()}")
@@ -130,7 +221,7 @@ def main():
     install_dependencies()
     
     # 构建可执行文件
-    exe_name = build_executable()
+    exe_name = build_executable(args.mode)
     if not exe_name:
         print("构建失败，退出。")
         sys.exit(1)
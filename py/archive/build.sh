@@ -16,6 +16,12 @@ if ! command -v pip3 &> /dev/null; then
     exit 1
 fi
 
+# 可选参数：打包方式 onefile（默认）/ onedir / zipapp，后两者冷启动更快，由 build.py 构建
+MODE="${1:-onefile}"
+if [ "$MODE" != "onefile" ]; then
+    exec python3 build.py --mode "$MODE"
+fi
+
 echo "正在安装依赖..."
 pip3 install -r requirements.txt
 pip3 install pyinstaller
@@ -23,18 +29,21 @@ pip3 install pyinstaller
 echo ""
 echo "开始构建可执行文件..."
 
+# main.py 通过 importlib 延迟导入这些模块，PyInstaller 静态分析不到，需要显式声明
+HIDDEN_IMPORTS="--hidden-import requests --hidden-import pymysql --hidden-import redis --hidden-import prometheus_client"
+
 # 根据操作系统设置输出文件名
 if [[ "$OSTYPE" == "msys" || "$OSTYPE" == "win32" ]]; then
     # Windows
-    pyinstaller --onefile --name wms-archive-tool.exe --add-data "config.yaml;." --console --clean main.py
+    pyinstaller --onefile --name wms-archive-tool.exe --add-data "config.yaml;." --console --clean $HIDDEN_IMPORTS main.py
     TARGET_DIR="dist/windows"
 elif [[ "$OSTYPE" == "darwin"* ]]; then
     # macOS
-    pyinstaller --onefile --name wms-archive-tool-mac --add-data "config.yaml:." --console --clean main.py
+    pyinstaller --onefile --name wms-archive-tool-mac --add-data "config.yaml:." --console --clean $HIDDEN_IMPORTS main.py
     TARGET_DIR="dist/mac"
 else
     # Linux
-    pyinstaller --onefile --name wms-archive-tool-linux --add-data "config.yaml:." --console --clean main.py
+    pyinstaller --onefile --name wms-archive-tool-linux --add-data "config.yaml:." --console --clean $HIDDEN_IMPORTS main.py
     TARGET_DIR="dist/linux"
 fi
 
@@ -46,7 +46,7 @@ a = Analysis(
     datas=[
         ('config.yaml', '.'),  # 包含配置文件
     ],
-    hiddenimports=[],
+    hiddenimports=['requests', 'pymysql', 'redis', 'prometheus_client'],  # main.py 中延迟导入，静态分析不到
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
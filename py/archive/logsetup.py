@@ -0,0 +1,126 @@
+"""
+归档工具（main.py）的日志层，随归档工具一起打包（镜像同步工具使用 script/logsetup.py）
+
+- 日志调用使用 %s 占位符，级别未开启时不格式化参数
+- 根 logger 只挂一个 QueueHandler，时间格式化、JSON 序列化和写 stderr/文件都在后台 QueueListener 线程中完成
+- 可选输出 JSON Lines，extra 中的 target / table / iteration / phase / duration 作为独立字段
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+TEXT_FORMAT = '%(asctime)s | %(levelname)-8s | %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# JSON Lines 中作为独立字段输出的 extra 字段
+EVENT_FIELDS = ('target', 'table', 'iteration', 'phase', 'duration')
+
+_active = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    每条日志输出为一行 JSON：时间、级别、进程/线程、消息，以及 fields 中出现的 extra 字段；
+    与 py/archive/logsetup.py 和 script/logsetup.py 中的定义保持一致（CI 会比对两份源码）
+    """
+
+    def __init__(self, fields=(), datefmt=None):
+        super().__init__(datefmt=datefmt)
+        self.fields = fields
+
+    def format(self, record):
+        event = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.processName,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for field in self.fields:
+            value = getattr(record, field, None)
+            if value is not None:
+                event[field] = round(value, 3) if field == 'duration' else value
+        # 跨进程传递的日志在工作进程中已把异常渲染为 exc_text
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            event['exception'] = record.exc_text
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class ThreadQueueHandler(logging.handlers.QueueHandler):
+    """
+    同进程队列：调用线程只合并消息参数（避免之后参数被修改），异常和 extra 字段原样交给后台线程格式化；
+    标准 QueueHandler.prepare 会在调用线程完成整条格式化（包括堆栈）
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class LoggingHandle:
+    """setup_logging 的返回值：持有输出 handler 和后台线程，用于调整文本格式和退出前刷新"""
+
+    def __init__(self, handlers, listener=None, json_lines=False):
+        self.handlers = handlers
+        self.listener = listener
+        self.json_lines = json_lines
+
+    def set_text_format(self, text_format, datefmt=DATE_FORMAT):
+        """修改文本格式（JSON Lines 不受影响），如多个归档目标并发时加上线程名"""
+        if self.json_lines:
+            return
+        for handler in self.handlers:
+            handler.setFormatter(logging.Formatter(text_format, datefmt=datefmt))
+
+    def stop(self):
+        """停止后台线程，写出队列中剩余的日志"""
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+
+
+def setup_logging(level='INFO', json_lines=False, use_queue=True, log_file=None,
+                  text_format=TEXT_FORMAT, datefmt=DATE_FORMAT):
+    """
+    配置根 logger 并返回 LoggingHandle；重复调用时先停止上一次的后台线程
+    use_queue 为 False 时直接同步写出
+    """
+    global _active
+    if _active:
+        _active.stop()
+
+    formatter = JsonLinesFormatter(EVENT_FIELDS, datefmt=datefmt) if json_lines else logging.Formatter(text_format, datefmt=datefmt)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    if not use_queue:
+        for handler in handlers:
+            root.addHandler(handler)
+        _active = LoggingHandle(handlers, json_lines=json_lines)
+        return _active
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(ThreadQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _active = LoggingHandle(handlers, listener, json_lines)
+    atexit.register(_active.stop)
+    return _active
+
@@ -1,27 +1,60 @@
 import time
-import requests
-from requests.adapters import HTTPAdapter
-try:
-    from urllib3.util.retry import Retry
-except ImportError:
-    from requests.packages.urllib3.util.retry import Retry
-import pymysql  # 需要先 pip install PyMySQL
-import redis  # 需要先 pip install redis
+import importlib
 import logging
+import math
 from datetime import datetime, timedelta
-import yaml
 import os
+import re
+import json
+import argparse
+import queue
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from logsetup import setup_logging
+from runhistory import RunHistory, QuantileSketch, format_report
 
 # --- 日志配置 ---
-# 配置日志格式，同时输出到终端和可选的日志文件
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)-8s | %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# 加载配置文件前先同步输出到终端，加载后按 logging 配置改为后台线程写出（见 logsetup.py）
+setup_logging(use_queue=False)
 
 logger = logging.getLogger(__name__)
 
+
+class LazyModule:
+    """
+    延迟导入的模块代理：首次访问属性时才导入，缩短冷启动时间（--report 等不访问数据库的路径完全不导入）
+    importlib.import_module 自带模块锁，多个线程同时首次访问也是安全的
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.__dict__['_name']), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(importlib.import_module(self.__dict__['_name']), attr, value)
+
+
+requests = LazyModule('requests')
+pymysql = LazyModule('pymysql')  # 需要先 pip install PyMySQL
+redis = LazyModule('redis')  # 需要先 pip install redis
+_prometheus_client = None
+
+
+def load_prometheus_client():
+    """按需导入可选的 prometheus_client（pip install prometheus-client），未安装时返回 None"""
+    global _prometheus_client
+    if _prometheus_client is None:
+        try:
+            _prometheus_client = importlib.import_module('prometheus_client')
+        except ImportError:
+            _prometheus_client = False
+    return _prometheus_client or None
+
+
 # --- 加载配置 ---
 def load_config():
     """
@@ -29,6 +62,7 @@ def load_config():
     """
     config_path = 'config.yaml'
     if os.path.exists(config_path):
+        import yaml
         with open(config_path, 'r', encoding='utf-8') as f:
             config = yaml.safe_load(f)
     else:
@@ -37,7 +71,7 @@ def load_config():
             "archive_config": {
                 "increment_value": 10000,
                 "default_min_id_value": 10000,
-                "total_iterations": 1000
+                "total_iterations": "auto"
             },
             "database": {
                 "host": "x",
@@ -61,6 +95,73 @@ def load_config():
                 "key": "x",
                 "wait_seconds": 30
             },
+            "lock_wait": {
+                "keyspace_notify": True,
+                "configure_keyspace_events": False,
+                "release_channel": "",
+                "min_poll_seconds": 0.2,
+                "max_poll_seconds": 5,
+                "max_wait_seconds": 3600,
+                "appear_timeout_seconds": 30,
+                "stale_policy": "alert",
+                "max_retriggers": 3,
+                "alert_webhook": ""
+            },
+            "adaptive_step": {
+                "enabled": True,
+                "target_seconds": 120,
+                "min_step": 1000,
+                "max_step": 1000000,
+                "additive_increase": 5000,
+                "decrease_factor": 0.5
+            },
+            "boundary_search": {
+                "enabled": True,
+                "sample_points": 16,
+                "max_disorder_seconds": 86400
+            },
+            "checkpoint": {
+                "file": "archive-checkpoint.json",
+                "reconnect_max_retries": 10,
+                "reconnect_backoff_seconds": 1,
+                "reconnect_max_backoff_seconds": 60
+            },
+            "metrics": {
+                "enabled": False,
+                "addr": "0.0.0.0",
+                "port": 9108
+            },
+            "run_history": {
+                "enabled": True,
+                "file": "archive-history.db",
+                "relative_accuracy": 0.01
+            },
+            "load_guard": {
+                "enabled": True,
+                "max_threads_running": 50,
+                "max_replica_lag_seconds": 30,
+                "max_history_list_length": 1000000,
+                "slowdown_ratio": 0.7,
+                "max_slowdown_seconds": 30,
+                "resume_ratio": 0.8,
+                "check_interval_seconds": 10,
+                "max_pause_seconds": 0,
+                "replicas": []
+            },
+            "archive_engine": {
+                "enabled": False,
+                "table_template": "{table}_archive",
+                "create_tables": False,
+                "chunk_size": 1000,
+                "chunk_sleep_seconds": 0.1,
+                "parallelism": 2,
+                "lock_ttl_seconds": 300
+            },
+            "schedule": {
+                "enabled": False,
+                "windows": []
+            },
+            "targets_concurrency": 4,
             "thread_pool": {
                 "max_workers": 5
             },
@@ -82,65 +183,367 @@ config = load_config()
 # 从配置文件加载配置值
 ARCHIVE_INCREMENT_VALUE = config['archive_config']['increment_value']
 DEFAULT_MIN_ID_VALUE = config['archive_config']['default_min_id_value']
-total_iterations = config['archive_config']['total_iterations']
-
-# 请务必修改以下数据库连接参数为您实际的数据库信息
-DB_CONFIG = {
-    'host': config['database']['host'],
-    'port': config['database']['port'],
-    'user': config['database']['user'],
-    'password': config['database']['password'],
-    'database': config['database']['database'],
-    'charset': config['database']['charset']
-}
-
-# 请务必修改以下 Redis 连接参数为您实际的 Redis 信息
-REDIS_CONFIG = {
-    'host': config['redis']['host'],
-    'port': config['redis']['port'],
-    'password': config['redis']['password'],
-    'db': config['redis']['db'],
-    'decode_responses': config['redis']['decode_responses']
-}
-
-API_URL = config['api']['url']
-LOCK_KEY = config['lock']['key']  # Redis 中的锁键名
-WAIT_SECONDS_FOR_LOCK_CHECK = config['lock']['wait_seconds']  # 检查 Redis 锁时，每次轮询的间隔时间
-
-# 创建全局会话对象，启用连接池和长连接
-session = requests.Session()
-
-# 配置重试策略
-retry_strategy = Retry(
-    total=config['retry_policy']['total'],
-    backoff_factor=config['retry_policy']['backoff_factor'],
-    status_forcelist=config['retry_policy']['status_forcelist'],
-)
-
-# 配置适配器，应用重试策略
-adapter = HTTPAdapter(
-    pool_connections=config['connection_pool']['pool_connections'],  # 连接池的连接数
-    pool_maxsize=config['connection_pool']['pool_maxsize'],      # 最大连接数
-    max_retries=retry_strategy
-)
-
-# 为HTTP和HTTPS请求挂载适配器
-session.mount("http://", adapter)
-session.mount("https://", adapter)
+total_iterations = config['archive_config']['total_iterations']  # 迭代次数，为 auto 时按积压估算并一直运行到追平
+
+# 多租户：targets 中每一项是一个独立的归档目标（数据库、Redis 锁、归档接口），未配置时使用顶层配置作为唯一目标
+TARGETS_CONCURRENCY = config.get('targets_concurrency', 4)  # 同时运行的归档目标数上限，保护共享的基础设施
+
+# 锁释放检测：优先使用 keyspace 通知或发布订阅通道，轮询只作为兜底
+LOCK_WAIT_CONFIG = config.get('lock_wait', {})
+LOCK_KEYSPACE_NOTIFY = LOCK_WAIT_CONFIG.get('keyspace_notify', True)  # 是否订阅锁键的 del/expired 事件
+# 服务端未开启 keyspace 通知时是否用 CONFIG SET 开启（修改的是整个 Redis 实例的配置，影响其他使用者，默认只读取不修改）
+LOCK_CONFIGURE_KEYSPACE_EVENTS = LOCK_WAIT_CONFIG.get('configure_keyspace_events', False)
+LOCK_RELEASE_CHANNEL = LOCK_WAIT_CONFIG.get('release_channel') or None  # 归档服务释放锁时发布消息的通道（可选）
+LOCK_MIN_POLL_SECONDS = LOCK_WAIT_CONFIG.get('min_poll_seconds', 0.2)  # 兜底轮询的初始间隔
+LOCK_MAX_POLL_SECONDS = LOCK_WAIT_CONFIG.get('max_poll_seconds', 5)  # 兜底轮询的最大间隔
+LOCK_MAX_WAIT_SECONDS = LOCK_WAIT_CONFIG.get('max_wait_seconds', 3600)  # 等待锁释放的最长时间，0 表示不限
+LOCK_APPEAR_TIMEOUT_SECONDS = LOCK_WAIT_CONFIG.get('appear_timeout_seconds', 30)  # 请求接口后锁未出现即视为触发丢失，0 表示不检查
+LOCK_STALE_POLICY = LOCK_WAIT_CONFIG.get('stale_policy', 'alert')  # 锁卡住或触发丢失时的处理：retrigger / alert / skip
+LOCK_MAX_RETRIGGERS = LOCK_WAIT_CONFIG.get('max_retriggers', 3)  # 每次迭代最多重新触发的次数，超过后按 alert 处理
+LOCK_ALERT_WEBHOOK = LOCK_WAIT_CONFIG.get('alert_webhook') or None  # 告警时 POST JSON 的地址（可选）
+
+# 全局会话对象（启用连接池和长连接），首次请求接口时才创建
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """返回全局会话对象，首次调用时导入 requests 并配置重试策略和连接池"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            return _session
+        from requests.adapters import HTTPAdapter
+        try:
+            from urllib3.util.retry import Retry
+        except ImportError:
+            from requests.packages.urllib3.util.retry import Retry
+
+        session = requests.Session()
+
+        # 配置重试策略
+        retry_strategy = Retry(
+            total=config['retry_policy']['total'],
+            backoff_factor=config['retry_policy']['backoff_factor'],
+            status_forcelist=config['retry_policy']['status_forcelist'],
+        )
+
+        # 配置适配器，应用重试策略
+        adapter = HTTPAdapter(
+            pool_connections=config['connection_pool']['pool_connections'],  # 连接池的连接数
+            pool_maxsize=config['connection_pool']['pool_maxsize'],      # 最大连接数
+            max_retries=retry_strategy
+        )
+
+        # 为HTTP和HTTPS请求挂载适配器
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+        return _session
 
 # 线程池大小配置
 MAX_WORKERS = config['thread_pool']['max_workers']  # 最大并发线程数
 
+# 自适应步长配置：按上一轮的归档耗时和窗口大小调整每个表的 id 步长（AIMD）
+ADAPTIVE_STEP_CONFIG = config.get('adaptive_step', {})
+ADAPTIVE_STEP_ENABLED = ADAPTIVE_STEP_CONFIG.get('enabled', True)
+ADAPTIVE_TARGET_SECONDS = ADAPTIVE_STEP_CONFIG.get('target_seconds', 120)  # 每次迭代的目标归档耗时
+ADAPTIVE_MIN_STEP = ADAPTIVE_STEP_CONFIG.get('min_step', 1000)  # 步长下限
+ADAPTIVE_MAX_STEP = ADAPTIVE_STEP_CONFIG.get('max_step', 1000000)  # 步长上限
+ADAPTIVE_ADDITIVE_INCREASE = ADAPTIVE_STEP_CONFIG.get('additive_increase', 5000)  # 未超时时的加性增量
+ADAPTIVE_DECREASE_FACTOR = ADAPTIVE_STEP_CONFIG.get('decrease_factor', 0.5)  # 超时时的乘性减小系数
+
+# 初始边界查找：利用自增 id 与 created 的相关性，沿主键二分查找，避免无复合索引时的全表扫描
+BOUNDARY_SEARCH_CONFIG = config.get('boundary_search', {})
+BOUNDARY_SEARCH_ENABLED = BOUNDARY_SEARCH_CONFIG.get('enabled', True)
+BOUNDARY_SAMPLE_POINTS = BOUNDARY_SEARCH_CONFIG.get('sample_points', 16)  # 相关性检查的采样点数
+BOUNDARY_MAX_DISORDER_SECONDS = BOUNDARY_SEARCH_CONFIG.get('max_disorder_seconds', 86400)  # 允许 created 相对 id 乱序的最大秒数
+
+# 断点续跑与断线重连：每次提交后记录迭代数和各表边界，连接断开时按指数退避重连
+CHECKPOINT_CONFIG = config.get('checkpoint', {})
+CHECKPOINT_FILE = CHECKPOINT_CONFIG.get('file', 'archive-checkpoint.json')  # 断点文件路径，多个目标时按目标名区分
+RECONNECT_MAX_RETRIES = CHECKPOINT_CONFIG.get('reconnect_max_retries', 10)  # 单次断线的最大重连次数，0 表示不限
+RECONNECT_BACKOFF_SECONDS = CHECKPOINT_CONFIG.get('reconnect_backoff_seconds', 1)  # 首次重连前的等待时间
+RECONNECT_MAX_BACKOFF_SECONDS = CHECKPOINT_CONFIG.get('reconnect_max_backoff_seconds', 60)  # 重连等待时间上限
+
+# Prometheus 指标：启用后在指定端口提供 /metrics，供 Grafana 监控归档是否停滞或变慢
+METRICS_CONFIG = config.get('metrics', {})
+METRICS_ENABLED = METRICS_CONFIG.get('enabled', False)
+METRICS_ADDR = METRICS_CONFIG.get('addr', '0.0.0.0')  # 监听地址
+METRICS_PORT = METRICS_CONFIG.get('port', 9108)  # 监听端口
+
+# 运行历史：每次迭代的耗时、步长和归档行数（进程内归档时）追加写入本地 SQLite，统计量以分位数草图保存
+RUN_HISTORY_CONFIG = config.get('run_history', {})
+RUN_HISTORY_ENABLED = RUN_HISTORY_CONFIG.get('enabled', True)
+RUN_HISTORY_FILE = RUN_HISTORY_CONFIG.get('file', 'archive-history.db')  # 运行历史文件路径
+RUN_HISTORY_RELATIVE_ACCURACY = RUN_HISTORY_CONFIG.get('relative_accuracy', 0.01)  # 分位数的相对误差
+
+# 数据库负载保护配置（各阈值为 0 时不检查对应指标）
+LOAD_GUARD_CONFIG = config.get('load_guard', {})
+LOAD_GUARD_ENABLED = LOAD_GUARD_CONFIG.get('enabled', True)
+LOAD_GUARD_MAX_THREADS_RUNNING = LOAD_GUARD_CONFIG.get('max_threads_running', 50)  # 主库 Threads_running 上限
+LOAD_GUARD_MAX_REPLICA_LAG_SECONDS = LOAD_GUARD_CONFIG.get('max_replica_lag_seconds', 30)  # 副本延迟上限（秒）
+LOAD_GUARD_MAX_HISTORY_LIST_LENGTH = LOAD_GUARD_CONFIG.get('max_history_list_length', 1000000)  # InnoDB history list length 上限
+LOAD_GUARD_SLOWDOWN_RATIO = LOAD_GUARD_CONFIG.get('slowdown_ratio', 0.7)  # 负载达到阈值的该比例时开始放慢
+LOAD_GUARD_MAX_SLOWDOWN_SECONDS = LOAD_GUARD_CONFIG.get('max_slowdown_seconds', 30)  # 放慢时每次迭代前的最大延迟
+LOAD_GUARD_RESUME_RATIO = LOAD_GUARD_CONFIG.get('resume_ratio', 0.8)  # 暂停后负载回落到阈值的该比例以下才恢复
+LOAD_GUARD_CHECK_INTERVAL_SECONDS = LOAD_GUARD_CONFIG.get('check_interval_seconds', 10)  # 暂停期间的采样间隔
+LOAD_GUARD_MAX_PAUSE_SECONDS = LOAD_GUARD_CONFIG.get('max_pause_seconds', 0)  # 单次暂停的最长时间，0 表示一直等到负载回落
+
+# 进程内归档引擎配置：启用后不再请求归档接口，由驱动按主键分块复制并删除
+ARCHIVE_ENGINE_CONFIG = config.get('archive_engine', {})
+ARCHIVE_ENGINE_ENABLED = ARCHIVE_ENGINE_CONFIG.get('enabled', False)
+ARCHIVE_ENGINE_TABLE_TEMPLATE = ARCHIVE_ENGINE_CONFIG.get('table_template', '{table}_archive')  # 归档表名模板
+ARCHIVE_ENGINE_CREATE_TABLES = ARCHIVE_ENGINE_CONFIG.get('create_tables', False)  # 归档表不存在时按原表结构创建
+ARCHIVE_ENGINE_CHUNK_SIZE = ARCHIVE_ENGINE_CONFIG.get('chunk_size', 1000)  # 每个事务归档的行数
+ARCHIVE_ENGINE_CHUNK_SLEEP_SECONDS = ARCHIVE_ENGINE_CONFIG.get('chunk_sleep_seconds', 0.1)  # 两块之间的休眠时间
+ARCHIVE_ENGINE_PARALLELISM = ARCHIVE_ENGINE_CONFIG.get('parallelism', 2)  # 同时归档的表数
+# 进程内归档期间持有的归档锁（与外部归档任务同一个锁键）的过期时间，每块提交后续期
+ARCHIVE_ENGINE_LOCK_TTL_SECONDS = ARCHIVE_ENGINE_CONFIG.get('lock_ttl_seconds', 300)
+
+# 归档时间窗口配置：只在窗口内推进边界，窗口外写入断点后休眠到下一个窗口
+SCHEDULE_CONFIG = config.get('schedule', {})
+SCHEDULE_ENABLED = SCHEDULE_CONFIG.get('enabled', False)
+SCHEDULE_WINDOWS = SCHEDULE_CONFIG.get('windows') or []  # [{days, start, end, step}]
+
+# 日志配置：日志通过后台线程写出，可选 JSON Lines（每行一个事件，带 target/table/iteration/phase/duration 字段）
+LOGGING_CONFIG = config.get('logging', {})
+LOG_LEVEL = LOGGING_CONFIG.get('level', 'INFO')
+LOG_FORMAT = LOGGING_CONFIG.get('format', 'text')  # text / json
+LOG_QUEUE = LOGGING_CONFIG.get('queue', True)  # 为 false 时在调用线程中同步写出
+LOG_FILE = LOGGING_CONFIG.get('file') or None  # 同时写入的日志文件（可选）
+LOG_DEBUG_QUERIES = LOGGING_CONFIG.get('debug_queries', True)  # 为 false 时完全跳过仅用于日志的调试查询拼接和诊断查询
+
+LOG_HANDLE = setup_logging(LOG_LEVEL, LOG_FORMAT == 'json', LOG_QUEUE, LOG_FILE)
+
 # --- 配置加载完成 ---
 
 
+# 迭代耗时、锁等待时间的直方图分桶（秒），归档一次通常在数秒到数十分钟之间
+LONG_DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, float('inf'))
+
+
+# 各目标共用的指标族，按 target 标签区分；首次创建 ArchiveMetrics 时注册
+_metric_families = {}
+
+
+def _register_metric_families():
+    if _metric_families:
+        return _metric_families
+    prometheus_client = load_prometheus_client()
+    _metric_families.update({
+        'iterations': prometheus_client.Counter(
+            'wms_archive_iterations_total', '已完成的归档迭代次数', ['target']),
+        'iteration_duration': prometheus_client.Histogram(
+            'wms_archive_iteration_duration_seconds', '单次归档迭代耗时（提交边界到归档完成）', ['target'],
+            buckets=LONG_DURATION_BUCKETS),
+        'lock_wait': prometheus_client.Histogram(
+            'wms_archive_lock_wait_seconds', '等待 Redis 归档锁释放的时间', ['target'], buckets=LONG_DURATION_BUCKETS),
+        'api_latency': prometheus_client.Histogram(
+            'wms_archive_api_latency_seconds', '归档接口请求耗时', ['target', 'outcome']),
+        'db_latency': prometheus_client.Histogram(
+            'wms_archive_db_statement_seconds', '数据库语句耗时', ['target', 'statement']),
+        'boundary': prometheus_client.Gauge(
+            'wms_archive_boundary', '表当前已提交的 id < X 边界值', ['target', 'table']),
+        'backlog': prometheus_client.Gauge(
+            'wms_archive_backlog_ids', '表剩余待归档的 id 跨度（可归档上界 + 1 - 当前边界）', ['target', 'table']),
+        'last_iteration': prometheus_client.Gauge(
+            'wms_archive_last_iteration_timestamp_seconds', '最近一次完成迭代的时间戳，用于检测停滞', ['target']),
+        'throttled': prometheus_client.Counter(
+            'wms_archive_throttled_seconds_total', '因数据库负载放慢或暂停的累计时间', ['target', 'mode']),
+        'db_load': prometheus_client.Gauge(
+            'wms_archive_db_load', '最近一次采样的数据库负载指标', ['target', 'signal']),
+        'lock_incidents': prometheus_client.Counter(
+            'wms_archive_lock_incidents_total', '归档锁卡住或触发丢失的次数', ['target', 'event', 'action']),
+        'backlog_rows': prometheus_client.Gauge(
+            'wms_archive_backlog_rows', '表剩余待归档行数（按优化器估算折算）', ['target', 'table']),
+        'eta': prometheus_client.Gauge(
+            'wms_archive_eta_seconds', '按实测推进速度估算的剩余归档时间', ['target']),
+    })
+    return _metric_families
+
+
+class ArchiveMetrics:
+    """
+    单个归档目标的 Prometheus 指标（以 target 标签区分）；未启用或未安装 prometheus_client 时所有记录方法均为空操作
+    """
+
+    def __init__(self, enabled, target='default'):
+        self.enabled = enabled and load_prometheus_client() is not None
+        self.target = target
+        if not self.enabled:
+            return
+        families = _register_metric_families()
+        self.iterations = families['iterations'].labels(target=target)
+        self.iteration_duration = families['iteration_duration'].labels(target=target)
+        self.lock_wait = families['lock_wait'].labels(target=target)
+        self.api_latency = families['api_latency']
+        self.db_latency = families['db_latency']
+        self.boundary = families['boundary']
+        self.backlog = families['backlog']
+        self.last_iteration = families['last_iteration'].labels(target=target)
+        self.throttled = families['throttled']
+        self.db_load = families['db_load']
+        self.backlog_rows = families['backlog_rows']
+        self.lock_incidents = families['lock_incidents']
+        self.eta = families['eta'].labels(target=target)
+
+    def observe_iteration(self, seconds):
+        if self.enabled:
+            self.iterations.inc()
+            self.iteration_duration.observe(seconds)
+            self.last_iteration.set_to_current_time()
+
+    def observe_lock_wait(self, seconds):
+        if self.enabled:
+            self.lock_wait.observe(seconds)
+
+    def observe_api(self, seconds, outcome):
+        if self.enabled:
+            self.api_latency.labels(target=self.target, outcome=outcome).observe(seconds)
+
+    def observe_lock_incident(self, event, action):
+        if self.enabled:
+            self.lock_incidents.labels(target=self.target, event=event, action=action).inc()
+
+    def observe_throttle(self, seconds, mode):
+        if self.enabled:
+            self.throttled.labels(target=self.target, mode=mode).inc(seconds)
+
+    def set_db_load(self, samples):
+        if self.enabled:
+            for signal, value in samples.items():
+                if value is not None:
+                    self.db_load.labels(target=self.target, signal=signal).set(value)
+
+    def set_estimate(self, table_records, remaining, eta_seconds):
+        """更新各表剩余估算行数和预计剩余时间"""
+        if not self.enabled:
+            return
+        for header_id, table_name, _ in table_records:
+            rows = remaining.get(header_id, (0, 0))[1]
+            if rows is not None:
+                self.backlog_rows.labels(target=self.target, table=table_name).set(rows)
+        if eta_seconds is not None:
+            self.eta.set(eta_seconds)
+
+    @contextmanager
+    def time_db(self, statement):
+        """统计一段数据库操作的耗时，statement 为语句类别"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.db_latency.labels(target=self.target, statement=statement).observe(time.time() - start)
+
+    def set_progress(self, table_records, boundaries, upper_bounds):
+        """更新各表的边界位置和剩余待归档的 id 跨度"""
+        if not self.enabled:
+            return
+        for header_id, table_name, _ in table_records:
+            if header_id not in boundaries:
+                continue
+            self.boundary.labels(target=self.target, table=table_name).set(boundaries[header_id])
+            upper_bound = upper_bounds.get(header_id)
+            remaining = upper_bound + 1 - boundaries[header_id] if upper_bound is not None else 0
+            self.backlog.labels(target=self.target, table=table_name).set(max(remaining, 0))
+
+
+def start_metrics_server(addr=METRICS_ADDR, port=METRICS_PORT):
+    """启动 Prometheus 指标服务（所有目标共用一个端口）"""
+    if not METRICS_ENABLED:
+        return
+    prometheus_client = load_prometheus_client()
+    if prometheus_client is None:
+        logger.warning("⚠️  已启用 metrics，但未安装 prometheus_client（pip install prometheus-client），指标不会输出")
+        return
+    prometheus_client.start_http_server(port, addr=addr)
+    logger.info("📈 Prometheus 指标已启动: http://%s:%s/metrics", addr, port)
+
+
+class ArchiveTarget:
+    """
+    一个 WMS 租户的归档目标：独立的数据库、Redis 归档锁、归档接口、断点文件和指标
+    """
+
+    def __init__(self, name, target_config):
+        self.name = name
+        # 请务必修改以下数据库连接参数为您实际的数据库信息
+        self.db_config = {
+            'host': target_config['database']['host'],
+            'port': target_config['database']['port'],
+            'user': target_config['database']['user'],
+            'password': target_config['database']['password'],
+            'database': target_config['database']['database'],
+            'charset': target_config['database']['charset']
+        }
+        # 请务必修改以下 Redis 连接参数为您实际的 Redis 信息
+        self.redis_config = {
+            'host': target_config['redis']['host'],
+            'port': target_config['redis']['port'],
+            'password': target_config['redis']['password'],
+            'db': target_config['redis']['db'],
+            'decode_responses': target_config['redis']['decode_responses']
+        }
+        self.api_url = target_config['api']['url']
+        self.lock_key = target_config['lock']['key']  # Redis 中的锁键名
+        self.lock_wait_seconds = target_config['lock']['wait_seconds']  # 等待锁释放时输出进度日志的间隔时间
+        # 负载保护检查延迟的副本：每项只需填写与 database 不同的连接参数（通常只有 host/port）
+        self.replica_configs = [{**self.db_config, **replica}
+                                for replica in target_config.get('load_guard', {}).get('replicas') or []]
+        if name == 'default':
+            self.checkpoint_file = CHECKPOINT_FILE
+        else:
+            root, ext = os.path.splitext(CHECKPOINT_FILE)
+            self.checkpoint_file = f"{root}.{name}{ext}"
+        self.metrics = ArchiveMetrics(METRICS_ENABLED, name)
+
+
+# targets 中每一项可覆盖的配置段；其余配置（步长、时间窗口、归档引擎、迭代次数等）对所有目标相同，出现时拒绝启动
+TARGET_OVERRIDE_KEYS = ('name', 'database', 'redis', 'api', 'lock', 'load_guard')
+TARGET_LOAD_GUARD_KEYS = ('replicas',)
+
+
+def load_targets():
+    """
+    按配置创建归档目标列表：targets 中每一项可只写与顶层不同的配置段（database/redis/api/lock 和 load_guard.replicas），
+    按键合并顶层配置；未配置 targets 时顶层配置即唯一目标 default。其他配置段不会按目标生效，出现时抛出 ValueError
+    """
+    target_configs = config.get('targets')
+    if not target_configs:
+        return [ArchiveTarget('default', config)]
+
+    for index, target_config in enumerate(target_configs):
+        unsupported = [key for key in target_config if key not in TARGET_OVERRIDE_KEYS]
+        unsupported += [f"load_guard.{key}" for key in target_config.get('load_guard') or {}
+                        if key not in TARGET_LOAD_GUARD_KEYS]
+        if unsupported:
+            raise ValueError(f"targets 第 {index + 1} 项包含不支持按目标覆盖的配置: {', '.join(unsupported)}；"
+                             f"只能覆盖 database、redis、api、lock 和 load_guard.replicas，其余配置请写在顶层")
+
+    targets = []
+    for index, target_config in enumerate(target_configs):
+        merged = {key: value for key, value in config.items() if key != 'targets'}
+        for key, value in target_config.items():
+            if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key] = {**merged[key], **value}
+            else:
+                merged[key] = value
+        targets.append(ArchiveTarget(target_config.get('name') or f"target-{index + 1}", merged))
+    names = [target.name for target in targets]
+    if len(set(names)) != len(names):
+        raise ValueError(f"targets 中存在重复的 name: {names}")
+    return targets
+
+
 def check_long_connection_support(url):
     """
     检查指定URL是否支持长连接
     """
     try:
         # 发送一个HEAD请求来检查Connection头部
-        response = session.head(url, timeout=10)
+        response = get_session().head(url, timeout=10)
         
         # 检查响应头部中是否支持长连接
         connection_header = response.headers.get('Connection', '').lower()
@@ -152,30 +555,937 @@ def check_long_connection_support(url):
         
         supports_keepalive = (is_http11 and not is_close) or connection_header == 'keep-alive'
         
-        logger.info(f"  🔍 长连接检查结果: 支持长连接={supports_keepalive}, Connection头部='{connection_header}', Keep-Alive='{keep_alive_header}'")
+        logger.info("  🔍 长连接检查结果: 支持长连接=%s, Connection头部='%s', Keep-Alive='%s'",
+                    supports_keepalive, connection_header, keep_alive_header)
         
         return supports_keepalive
     except Exception as e:
-        logger.error(f"  ❌ 检查长连接支持时发生错误: {e}")
+        logger.error("  ❌ 检查长连接支持时发生错误: %s", e)
         return False
 
-def initialize_and_update():
+class LockWaitTimeout(Exception):
+    """等待锁释放超过 max_wait_seconds"""
+
+    def __init__(self, waited):
+        super().__init__(f"等待锁释放超过 {waited:.0f} 秒")
+        self.waited = waited
+
+
+class LockStuckError(Exception):
+    """锁卡住且策略为 skip：结束本目标的运行，保留断点"""
+
+
+# 只有锁的值仍是观察到的持有者时才删除，避免误删刚被重新获取的锁
+COMPARE_AND_DELETE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# 只有锁的值仍是自己时才续期
+COMPARE_AND_EXPIRE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class LockWatcher:
+    """
+    等待 Redis 归档锁释放：订阅锁键的 keyspace 事件（del/expired）和可选的释放通道，
+    锁一释放立即返回；收不到通知时以自适应间隔（由短到长）轮询兜底
+    """
+
+    def __init__(self, redis_client, lock_key, db=0, keyspace_notify=True, release_channel=None,
+                 min_poll_seconds=0.2, max_poll_seconds=5, log_interval=30, configure_keyspace_events=False):
+        self.redis_client = redis_client
+        self.lock_key = lock_key
+        self.log_interval = log_interval
+        self.min_poll_seconds = min_poll_seconds
+        self.max_poll_seconds = max(max_poll_seconds, min_poll_seconds)
+        self.pubsub = None
+        self.configure_keyspace_events = configure_keyspace_events
+
+        channels = []
+        if keyspace_notify and self._keyspace_notifications_enabled():
+            channels.append(f"__keyspace@{db}__:{lock_key}")
+        if release_channel:
+            channels.append(release_channel)
+        if channels:
+            try:
+                self.pubsub = redis_client.pubsub()
+                self.pubsub.subscribe(*channels)
+                logger.info("  🔔 已订阅锁释放通知: %s", ', '.join(channels))
+            except redis.RedisError as e:
+                logger.warning("  ⚠️  订阅锁释放通知失败，退化为轮询: %s", e)
+                self.pubsub = None
+        else:
+            logger.warning("  ⚠️  未启用锁释放通知，使用自适应轮询")
+
+    def _keyspace_notifications_enabled(self):
+        """
+        用 CONFIG GET 检查服务端是否开启了通用命令(g)和过期(x)的 keyspace 通知，未开启时返回 False（使用轮询）；
+        只有 configure_keyspace_events 为 True 时才用 CONFIG SET 开启。托管 Redis 禁用 CONFIG 命令时无法确认，
+        仍然订阅（通知可能已在控制台开启），收不到通知时由轮询兜底
+        """
+        try:
+            current = self.redis_client.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+        except redis.RedisError as e:
+            logger.warning("  ⚠️  无法读取 notify-keyspace-events（可能禁用了 CONFIG 命令）: %s，"
+                           "仍订阅 keyspace 通知，收不到时由轮询兜底", e)
+            return True
+        if 'K' in current and ('A' in current or ('g' in current and 'x' in current)):
+            return True
+        if not self.configure_keyspace_events:
+            logger.warning("  ⚠️  Redis 未开启锁键所需的 keyspace 通知（notify-keyspace-events=%r，需要 K 以及 g、x 或 A），"
+                           "使用轮询；可在服务端开启，或设置 lock_wait.configure_keyspace_events 允许自动开启", current)
+            return False
+        wanted = ''.join(sorted(set(current) | {'K', 'g', 'x'}))
+        try:
+            self.redis_client.config_set('notify-keyspace-events', wanted)
+        except redis.RedisError as e:
+            logger.warning("  ⚠️  无法开启 Redis keyspace 通知: %s，使用轮询", e)
+            return False
+        logger.info("  🔧 已开启 Redis keyspace 通知: notify-keyspace-events=%s", wanted)
+        return True
+
+    def _wait_for_event(self, timeout):
+        """阻塞等待订阅消息，最多 timeout 秒；收到任意消息返回 True"""
+        if not self.pubsub:
+            time.sleep(timeout)
+            return False
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message:
+                return True
+
+    def wait_released(self, log_progress=True, max_wait=None):
+        """
+        阻塞直到锁键不存在，返回等待的秒数；等待超过 max_wait 秒时抛出 LockWaitTimeout
+        每次被通知唤醒或轮询超时后都会重新检查锁键，避免锁被重新获取时误判
+        """
+        start_time = time.time()
+        poll_interval = self.min_poll_seconds
+        next_log_time = start_time + self.log_interval
+
+        while self.redis_client.exists(self.lock_key):
+            waited = time.time() - start_time
+            if max_wait and waited >= max_wait:
+                raise LockWaitTimeout(waited)
+            if max_wait:
+                poll_interval = min(poll_interval, max(max_wait - waited, self.min_poll_seconds))
+            notified = self._wait_for_event(poll_interval)
+            # 收到通知后恢复最短间隔，否则逐步拉长兜底轮询间隔
+            poll_interval = self.min_poll_seconds if notified else min(poll_interval * 2, self.max_poll_seconds)
+            if log_progress and time.time() >= next_log_time:
+                logger.info("    锁 %s 存在，归档任务仍在执行中。已等待 %ss", self.lock_key, int(time.time() - start_time))
+                next_log_time = time.time() + self.log_interval
+
+        # 丢弃等待期间积压的通知，避免下一次等待被旧消息提前唤醒
+        if self.pubsub:
+            while self.pubsub.get_message(ignore_subscribe_messages=True, timeout=0):
+                pass
+        return time.time() - start_time
+
+    def wait_appeared(self, timeout):
+        """
+        请求接口后确认归档任务已经持有锁：锁键出现，或期间收到过该锁的通知（任务很快完成、锁已释放），
+        timeout 秒内都没有则返回 False，视为触发丢失
+        """
+        deadline = time.time() + timeout
+        while True:
+            if self.redis_client.exists(self.lock_key):
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            if self._wait_for_event(min(self.min_poll_seconds, remaining)):
+                return True
+
+    def inspect(self):
+        """返回锁的 (剩余 TTL 秒数, 持有者)：TTL 为 -1 表示没有过期时间，-2 表示锁不存在；持有者为锁键的值"""
+        ttl = self.redis_client.ttl(self.lock_key)
+        try:
+            owner = self.redis_client.get(self.lock_key)
+        except redis.ResponseError:
+            # 锁键不是字符串类型时无法读取值
+            owner = None
+        return ttl, owner
+
+    def acquire(self, owner, ttl):
+        """锁不存在时以 owner 获取锁（ttl 秒后过期），返回是否获取成功"""
+        return bool(self.redis_client.set(self.lock_key, owner, nx=True, ex=ttl))
+
+    def refresh(self, owner, ttl):
+        """锁的值仍为 owner 时把过期时间延长为 ttl 秒，返回是否仍持有锁"""
+        return bool(self.redis_client.eval(COMPARE_AND_EXPIRE_SCRIPT, 1, self.lock_key, owner, ttl))
+
+    def delete_if_owner(self, owner):
+        """锁的值仍为 owner 时删除，返回是否删除"""
+        if owner is None:
+            return False
+        return bool(self.redis_client.eval(COMPARE_AND_DELETE_SCRIPT, 1, self.lock_key, owner))
+
+    def close(self):
+        if self.pubsub:
+            try:
+                self.pubsub.close()
+            except redis.RedisError:
+                pass
+            self.pubsub = None
+
+
+def create_lock_watcher(redis_client, target):
+    """按配置创建目标的锁释放等待器"""
+    return LockWatcher(
+        redis_client,
+        target.lock_key,
+        db=target.redis_config.get('db', 0),
+        keyspace_notify=LOCK_KEYSPACE_NOTIFY,
+        configure_keyspace_events=LOCK_CONFIGURE_KEYSPACE_EVENTS,
+        release_channel=LOCK_RELEASE_CHANNEL,
+        min_poll_seconds=LOCK_MIN_POLL_SECONDS,
+        max_poll_seconds=LOCK_MAX_POLL_SECONDS,
+        log_interval=target.lock_wait_seconds,
+    )
+
+
+@contextmanager
+def hold_archive_lock(target, lock_watcher):
+    """
+    进程内归档期间持有目标的归档锁（与外部归档任务使用同一个锁键），外部归档任务不会同时处理同一批表；
+    锁已被外部任务持有时先等待释放。返回续期函数，每块提交后调用，锁已不属于本进程时抛出异常中止该表
+    """
+    owner = f"archive-engine-{uuid.uuid4().hex}"
+    while not lock_watcher.acquire(owner, ARCHIVE_ENGINE_LOCK_TTL_SECONDS):
+        logger.info("  🔒 锁 %s 被外部归档任务持有，等待释放后再进行进程内归档", target.lock_key)
+        wait_for_lock_release(target, lock_watcher)
+
+    def heartbeat():
+        if not lock_watcher.refresh(owner, ARCHIVE_ENGINE_LOCK_TTL_SECONDS):
+            raise RuntimeError(f"归档锁 {target.lock_key} 已不由本进程持有")
+
+    try:
+        yield heartbeat
+    finally:
+        lock_watcher.delete_if_owner(owner)
+
+
+def send_lock_alert(target, event, details):
+    """锁卡住或触发丢失时告警：输出错误日志，配置了 alert_webhook 时 POST JSON"""
+    logger.error("  🚨 [%s] %s", target.name, details)
+    if not LOCK_ALERT_WEBHOOK:
+        return
+    payload = {'target': target.name, 'lock_key': target.lock_key, 'event': event, 'details': details,
+               'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+    try:
+        get_session().post(LOCK_ALERT_WEBHOOK, json=payload, timeout=10)
+    except requests.exceptions.RequestException as e:
+        logger.warning("  ⚠️  发送告警失败: %s", e)
+
+
+def wait_for_lock_release(target, lock_watcher, log_progress=True):
+    """
+    等待归档锁释放，最多等待 max_wait_seconds；超时后检查锁的 TTL 和持有者，按 stale_policy 处理：
+    - retrigger：锁没有过期时间（持有者崩溃后不会自动释放）且持有者未变时删除该锁，返回后由调用方重新触发；
+      锁带有 TTL 时会自行过期，按 alert 处理
+    - alert：告警后继续等待，每隔 max_wait_seconds 再告警一次
+    - skip：抛出 LockStuckError，结束本目标的运行并保留断点
+    返回 (等待秒数, 是否删除了陈旧锁)
+    """
+    start_time = time.time()
+    while True:
+        try:
+            lock_watcher.wait_released(log_progress, max_wait=LOCK_MAX_WAIT_SECONDS)
+            return time.time() - start_time, False
+        except LockWaitTimeout:
+            ttl, owner = lock_watcher.inspect()
+            if ttl == -2:
+                # 检查期间锁刚好释放
+                return time.time() - start_time, False
+            waited = time.time() - start_time
+            details = (f"锁 {target.lock_key} 已持有 {waited:.0f} 秒未释放（TTL: {'无' if ttl == -1 else f'{ttl}秒'}，"
+                       f"持有者: {owner}）")
+            if LOCK_STALE_POLICY == 'skip':
+                target.metrics.observe_lock_incident('stuck', 'skip')
+                send_lock_alert(target, 'stuck', f"{details}，跳过本目标剩余的归档")
+                raise LockStuckError(details)
+            if LOCK_STALE_POLICY == 'retrigger' and ttl == -1 and lock_watcher.delete_if_owner(owner):
+                target.metrics.observe_lock_incident('stuck', 'retrigger')
+                logger.warning("  ♻️  %s，已删除陈旧锁，重新触发归档", details)
+                return waited, True
+            target.metrics.observe_lock_incident('stuck', 'alert')
+            send_lock_alert(target, 'stuck', f"{details}，继续等待")
+
+
+def load_id_boundaries(db_cursor, header_ids):
+    """
+    一次查询多个表头当前的 id < X 边界值，返回 {headerId: value}
+    """
+    if not header_ids:
+        return {}
+    placeholders = ', '.join(['%s'] * len(header_ids))
+    select_sql = (f"SELECT headerId, value FROM ttx_archive_rule_term "
+                  f"WHERE headerId IN ({placeholders}) AND field='id' AND operator='<';")
+    db_cursor.execute(select_sql, list(header_ids))
+    return {row[0]: int(row[1]) for row in db_cursor.fetchall()}
+
+
+def save_id_boundaries(db_cursor, boundaries, existing_header_ids, created_by='SYSTEM'):
+    """
+    批量写入 id < X 边界值：已有规则用一条 UPDATE ... CASE 更新，缺失的规则用一条多行 INSERT 插入
+    返回 (更新行数, 插入行数)
+    """
+    to_update = [(header_id, value) for header_id, value in boundaries.items() if header_id in existing_header_ids]
+    to_insert = [(header_id, value) for header_id, value in boundaries.items() if header_id not in existing_header_ids]
+    updated_rows = inserted_rows = 0
+
+    if to_update:
+        case_clause = ' '.join(['WHEN %s THEN %s'] * len(to_update))
+        placeholders = ', '.join(['%s'] * len(to_update))
+        update_sql = (f"UPDATE ttx_archive_rule_term SET `value` = CASE headerId {case_clause} END "
+                      f"WHERE headerId IN ({placeholders}) AND field='id' AND operator='<';")
+        params = [item for pair in to_update for item in pair] + [header_id for header_id, _ in to_update]
+        db_cursor.execute(update_sql, params)
+        updated_rows = db_cursor.rowcount
+
+    if to_insert:
+        values_clause = ', '.join(["(%s, 'id', '<', %s, NOW(), NOW(), %s, %s)"] * len(to_insert))
+        insert_sql = (f"INSERT INTO ttx_archive_rule_term "
+                      f"(headerId, field, operator, value, created, lastUpdated, createdBy, lastUpdatedBy) "
+                      f"VALUES {values_clause} "
+                      f"ON DUPLICATE KEY UPDATE value = VALUES(value), lastUpdated = NOW(), lastUpdatedBy = VALUES(lastUpdatedBy);")
+        params = [item for header_id, value in to_insert for item in (header_id, value, created_by, created_by)]
+        db_cursor.execute(insert_sql, params)
+        inserted_rows = len(to_insert)
+
+    return updated_rows, inserted_rows
+
+
+class AdaptiveStepController:
+    """
+    每个表独立的 id 步长控制器（AIMD）：
+    - 上一轮窗口内没有可归档的行：步长翻倍（慢启动），尽快越过稀疏区间
+    - 按窗口大小分摊的归档耗时未超出该表的时间预算：步长加性增加
+    - 超出时间预算：步长乘性减小，缩短归档任务持有锁的时间
+    """
+
+    def __init__(self, initial_step, min_step, max_step, additive_increase, decrease_factor, target_seconds):
+        self.initial_step = initial_step
+        self.min_step = min_step
+        self.max_step = max(max_step, min_step)
+        self.additive_increase = additive_increase
+        self.decrease_factor = decrease_factor
+        self.target_seconds = target_seconds
+        self.steps = {}
+        self.throughput = {}  # 表头ID -> 估算吞吐（窗口大小/秒）
+
+    def step(self, header_id):
+        return self.steps.get(header_id, self.initial_step)
+
+    def update(self, window_sizes, duration):
+        """
+        window_sizes: 表头ID -> 本轮窗口大小（进程内归档为实际归档的行数，归档接口为 id 跨度，不额外查询）；
+        duration: 本轮归档任务耗时（秒）。归档接口一次处理全部表，按各表窗口大小占比分摊耗时
+        """
+        if not window_sizes:
+            return
+        total_size = sum(window_sizes.values())
+        budget = self.target_seconds / len(window_sizes)
+
+        for header_id, size in window_sizes.items():
+            step = self.step(header_id)
+            if total_size > 0:
+                table_seconds = duration * size / total_size
+            else:
+                table_seconds = duration / len(window_sizes)
+            self.throughput[header_id] = size / table_seconds if table_seconds > 0 else 0.0
+
+            if size == 0:
+                new_step = step * 2
+            elif table_seconds > budget:
+                new_step = int(step * self.decrease_factor)
+            else:
+                new_step = step + self.additive_increase
+            self.steps[header_id] = max(self.min_step, min(self.max_step, new_step))
+
+
+def create_step_controller():
+    """按配置创建步长控制器，未启用时返回 None（固定步长）"""
+    if not ADAPTIVE_STEP_ENABLED:
+        return None
+    return AdaptiveStepController(
+        initial_step=ARCHIVE_INCREMENT_VALUE,
+        min_step=ADAPTIVE_MIN_STEP,
+        max_step=ADAPTIVE_MAX_STEP,
+        additive_increase=ADAPTIVE_ADDITIVE_INCREASE,
+        decrease_factor=ADAPTIVE_DECREASE_FACTOR,
+        target_seconds=ADAPTIVE_TARGET_SECONDS,
+    )
+
+
+WEEKDAY_NAMES = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+
+
+def _parse_clock(value):
+    """把 "HH:MM" 转换为当天的分钟数，允许 "24:00" 表示当天结束"""
+    hours, _, minutes = str(value).partition(':')
+    total = int(hours) * 60 + int(minutes or 0)
+    if not 0 <= total <= 24 * 60:
+        raise ValueError(f"无效的时间 {value}，应为 HH:MM")
+    return total
+
+
+def _parse_weekday(value):
+    """星期可写作 mon~sun 或 1~7（周一为 1）"""
+    if isinstance(value, int) and 1 <= value <= 7:
+        return value - 1
+    weekday = WEEKDAY_NAMES.get(str(value).strip().lower()[:3])
+    if weekday is None:
+        raise ValueError(f"无效的星期 {value}，应为 mon~sun 或 1~7")
+    return weekday
+
+
+class ArchiveWindow:
+    """一个归档时间窗口：从 days 中某天的 start 开始，end 不大于 start 时跨越午夜到次日 end 结束"""
+
+    def __init__(self, days, start, end, step=None):
+        self.days = {_parse_weekday(day) for day in days} if days else set(range(7))
+        self.start = _parse_clock(start)
+        self.end = _parse_clock(end)
+        self.step = int(step) if step else None
+
+    @property
+    def crosses_midnight(self):
+        return self.end <= self.start
+
+    def contains(self, now):
+        minute = now.hour * 60 + now.minute
+        if not self.crosses_midnight:
+            return now.weekday() in self.days and self.start <= minute < self.end
+        # 跨午夜的窗口：开始当天 start 之后，或开始次日 end 之前
+        return ((now.weekday() in self.days and minute >= self.start)
+                or ((now.weekday() - 1) % 7 in self.days and minute < self.end))
+
+    def describe(self):
+        days = ','.join(name for name, weekday in WEEKDAY_NAMES.items() if weekday in self.days)
+        step = f"，步长 {self.step}" if self.step else ''
+        return f"{days} {self.start // 60:02d}:{self.start % 60:02d}-{self.end // 60:02d}:{self.end % 60:02d}{step}"
+
+
+class ArchiveSchedule:
+    """按星期配置的归档时间窗口集合"""
+
+    def __init__(self, windows):
+        self.windows = [ArchiveWindow(window.get('days'), window['start'], window['end'], window.get('step'))
+                        for window in windows]
+        if not self.windows:
+            raise ValueError("schedule.enabled 为 true 时至少需要配置一个时间窗口")
+
+    def current_window(self, now=None):
+        """返回当前所在的窗口，不在任何窗口内时返回 None"""
+        now = now or datetime.now()
+        for window in self.windows:
+            if window.contains(now):
+                return window
+        return None
+
+    def next_window_start(self, now=None):
+        """返回下一个窗口的开始时间"""
+        now = now or datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        candidates = []
+        for offset in range(8):
+            day = midnight + timedelta(days=offset)
+            for window in self.windows:
+                start = day + timedelta(minutes=window.start)
+                if day.weekday() in window.days and start > now:
+                    candidates.append(start)
+        return min(candidates)
+
+
+def create_schedule():
+    """按配置创建归档时间窗口，未启用时返回 None（不限制时间）"""
+    if not SCHEDULE_ENABLED:
+        return None
+    schedule = ArchiveSchedule(SCHEDULE_WINDOWS)
+    logger.info("🕘 归档时间窗口: %s", '; '.join(window.describe() for window in schedule.windows))
+    return schedule
+
+
+def load_archive_conditions(db_cursor, header_id, archive_days_before):
+    """
+    查询表头对应的规则条件，构建归档 WHERE 条件（排除 field='id' 的规则，追加 created < 归档日期阈值）
+    返回 (规则列表, WHERE 条件列表, 参数列表)
+    """
+    rule_query = "SELECT field, operator, value FROM ttx_archive_rule_term WHERE headerId=%s;"
+    db_cursor.execute(rule_query, (header_id,))
+    rules = db_cursor.fetchall()
+
+    # 计算归档日期阈值，并将时分秒调整为 00:00:00
+    if archive_days_before is not None and archive_days_before > 0:
+        archive_date_raw = datetime.now() - timedelta(days=archive_days_before)
+        # 获取日期部分，并组合为当天的 00:00:00
+        archive_date_threshold = datetime.combine(archive_date_raw.date(), datetime.min.time())
+        logger.info("    归档日期阈值: %s", archive_date_threshold.strftime('%Y-%m-%d %H:%M:%S'))
+    else:
+        logger.info("    未设置归档天数，设置默认时间条件180天")
+        archive_date_raw_default = datetime.now() - timedelta(days=180)
+        # 获取日期部分，并组合为当天的 00:00:00
+        archive_date_threshold = datetime.combine(archive_date_raw_default.date(), datetime.min.time())
+
+    # 构建动态WHERE条件，排除field='id'的规则
+    where_conditions = []
+    params = []
+
+    for field, operator, value in rules:
+        if field.lower() != 'id':
+            # 添加到WHERE条件
+            where_conditions.append(f"`{field}` {operator} %s")
+            # 确保参数类型正确，移除可能存在的额外引号
+            if isinstance(value, str):
+                # 移除可能存在的首尾引号
+                cleaned_value = value.strip().strip("'").strip('"')
+                params.append(cleaned_value)
+            else:
+                params.append(value)
+
+    # 添加时间条件：created < archive_date_threshold
+    if archive_date_threshold is not None:
+        where_conditions.append("`created` < %s")
+        params.append(archive_date_threshold.strftime('%Y-%m-%d %H:%M:%S'))
+
+    return rules, where_conditions, params
+
+
+def build_min_id_query(table_name, where_conditions):
+    """查找初始边界时全表扫描方式使用的查询：满足归档条件的最小ID"""
+    if not where_conditions:
+        return f"SELECT MIN(id) as min_id FROM `{table_name}`"
+    return f"SELECT MIN(id) as min_id FROM `{table_name}` WHERE {' AND '.join(where_conditions)}"
+
+
+def build_upper_bound_query(table_name, where_conditions):
+    """计算可归档上界的查询：沿主键倒序查找第一条满足归档条件的记录"""
+    where_clause = f" WHERE {' AND '.join(where_conditions)}" if where_conditions else ""
+    return f"SELECT id FROM `{table_name}`{where_clause} ORDER BY id DESC LIMIT 1"
+
+
+def find_archivable_upper_bounds(db_cursor, table_records):
+    """
+    计算每个表满足归档条件的最大 id（可归档上界），沿主键倒序查找第一条满足条件的记录
+    返回 {headerId: 最大id或None}，None 表示没有可归档的数据
+    """
+    upper_bounds = {}
+    for header_id, table_name, archive_days_before in table_records:
+        _, where_conditions, params = load_archive_conditions(db_cursor, header_id, archive_days_before)
+        db_cursor.execute(build_upper_bound_query(table_name, where_conditions), params)
+        result = db_cursor.fetchone()
+        upper_bounds[header_id] = int(result[0]) if result and result[0] is not None else None
+        logger.info("  表 %s (ID: %s) 可归档的最大ID: %s", table_name, header_id, upper_bounds[header_id])
+    return upper_bounds
+
+
+def is_caught_up(header_id, boundaries, upper_bounds):
+    """表没有可归档数据，或 id < X 边界已越过可归档上界"""
+    upper_bound = upper_bounds.get(header_id)
+    if upper_bound is None:
+        return True
+    return header_id in boundaries and boundaries[header_id] > upper_bound
+
+
+def seek_next_ids(db_cursor, table_records, boundaries):
+    """
+    一次查询找出每个表从当前边界起的下一个存在的 id（主键索引定位），用于跳过空的 id 区间
+    返回 {headerId: 下一个id或None}
+    """
+    selects = []
+    params = []
+    for header_id, table_name, _ in table_records:
+        if header_id in boundaries:
+            selects.append(f"SELECT %s, (SELECT MIN(id) FROM `{table_name}` WHERE id >= %s)")
+            params.extend([header_id, boundaries[header_id]])
+    if not selects:
+        return {}
+    db_cursor.execute(" UNION ALL ".join(selects), params)
+    return {int(row[0]): (int(row[1]) if row[1] is not None else None) for row in db_cursor.fetchall()}
+
+
+def estimate_backlog(db_cursor, table_records, boundaries, upper_bounds):
+    """
+    估算每个表的剩余积压，不执行 COUNT：
+    id 跨度 = 可归档上界 + 1 - 当前边界；行数取优化器对该主键区间的估算（EXPLAIN 的 rows，基于索引下探）
+    返回 {headerId: (id跨度, 估算行数或None)}，已追平的表不包含在内
+    """
+    backlog = {}
+    for header_id, table_name, _ in table_records:
+        if is_caught_up(header_id, boundaries, upper_bounds):
+            continue
+        boundary = boundaries.get(header_id, DEFAULT_MIN_ID_VALUE)
+        span = max(upper_bounds[header_id] + 1 - boundary, 0)
+        rows = None
+        try:
+            db_cursor.execute(f"EXPLAIN SELECT id FROM `{table_name}` WHERE id >= %s AND id <= %s",
+                              (boundary, upper_bounds[header_id]))
+            columns = [column[0].lower() for column in db_cursor.description or []]
+            result = db_cursor.fetchone()
+            if result and 'rows' in columns and result[columns.index('rows')] is not None:
+                rows = int(result[columns.index('rows')])
+        except pymysql.Error as e:
+            if is_connection_lost(e):
+                raise
+            logger.warning("  ⚠️  无法估算表 %s 的行数: %s", table_name, e)
+        backlog[header_id] = (span, rows)
+    return backlog
+
+
+class BacklogEstimator:
+    """
+    积压和预计完成时间：启动时估算各表的 id 跨度和行数，之后按已推进的 id 跨度按比例折算剩余行数；
+    预计完成时间按本次运行实测的 id 推进速度计算，自适应步长变化和跳过的空区间都已包含在内
+    """
+
+    def __init__(self, backlog, boundaries):
+        self.initial = dict(backlog)
+        self.start_boundaries = {header_id: boundaries.get(header_id, DEFAULT_MIN_ID_VALUE) for header_id in backlog}
+
+    def remaining(self, boundaries, upper_bounds):
+        """返回 {headerId: (剩余id跨度, 剩余估算行数或None)}"""
+        remaining = {}
+        for header_id, (initial_span, initial_rows) in self.initial.items():
+            boundary = boundaries.get(header_id, self.start_boundaries[header_id])
+            span = max(upper_bounds[header_id] + 1 - boundary, 0)
+            rows = None
+            if initial_rows is not None:
+                rows = int(initial_rows * span / initial_span) if initial_span else 0
+            remaining[header_id] = (span, rows)
+        return remaining
+
+    @staticmethod
+    def iterations_needed(remaining, steps):
+        """按各表当前步长估算追平所需的迭代次数：各表每次迭代同时推进，取最大值；空区间会被跳过，因此是上限"""
+        return max((math.ceil(span / max(steps[header_id], 1)) for header_id, (span, _) in remaining.items()
+                    if span and header_id in steps), default=0)
+
+    def eta_seconds(self, remaining, boundaries, active_seconds):
+        """按实测的 id 推进速度估算剩余时间（秒），尚无推进时返回 None"""
+        if active_seconds <= 0:
+            return None
+        eta = 0.0
+        for header_id, (span, _) in remaining.items():
+            if not span:
+                continue
+            advanced = boundaries.get(header_id, self.start_boundaries[header_id]) - self.start_boundaries[header_id]
+            if advanced <= 0:
+                return None
+            eta = max(eta, span / (advanced / active_seconds))
+        return eta
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '未知'
+    if seconds < 60:
+        return f"{seconds:.0f}秒"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f}分钟"
+    return f"{seconds / 3600:.1f}小时"
+
+
+class ConnectionPool:
+    """
+    简单的 PyMySQL 连接池：按需创建连接，最多 max_size 个；借出前 ping 检查，断开的连接自动重连
+    """
+
+    def __init__(self, db_config, max_size=5):
+        self.db_config = db_config
+        self.max_size = max_size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                try:
+                    return pymysql.connect(**self.db_config)
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，用完自动归还；发生异常时回滚并丢弃该连接"""
+        connection = self._acquire()
+        try:
+            connection.ping(reconnect=True)
+            yield connection
+        except Exception:
+            try:
+                connection.rollback()
+                self._idle.put(connection)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            raise
+        else:
+            self._idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def read_session_counters(db_cursor):
+    """
+    读取当前会话的语句数和 Handler_read_* 计数，用于统计查找边界时执行的查询数和读取的行数
+    返回 (语句数, 读取行数)
+    """
+    db_cursor.execute("SHOW SESSION STATUS WHERE Variable_name = 'Questions' OR Variable_name LIKE 'Handler_read%'")
+    counters = {name: int(value) for name, value in db_cursor.fetchall()}
+    return counters.get('Questions', 0), sum(value for name, value in counters.items() if name.startswith('Handler_read'))
+
+
+def _row_at_or_after(db_cursor, table_name, id_value):
+    """主键点查：返回 id >= id_value 的第一行 (id, created)，不存在时返回 None"""
+    db_cursor.execute(f"SELECT id, created FROM `{table_name}` WHERE id >= %s ORDER BY id LIMIT 1", (id_value,))
+    return db_cursor.fetchone()
+
+
+def seek_initial_boundary(db_cursor, table_name, where_conditions, params):
+    """
+    利用自增 id 与 created 的相关性查找满足归档条件的最小ID，只使用主键点查和有界的主键范围查询：
+    1. 在主键范围内均匀采样检查 created 是否随 id 单调递增（允许 max_disorder_seconds 的乱序）
+    2. 二分查找 created < 阈值 + 乱序容忍 的最大 id，作为候选区间的上界
+    3. 在 [最小id, 上界] 内沿主键顺序查找第一条满足全部归档条件的记录
+    返回 (是否适用, 最小ID或None)；相关性检查不通过时返回 (False, None)，由调用方回退到全表扫描
+    """
+    # where_conditions 的最后一项固定为 created < 归档日期阈值
+    threshold = datetime.strptime(params[-1], '%Y-%m-%d %H:%M:%S')
+    search_limit = threshold + timedelta(seconds=BOUNDARY_MAX_DISORDER_SECONDS)
+
+    db_cursor.execute(f"SELECT MIN(id), MAX(id) FROM `{table_name}`")
+    min_id, max_id = db_cursor.fetchone()
+    if min_id is None:
+        return True, None
+    min_id, max_id = int(min_id), int(max_id)
+
+    # 相关性检查：采样点的 created 不能比前一个采样点早超过容忍范围
+    samples = []
+    points = max(BOUNDARY_SAMPLE_POINTS, 2)
+    for index in range(points):
+        row = _row_at_or_after(db_cursor, table_name, min_id + (max_id - min_id) * index // (points - 1))
+        if row and (not samples or row[0] != samples[-1][0]):
+            samples.append(row)
+    tolerance = timedelta(seconds=BOUNDARY_MAX_DISORDER_SECONDS)
+    for (_, previous_created), (_, created) in zip(samples, samples[1:]):
+        if not isinstance(previous_created, datetime) or not isinstance(created, datetime) \
+                or created < previous_created - tolerance:
+            logger.warning("  表 %s 的 id 与 created 不相关（采样 %s 个点），回退到全表扫描", table_name, len(samples))
+            return False, None
+
+    # 二分查找：f(v) = id >= v 的第一行 created < search_limit，随 v 单调不增，查找使 f 为真的最大 v
+    first_row = samples[0]
+    if not isinstance(first_row[1], datetime):
+        return False, None
+    if first_row[1] >= search_limit:
+        logger.info("  表 %s 最早的记录 (id=%s, created=%s) 晚于归档阈值，无需扫描", table_name, first_row[0], first_row[1])
+        return True, None
+    low, high = min_id, max_id
+    upper_row = first_row
+    while low <= high:
+        middle = (low + high) // 2
+        row = _row_at_or_after(db_cursor, table_name, middle)
+        if row is not None and isinstance(row[1], datetime) and row[1] < search_limit:
+            upper_row = row
+            low = int(row[0]) + 1
+        else:
+            high = middle - 1
+    upper_id = int(upper_row[0])
+    logger.info("  表 %s 按主键二分定位到候选上界 id=%s (created=%s)", table_name, upper_id, upper_row[1])
+
+    where_clause = " AND ".join(where_conditions)
+    db_cursor.execute(f"SELECT id FROM `{table_name}` WHERE id >= %s AND id <= %s AND {where_clause} ORDER BY id LIMIT 1",
+                      [min_id, upper_id] + list(params))
+    result = db_cursor.fetchone()
+    return True, (int(result[0]) if result else None)
+
+
+def find_initial_boundary(db_cursor, header_id, table_name, archive_days_before):
+    """
+    查询单个表满足归档条件的最小ID，作为 id < X 规则的初始边界
+    找不到有效ID时返回默认值 DEFAULT_MIN_ID_VALUE
+    """
+    # 查询该表头对应的规则条件，并构建归档条件（规则条件 + created < 归档日期阈值）
+    rules, where_conditions, params = load_archive_conditions(db_cursor, header_id, archive_days_before)
+
+    if not rules:
+        logger.warning(
+            "  表 %s (ID: %s) 没有找到任何规则条件，设置默认值%s", table_name, header_id, DEFAULT_MIN_ID_VALUE)
+        return DEFAULT_MIN_ID_VALUE
+
+    if BOUNDARY_SEARCH_ENABLED:
+        applicable, min_id = seek_initial_boundary(db_cursor, table_name, where_conditions, params)
+        if applicable:
+            if min_id is None:
+                logger.info("  表 %s 中没有满足条件的记录，设置默认值%s", table_name, DEFAULT_MIN_ID_VALUE)
+                return DEFAULT_MIN_ID_VALUE
+            logger.info("  表 %s 中满足条件的最小ID为: %s", table_name, min_id)
+            return min_id
+
+    # 构建查询：没有其他条件时直接查询最小ID
+    dynamic_query = build_min_id_query(table_name, where_conditions)
+    if not where_conditions:
+        params = []
+    else:
+        where_clause = " AND ".join(where_conditions)
+
+    logger.info("  执行查询: %s  参数: %s", dynamic_query, params)
+
+    if LOG_DEBUG_QUERIES:
+        # 尝试手动构建SQL查询用于调试（仅用于调试目的，不执行）
+        debug_query = dynamic_query
+        for param in params:
+            if isinstance(param, str):
+                debug_query = debug_query.replace('%s', f"'{param}'", 1)  # PyMySQL会自动处理引号
+            else:
+                debug_query = debug_query.replace('%s', str(param), 1)
+        logger.info("  调试用的实际查询: %s", debug_query)
+
+    db_cursor.execute(dynamic_query, params)
+    result = db_cursor.fetchone()
+
+    # 添加结果调试信息
+    logger.info("  查询结果: %s", result)
+    if result and LOG_DEBUG_QUERIES:
+        logger.info("  结果长度: %s, 第一个元素: %s", len(result), result[0] if len(result) > 0 else 'N/A')
+
+    if result and result[0] is not None:
+        min_id = int(result[0])
+        logger.info("  表 %s 中满足条件的最小ID为: %s", table_name, min_id)
+        return min_id
+    else:
+        # 在这种情况下，我们需要先检查是否有满足条件的记录存在
+        # 重新构建查询来检查是否存在满足条件的记录
+        if not where_conditions:
+            count_query = f"SELECT COUNT(*) as count FROM `{table_name}`"
+            count_params = []
+        else:
+            count_query = f"SELECT COUNT(*) as count FROM `{table_name}` WHERE {where_clause}"
+            count_params = params
+
+        logger.info("  检查是否存在满足条件的记录: %s  参数: %s", count_query, count_params)
+        db_cursor.execute(count_query, count_params)
+        count_result = db_cursor.fetchone()
+
+        if count_result and count_result[0] > 0:
+            logger.warning(
+                "  检测到存在满足条件的记录(%s条)，但MIN(id)为NULL，可能存在空值或特殊数据类型", count_result[0])
+
+            if LOG_DEBUG_QUERIES:
+                # 添加额外的调试查询来确认数据确实存在（结果只用于日志）
+                debug_where_clause = " AND ".join(where_conditions)
+                debug_query = f"SELECT id, created FROM `{table_name}` WHERE {debug_where_clause} LIMIT 5"
+                logger.info("  调试查询: %s  参数: %s", debug_query, params)
+                # 重新执行调试查询，确保参数处理正确
+                db_cursor.execute(debug_query, params)
+                debug_results = db_cursor.fetchall()
+                logger.info("  调试结果: %s", debug_results)
+
+                # 检查是否是数据类型问题
+                id_values_query = f"SELECT id FROM `{table_name}` WHERE {where_clause} AND id IS NOT NULL ORDER BY id ASC LIMIT 10"
+                logger.info("  ID值检查查询: %s  参数: %s", id_values_query, params)
+                db_cursor.execute(id_values_query, params)
+                id_results = db_cursor.fetchall()
+                logger.info("  ID值结果: %s", id_results)
+
+            # 尝试查询所有满足条件的ID并找最小值
+            all_ids_query = f"SELECT id FROM `{table_name}`"
+            if where_conditions:
+                all_ids_query += f" WHERE {where_clause}"
+            all_ids_query += " AND id IS NOT NULL ORDER BY id ASC LIMIT 1"
+
+            logger.info("  尝试查询非空ID的最小值: %s  参数: %s", all_ids_query, params)
+            db_cursor.execute(all_ids_query, params)
+            all_ids_result = db_cursor.fetchone()
+
+            if all_ids_result and all_ids_result[0] is not None:
+                min_id = int(all_ids_result[0])
+                logger.info("  成功找到非空最小ID: %s", min_id)
+                return min_id
+            else:
+                logger.warning("  仍然无法找到有效的ID值，设置默认值%s", DEFAULT_MIN_ID_VALUE)
+                return DEFAULT_MIN_ID_VALUE
+        else:
+            logger.info(
+                "  确认表 %s 中确实没有满足条件的记录(%s条)，设置默认值%s", table_name, count_result[0], DEFAULT_MIN_ID_VALUE)
+            return DEFAULT_MIN_ID_VALUE
+
+
+def initialize_table(connection_pool, record):
+    """
+    在连接池的独立连接和独立事务中初始化单个表：查询初始边界并写入 id < X 规则
+    返回 (边界值, 耗时秒数)；失败时回滚本表事务并抛出异常，不影响其他表
+    """
+    header_id, table_name, archive_days_before = record
+    start_time = time.time()
+    logger.info("\n--- 开始处理表 %s (ID: %s, 归档天数: %s) ---", table_name, header_id, archive_days_before)
+    with connection_pool.connection() as connection:
+        with connection.cursor() as db_cursor:
+            questions_before, rows_before = read_session_counters(db_cursor)
+            boundary = find_initial_boundary(db_cursor, header_id, table_name, archive_days_before)
+            questions_after, rows_after = read_session_counters(db_cursor)
+            # 扣除第一次读取计数本身的那条语句
+            logger.info("  📈 表 %s 查找初始边界执行了 %s 条查询，"
+                        "读取约 %s 行", table_name, questions_after - questions_before - 1, rows_after - rows_before)
+            existing_boundaries = load_id_boundaries(db_cursor, [header_id])
+            save_id_boundaries(db_cursor, {header_id: boundary}, existing_boundaries, 'INIT_SYSTEM')
+        connection.commit()
+    return boundary, time.time() - start_time
+
+
+def initialize_and_update(target):
     """
     初始化函数：根据表名和ttx_archive_rule_term中的field、operator、value条件，查询出MIN(id)并更新到归档规则中
     同时考虑时间条件：表.created < ttx_archive_rule_header.archiveDaysBefore
     """
     db_connection = None
     redis_client = None
+    connection_pool = None
 
     try:
         # 连接数据库
         logger.info("正在连接数据库...")
-        db_connection = pymysql.connect(**DB_CONFIG)
+        connection_pool = ConnectionPool(target.db_config, max_size=MAX_WORKERS)
+        db_connection = pymysql.connect(**target.db_config)
         db_cursor = db_connection.cursor()
 
         # 连接 Redis
         logger.info("正在连接 Redis...")
-        redis_client = redis.Redis(**REDIS_CONFIG)
+        redis_client = redis.Redis(**target.redis_config)
         # 尝试执行一个简单的 Redis 命令来测试连接
         redis_client.ping()
         logger.info("Redis 连接成功。")
@@ -190,272 +1500,50 @@ def initialize_and_update():
             logger.warning("未找到 autoArchive=1 的表记录，程序退出。")
             return
 
-        logger.info(f"共查询到 {len(table_records)} 个需要归档的表:")
+        logger.info("共查询到 %s 个需要归档的表:", len(table_records))
         for record in table_records:
-            logger.info(f"  - ID: {record[0]}, TableName: {record[1]}, ArchiveDaysBefore: {record[2]}")
-
-        # 对每个表进行初始化操作
-        for header_id, table_name, archive_days_before in table_records:
-            logger.info(f"\n--- 开始处理表 {table_name} (ID: {header_id}, 归档天数: {archive_days_before}) ---")
-
-            # 查询该表头对应的规则条件
-            rule_query = "SELECT field, operator, value FROM ttx_archive_rule_term WHERE headerId=%s;"
-            db_cursor.execute(rule_query, (header_id,))
-            rules = db_cursor.fetchall()
-
-            # 计算归档日期阈值，并将时分秒调整为 00:00:00
-            if archive_days_before is not None and archive_days_before > 0:
-                archive_date_raw = datetime.now() - timedelta(days=archive_days_before)
-                # 获取日期部分，并组合为当天的 00:00:00
-                archive_date_threshold = datetime.combine(archive_date_raw.date(), datetime.min.time())
-                logger.info(f"    归档日期阈值: {archive_date_threshold.strftime('%Y-%m-%d %H:%M:%S')}")
-            else:
-                logger.info(f"    未设置归档天数，设置默认时间条件180天")
-                archive_date_raw_default = datetime.now() - timedelta(days=180)
-                # 获取日期部分，并组合为当天的 00:00:00
-                archive_date_threshold = datetime.combine(archive_date_raw_default.date(), datetime.min.time())
-
-            if not rules:
-                logger.warning(
-                    f"  表 {table_name} (ID: {header_id}) 没有找到任何规则条件，设置默认值{DEFAULT_MIN_ID_VALUE}")
-
-                # 检查是否存在 id < X 的规则，如果没有则插入
-                check_sql = "SELECT value FROM ttx_archive_rule_term WHERE headerId=%s AND field='id' AND operator='<';"
-                db_cursor.execute(check_sql, (header_id,))
-                existing_result = db_cursor.fetchone()
-
-                if existing_result:
-                    # 如果已有规则，更新为默认值
-                    update_sql = f"UPDATE ttx_archive_rule_term SET `value`={DEFAULT_MIN_ID_VALUE} WHERE headerId=%s AND field='id' AND operator='<';"
-                    db_cursor.execute(update_sql, (header_id,))
-                    affected_rows = db_cursor.rowcount
-                    logger.info(f"    ✓ 更新了 {affected_rows} 条记录，value 设置为默认值 {DEFAULT_MIN_ID_VALUE}")
-                else:
-                    # 如果没有规则，插入新的规则
-                    insert_sql = """
-                    INSERT INTO ttx_archive_rule_term (headerId, field, operator, value, created, lastUpdated, createdBy, lastUpdatedBy)
-                    VALUES (%s, 'id', '<', %s, NOW(), NOW(), 'INIT_SYSTEM', 'INIT_SYSTEM');
-                    """
-                    db_cursor.execute(insert_sql, (header_id, DEFAULT_MIN_ID_VALUE))
-                    affected_rows = db_cursor.rowcount
-                    logger.info(f"    ✓ 插入了 {affected_rows} 条记录，value 设置为默认值 {DEFAULT_MIN_ID_VALUE}")
-
-                continue  # 继续处理下一个表
-
-            # 构建动态WHERE条件，排除field='id'的规则
-            where_conditions = []
-            params = []
-
-            for field, operator, value in rules:
-                if field.lower() != 'id':
-                    # 添加到WHERE条件
-                    where_conditions.append(f"`{field}` {operator} %s")
-                    # 确保参数类型正确，移除可能存在的额外引号
-                    if isinstance(value, str):
-                        # 移除可能存在的首尾引号
-                        cleaned_value = value.strip().strip("'").strip('"')
-                        params.append(cleaned_value)
-                    else:
-                        params.append(value)
-
-            # 添加时间条件：created < archive_date_threshold
-            if archive_date_threshold is not None:
-                where_conditions.append("`created` < %s")
-                params.append(archive_date_threshold.strftime('%Y-%m-%d %H:%M:%S'))
-
-            if not where_conditions:
-                # 如果没有其他条件，则直接查询最小ID
-                dynamic_query = f"SELECT MIN(id) as min_id FROM `{table_name}`"
-                params = []
-            else:
-                # 构建带有WHERE条件的查询
-                where_clause = " AND ".join(where_conditions)
-                dynamic_query = f"SELECT MIN(id) as min_id FROM `{table_name}` WHERE {where_clause}"
-
-            try:
-                # 执行前先进行调试查询，确保参数传递正确
-                logger.info(f"  执行查询: {dynamic_query}  参数: {params}")
-
-                # 尝试手动构建SQL查询用于调试（仅用于调试目的，不执行）
-                debug_query = dynamic_query
-                for param in params:
-                    if isinstance(param, str):
-                        debug_query = debug_query.replace('%s', f"'{param}'", 1)  # PyMySQL会自动处理引号
-                    else:
-                        debug_query = debug_query.replace('%s', str(param), 1)
-                logger.info(f"  调试用的实际查询: {debug_query}")
-
-                db_cursor.execute(dynamic_query, params)
-                result = db_cursor.fetchone()
-
-                # 添加结果调试信息
-                logger.info(f"  查询结果: {result}")
-                if result:
-                    logger.info(f"  结果长度: {len(result)}, 第一个元素: {result[0] if len(result) > 0 else 'N/A'}")
-
-                if result and result[0] is not None:
-                    min_id = int(result[0])
-                    logger.info(f"  表 {table_name} 中满足条件的最小ID为: {min_id}")
-
-                    # 更新或插入 id < X 的规则
-                    # 检查 ttx_archive_rule_term 中是否已有 id < X 的规则
-                    check_sql = "SELECT value FROM ttx_archive_rule_term WHERE headerId=%s AND field='id' AND operator='<';"
-                    db_cursor.execute(check_sql, (header_id,))
-                    existing_result = db_cursor.fetchone()
-
-                    if existing_result:
-                        # 如果已有规则，更新为最小ID
-                        update_sql = "UPDATE ttx_archive_rule_term SET `value`=%s WHERE headerId=%s AND field='id' AND operator='<';"
-                        db_cursor.execute(update_sql, (min_id, header_id))
-                        affected_rows = db_cursor.rowcount
-                        logger.info(f"    ✓ 更新了 {affected_rows} 条记录，value 设置为最小ID {min_id}")
-                    else:
-                        # 如果没有规则，插入新的规则
-                        insert_sql = """
-                        INSERT INTO ttx_archive_rule_term (headerId, field, operator, value, created, lastUpdated, createdBy, lastUpdatedBy)
-                        VALUES (%s, 'id', '<', %s, NOW(), NOW(), 'INIT_SYSTEM', 'INIT_SYSTEM');
-                        """
-                        db_cursor.execute(insert_sql, (header_id, min_id))
-                        affected_rows = db_cursor.rowcount
-                        logger.info(f"    ✓ 插入了 {affected_rows} 条记录，value 设置为最小ID {min_id}")
-                else:
-                    # 在这种情况下，我们需要先检查是否有满足条件的记录存在
-                    # 重新构建查询来检查是否存在满足条件的记录
-                    if not where_conditions:
-                        count_query = f"SELECT COUNT(*) as count FROM `{table_name}`"
-                        count_params = []
-                    else:
-                        count_query = f"SELECT COUNT(*) as count FROM `{table_name}` WHERE {where_clause}"
-                        count_params = params
-
-                    logger.info(f"  检查是否存在满足条件的记录: {count_query}  参数: {count_params}")
-                    db_cursor.execute(count_query, count_params)
-                    count_result = db_cursor.fetchone()
-
-                    if count_result and count_result[0] > 0:
-                        logger.warning(
-                            f"  检测到存在满足条件的记录({count_result[0]}条)，但MIN(id)为NULL，可能存在空值或特殊数据类型")
-
-                        # 添加额外的调试查询来确认数据确实存在
-                        debug_where_clause = " AND ".join(where_conditions)
-                        debug_query = f"SELECT id, created FROM `{table_name}` WHERE {debug_where_clause} LIMIT 5"
-                        logger.info(f"  调试查询: {debug_query}  参数: {params}")
-                        # 重新执行调试查询，确保参数处理正确
-                        db_cursor.execute(debug_query, params)
-                        debug_results = db_cursor.fetchall()
-                        logger.info(f"  调试结果: {debug_results}")
-
-                        # 检查是否是数据类型问题
-                        id_values_query = f"SELECT id FROM `{table_name}` WHERE {where_clause} AND id IS NOT NULL ORDER BY id ASC LIMIT 10"
-                        logger.info(f"  ID值检查查询: {id_values_query}  参数: {params}")
-                        db_cursor.execute(id_values_query, params)
-                        id_results = db_cursor.fetchall()
-                        logger.info(f"  ID值结果: {id_results}")
-
-                        # 尝试查询所有满足条件的ID并找最小值
-                        all_ids_query = f"SELECT id FROM `{table_name}`"
-                        if where_conditions:
-                            all_ids_query += f" WHERE {where_clause}"
-                        all_ids_query += " AND id IS NOT NULL ORDER BY id ASC LIMIT 1"
-
-                        logger.info(f"  尝试查询非空ID的最小值: {all_ids_query}  参数: {params}")
-                        db_cursor.execute(all_ids_query, params)
-                        all_ids_result = db_cursor.fetchone()
-
-                        if all_ids_result and all_ids_result[0] is not None:
-                            min_id = int(all_ids_result[0])
-                            logger.info(f"  成功找到非空最小ID: {min_id}")
-
-                            # 更新或插入 id < X 的规则
-                            check_sql = "SELECT value FROM ttx_archive_rule_term WHERE headerId=%s AND field='id' AND operator='<';"
-                            db_cursor.execute(check_sql, (header_id,))
-                            existing_result = db_cursor.fetchone()
-
-                            if existing_result:
-                                update_sql = "UPDATE ttx_archive_rule_term SET `value`=%s WHERE headerId=%s AND field='id' AND operator='<';"
-                                db_cursor.execute(update_sql, (min_id, header_id))
-                                affected_rows = db_cursor.rowcount
-                                logger.info(f"    ✓ 更新了 {affected_rows} 条记录，value 设置为最小ID {min_id}")
-                            else:
-                                insert_sql = """
-                                INSERT INTO ttx_archive_rule_term (headerId, field, operator, value, created, lastUpdated, createdBy, lastUpdatedBy)
-                                VALUES (%s, 'id', '<', %s, NOW(), NOW(), 'INIT_SYSTEM', 'INIT_SYSTEM');
-                                """
-                                db_cursor.execute(insert_sql, (header_id, min_id))
-                                affected_rows = db_cursor.rowcount
-                                logger.info(f"    ✓ 插入了 {affected_rows} 条记录，value 设置为最小ID {min_id}")
-                        else:
-                            logger.warning(f"  仍然无法找到有效的ID值，设置默认值{DEFAULT_MIN_ID_VALUE}")
-
-                            # 检查 ttx_archive_rule_term 中是否已有 id < X 的规则
-                            check_sql = "SELECT value FROM ttx_archive_rule_term WHERE headerId=%s AND field='id' AND operator='<';"
-                            db_cursor.execute(check_sql, (header_id,))
-                            existing_result = db_cursor.fetchone()
-
-                            if existing_result:
-                                # 如果已有规则，更新为默认值
-                                update_sql = f"UPDATE ttx_archive_rule_term SET `value`={DEFAULT_MIN_ID_VALUE} WHERE headerId=%s AND field='id' AND operator='<';"
-                                db_cursor.execute(update_sql, (header_id,))
-                                affected_rows = db_cursor.rowcount
-                                logger.info(
-                                    f"    ✓ 更新了 {affected_rows} 条记录，value 设置为默认值 {DEFAULT_MIN_ID_VALUE}")
-                            else:
-                                # 如果没有规则，插入新的规则
-                                insert_sql = """
-                                INSERT INTO ttx_archive_rule_term (headerId, field, operator, value, created, lastUpdated, createdBy, lastUpdatedBy)
-                                VALUES (%s, 'id', '<', %s, NOW(), NOW(), 'INIT_SYSTEM', 'INIT_SYSTEM');
-                                """
-                                db_cursor.execute(insert_sql, (header_id, DEFAULT_MIN_ID_VALUE))
-                                affected_rows = db_cursor.rowcount
-                                logger.info(
-                                    f"    ✓ 插入了 {affected_rows} 条记录，value 设置为默认值 {DEFAULT_MIN_ID_VALUE}")
-                    else:
-                        logger.info(
-                            f"  确认表 {table_name} 中确实没有满足条件的记录({count_result[0]}条)，设置默认值{DEFAULT_MIN_ID_VALUE}")
-
-                        # 检查 ttx_archive_rule_term 中是否已有 id < X 的规则
-                        check_sql = "SELECT value FROM ttx_archive_rule_term WHERE headerId=%s AND field='id' AND operator='<';"
-                        db_cursor.execute(check_sql, (header_id,))
-                        existing_result = db_cursor.fetchone()
-
-                        if existing_result:
-                            # 如果已有规则，更新为默认值
-                            update_sql = f"UPDATE ttx_archive_rule_term SET `value`={DEFAULT_MIN_ID_VALUE} WHERE headerId=%s AND field='id' AND operator='<';"
-                            db_cursor.execute(update_sql, (header_id,))
-                            affected_rows = db_cursor.rowcount
-                            logger.info(
-                                f"    ✓ 更新了 {affected_rows} 条记录，value 设置为默认值 {DEFAULT_MIN_ID_VALUE}")
-                        else:
-                            # 如果没有规则，插入新的规则
-                            insert_sql = """
-                            INSERT INTO ttx_archive_rule_term (headerId, field, operator, value, created, lastUpdated, createdBy, lastUpdatedBy)
-                            VALUES (%s, 'id', '<', %s, NOW(), NOW(), 'INIT_SYSTEM', 'INIT_SYSTEM');
-                            """
-                            db_cursor.execute(insert_sql, (header_id, DEFAULT_MIN_ID_VALUE))
-                            affected_rows = db_cursor.rowcount
-                            logger.info(
-                                f"    ✓ 插入了 {affected_rows} 条记录，value 设置为默认值 {DEFAULT_MIN_ID_VALUE}")
-
-            except pymysql.Error as e:
-                logger.error(f"  查询表 {table_name} 时发生错误: {e}")
-                continue  # 继续处理下一个表
-
-        # 提交事务以确保更改生效
-        db_connection.commit()
-        logger.info(f"  ✓ 数据库事务提交成功")
-
-        logger.info(f"\n{'=' * 70}")
-        logger.info(f"📊 初始化任务完成")
-        logger.info(f"{'=' * 70}")
-        logger.info(f"🎉 所有表的归档规则已根据其数据表中的条件查询结果设置了最小ID")
-        logger.info(f"{'=' * 70}")
+            logger.info("  - ID: %s, TableName: %s, ArchiveDaysBefore: %s", record[0], record[1], record[2])
+
+        # 按配置的线程池并发初始化各表，每个表使用连接池中的独立连接和独立事务
+        init_start_time = time.time()
+        table_durations = {}
+        failed_tables = []
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix=f'{target.name}-init') as executor:
+            futures = {executor.submit(initialize_table, connection_pool, record): record for record in table_records}
+            for future in as_completed(futures):
+                header_id, table_name, _ = futures[future]
+                try:
+                    boundary, duration = future.result()
+                    table_durations[table_name] = duration
+                    logger.info("  ✓ 表 %s (ID: %s) 初始化完成，边界 %s，耗时 %.2f秒", table_name, header_id, boundary, duration,
+                                extra={'target': target.name, 'table': table_name, 'phase': 'init', 'duration': duration})
+                except Exception:
+                    # 单个表的任何异常（连接池、SQL、边界计算）都只记为该表失败，不影响其余表和汇总
+                    failed_tables.append(table_name)
+                    logger.exception("  初始化表 %s 时发生错误", table_name,
+                                     extra={'target': target.name, 'table': table_name, 'phase': 'init'})
+
+        init_duration = time.time() - init_start_time
+        if table_durations:
+            slowest_table = max(table_durations, key=table_durations.get)
+            logger.info("  ⏱️  初始化总耗时 %.2f秒，最慢的表 %s 耗时 %.2f秒，"
+                        "串行耗时合计 %.2f秒",
+                        init_duration, slowest_table, table_durations[slowest_table], sum(table_durations.values()))
+        if failed_tables:
+            logger.warning("  ⚠️  %s 个表初始化失败（其余表不受影响）: %s", len(failed_tables), ', '.join(failed_tables))
+
+        logger.info("\n" + "=" * 70)
+        logger.info("📊 初始化任务完成")
+        logger.info("=" * 70)
+        logger.info("🎉 所有表的归档规则已根据其数据表中的条件查询结果设置了最小ID")
+        logger.info("=" * 70)
 
     except pymysql.Error as e:
-        logger.error(f"数据库操作错误: {e}")
+        logger.error("数据库操作错误: %s", e)
     except redis.ConnectionError as e:
-        logger.error(f"Redis 连接错误: {e}")
+        logger.error("Redis 连接错误: %s", e)
     except Exception as e:
-        logger.error(f"脚本执行过程中发生未知错误: {e}")
+        logger.error("脚本执行过程中发生未知错误: %s", e)
         logger.exception("详细错误信息:")  # 记录完整的堆栈跟踪
     finally:
         # 关闭数据库连接
@@ -465,35 +1553,458 @@ def initialize_and_update():
                 db_connection.close()
                 logger.info("✓ 数据库连接已关闭")
             except Exception as e:
-                logger.error(f"关闭数据库连接时发生错误: {e}")
+                logger.error("关闭数据库连接时发生错误: %s", e)
+        if connection_pool:
+            connection_pool.close()
         # 关闭 Redis 连接
         if redis_client:
             try:
                 logger.info("✓ Redis 连接已处理")
             except Exception as e:
-                logger.error(f"处理 Redis 连接时发生错误: {e}")
+                logger.error("处理 Redis 连接时发生错误: %s", e)
+
+
+# MySQL 客户端断线相关的错误码：无法连接、服务端断开、查询中连接丢失等
+MYSQL_CONNECTION_LOST_CODES = {2003, 2006, 2013, 2055}
+
+
+def is_connection_lost(error):
+    """判断异常是否为数据库或 Redis 连接断开，可以重连后继续"""
+    if isinstance(error, (redis.ConnectionError, redis.TimeoutError, pymysql.err.InterfaceError)):
+        return True
+    if isinstance(error, pymysql.err.OperationalError):
+        return bool(error.args) and error.args[0] in MYSQL_CONNECTION_LOST_CODES
+    return False
+
+
+def retry_with_backoff(action, description):
+    """
+    按指数退避重试 action，直到成功或达到最大重试次数（RECONNECT_MAX_RETRIES 为 0 时不限次数）
+    返回 action 的结果，重试耗尽时抛出最后一次的异常
+    """
+    delay = RECONNECT_BACKOFF_SECONDS
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return action()
+        except Exception as e:
+            if not is_connection_lost(e) or (RECONNECT_MAX_RETRIES and attempt >= RECONNECT_MAX_RETRIES):
+                raise
+            logger.warning("  ⚠️  %s失败（第 %s 次）: %s，%.1f秒后重试", description, attempt, e, delay)
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_BACKOFF_SECONDS)
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    """读取断点文件，不存在或内容损坏时返回 None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        checkpoint['boundaries'] = {int(header_id): int(value) for header_id, value in checkpoint['boundaries'].items()}
+        checkpoint['steps'] = {int(header_id): int(value) for header_id, value in checkpoint.get('steps', {}).items()}
+        return checkpoint
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning("断点文件 %s 无法读取，忽略: %s", path, e)
+        return None
+
+
+def save_checkpoint(iteration, boundaries, steps, path=CHECKPOINT_FILE):
+    """原子写入断点：已完成的迭代数、各表已提交的边界值和自适应步长"""
+    checkpoint = {
+        'iteration': iteration,
+        'total_iterations': total_iterations,
+        'boundaries': {str(header_id): value for header_id, value in boundaries.items()},
+        'steps': {str(header_id): value for header_id, value in steps.items()},
+        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+
+def clear_checkpoint(path=CHECKPOINT_FILE):
+    """全部迭代正常完成后删除断点，下次运行重新初始化"""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def connect_database(target):
+    """连接目标数据库，断线时按指数退避重试"""
+    return retry_with_backoff(lambda: pymysql.connect(**target.db_config), "连接数据库")
+
+
+def connect_redis(target, redis_client=None):
+    """连接（或重新检查）目标 Redis，断线时按指数退避重试"""
+    redis_client = redis_client or redis.Redis(**target.redis_config)
+    retry_with_backoff(redis_client.ping, "连接 Redis")
+    return redis_client
+
+
+def request_archive_api(target, lock_watcher):
+    """
+    请求归档接口触发归档任务，并等待任务释放 Redis 锁，返回 (接口耗时, 等待耗时)
+    请求后 appear_timeout_seconds 内锁未出现视为触发丢失，锁长时间不释放视为任务卡住，均按 stale_policy 处理
+    """
+    api_duration = 0.0
+    archive_wait_duration = 0.0
+    retriggers = 0
+    while True:
+        logger.info("  → 正在请求 API: %s", target.api_url)
+        api_start_time = time.time()
+        try:
+            # 使用会话对象，支持长连接
+            response = get_session().post(target.api_url, timeout=30)
+            api_end_time = time.time()
+            api_duration = api_end_time - api_start_time
+            target.metrics.observe_api(api_duration, 'ok' if response.status_code == 200 else 'http_error')
+            logger.info("  ← API 请求完成，状态码: %s，耗时: %.2f秒", response.status_code, api_duration,
+                        extra={'target': target.name, 'phase': 'api', 'duration': api_duration})
+
+            # 根据您的 API 文档判断成功与否
+            if response.status_code == 200:
+                logger.info("  ✓ API 请求成功")
+            else:
+                logger.warning("  ⚠️  API 请求返回非200状态码: %s", response.status_code)
+
+            # 可选：记录响应内容（如果需要调试）
+            # logger.debug("    响应内容: %s...", response.text[:200])  # 只记录前200字符
+
+        except requests.exceptions.Timeout:
+            target.metrics.observe_api(time.time() - api_start_time, 'timeout')
+            logger.error("  ❌ API 请求超时 (30秒)")
+        except requests.exceptions.ConnectionError:
+            target.metrics.observe_api(time.time() - api_start_time, 'connection_error')
+            logger.error("  ❌ API 连接错误")
+        except requests.exceptions.RequestException as e:
+            target.metrics.observe_api(time.time() - api_start_time, 'error')
+            logger.error("  ❌ API 请求发生错误: %s", e)
+            # 如果API出错，您可能希望暂停或退出，这里只是打印错误继续循环
+            # raise # 取消注释这行可以让脚本在此处停止
+
+        # 确认归档任务已持有锁，否则视为触发丢失（接口超时、服务重启等）
+        if LOCK_APPEAR_TIMEOUT_SECONDS and not lock_watcher.wait_appeared(LOCK_APPEAR_TIMEOUT_SECONDS):
+            details = f"请求接口后 {LOCK_APPEAR_TIMEOUT_SECONDS} 秒内锁 {target.lock_key} 未出现，归档任务可能未被触发"
+            if LOCK_STALE_POLICY == 'retrigger' and retriggers < LOCK_MAX_RETRIGGERS:
+                retriggers += 1
+                target.metrics.observe_lock_incident('trigger_lost', 'retrigger')
+                logger.warning("  ♻️  %s，第 %s 次重新触发", details, retriggers)
+                continue
+            if LOCK_STALE_POLICY == 'skip':
+                # 规则是累计的 id < X，本轮窗口会由下一次归档一并处理
+                target.metrics.observe_lock_incident('trigger_lost', 'skip')
+                logger.warning("  ⏭️  %s，跳过本轮等待，由下一轮归档一并处理", details)
+            else:
+                target.metrics.observe_lock_incident('trigger_lost', 'alert')
+                send_lock_alert(target, 'trigger_lost', details)
+            return api_duration, archive_wait_duration
+
+        # 等待归档任务完成
+        logger.info("  🔄 等待归档任务完成...")
+        waited, lock_deleted = wait_for_lock_release(target, lock_watcher)
+        archive_wait_duration += waited
+        target.metrics.observe_lock_wait(waited)
+        if lock_deleted and retriggers < LOCK_MAX_RETRIGGERS:
+            retriggers += 1
+            continue
+        logger.info("  ✅ 归档任务已完成，等待耗时: %.2f秒", archive_wait_duration,
+                    extra={'target': target.name, 'phase': 'lock_wait', 'duration': archive_wait_duration})
+        return api_duration, archive_wait_duration
+
+
+class ChunkedArchiver:
+    """
+    进程内归档引擎：读取与归档接口相同的规则（表头、规则条件、archiveDaysBefore），按主键顺序分块把
+    id < 边界且满足条件的行复制到归档表后删除。候选 id 用不加锁的一致性读选出（规则条件没有索引时也不会锁住扫描过的行），
+    再在一个短事务中按主键 INSERT ... SELECT 和 DELETE，两条语句都带上规则条件，只锁定并处理仍满足条件的行；
+    每轮都从表头重新扫描到边界，之前条件未满足、之后变为可归档的行也会在下一轮归档
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.pool = ConnectionPool(target.db_config, ARCHIVE_ENGINE_PARALLELISM)
+        self.prepared = set()
+
+    def close(self):
+        self.pool.close()
+
+    @staticmethod
+    def archive_table_name(table_name):
+        """按 table_template 生成归档表名，可带库名，如 wms_archive.{table}"""
+        return '.'.join(f"`{part}`" for part in ARCHIVE_ENGINE_TABLE_TEMPLATE.format(table=table_name).split('.'))
+
+    def archive_table(self, header_id, table_name, archive_days_before, boundary, heartbeat=None):
+        """把表中 id < boundary 且满足规则条件的行分块归档，返回归档行数；heartbeat 在每块提交后调用（续期归档锁）"""
+        archive_table = self.archive_table_name(table_name)
+        start_time = time.time()
+        with self.pool.connection() as connection:
+            with connection.cursor() as db_cursor:
+                if ARCHIVE_ENGINE_CREATE_TABLES and table_name not in self.prepared:
+                    db_cursor.execute(f"CREATE TABLE IF NOT EXISTS {archive_table} LIKE `{table_name}`")
+                    self.prepared.add(table_name)
+                _, where_conditions, params = load_archive_conditions(db_cursor, header_id, archive_days_before)
+            connection.commit()
+
+        moved = 0
+        chunks = 0
+        position = None
+        while True:
+            scan_conditions = ['id < %s'] + where_conditions
+            scan_params = [boundary] + params
+            if position is not None:
+                scan_conditions.insert(0, 'id >= %s')
+                scan_params.insert(0, position)
+            with self.pool.connection() as connection:
+                with connection.cursor() as db_cursor:
+                    db_cursor.execute(f"SELECT id FROM `{table_name}` WHERE {' AND '.join(scan_conditions)} "
+                                      f"ORDER BY id LIMIT %s", scan_params + [ARCHIVE_ENGINE_CHUNK_SIZE])
+                    ids = [row[0] for row in db_cursor.fetchall()]
+                    connection.commit()
+                    if not ids:
+                        break
+                    # 只按主键加锁；规则条件重新判断，选出候选后被修改为不满足条件的行不会被归档
+                    row_conditions = ' AND '.join([f"id IN ({', '.join(['%s'] * len(ids))})"] + where_conditions)
+                    inserted = db_cursor.execute(f"INSERT INTO {archive_table} SELECT * FROM `{table_name}` "
+                                                 f"WHERE {row_conditions}", ids + params)
+                    deleted = db_cursor.execute(f"DELETE FROM `{table_name}` WHERE {row_conditions}", ids + params)
+                    if inserted != deleted:
+                        raise RuntimeError(f"表 {table_name} 复制 {inserted} 行但删除 {deleted} 行，已回滚")
+                connection.commit()
+
+            position = ids[-1] + 1
+            moved += deleted
+            chunks += 1
+            if heartbeat:
+                heartbeat()
+            if len(ids) < ARCHIVE_ENGINE_CHUNK_SIZE:
+                break
+            if ARCHIVE_ENGINE_CHUNK_SLEEP_SECONDS:
+                time.sleep(ARCHIVE_ENGINE_CHUNK_SLEEP_SECONDS)
+
+        duration = time.time() - start_time
+        logger.info("  🗄️  表 %s (ID: %s): 归档 %s 行到 %s，%s 块，耗时 %.2f秒",
+                    table_name, header_id, moved, archive_table, chunks, duration,
+                    extra={'target': self.target.name, 'table': table_name, 'phase': 'engine', 'duration': duration})
+        return moved
+
+    def archive(self, table_plans, heartbeat=None):
+        """
+        table_plans: [(表头ID, 表名, 归档天数, 边界)]，最多 parallelism 个表并行归档
+        返回 {表头ID: 归档行数}；单个表失败只记录日志并从结果中略去，不影响其余表（该表下一轮从表头重新扫描）
+        """
+        moved = {}
+        with ThreadPoolExecutor(max_workers=ARCHIVE_ENGINE_PARALLELISM,
+                                thread_name_prefix=f"{self.target.name}-archive") as executor:
+            futures = {executor.submit(self.archive_table, *plan, heartbeat=heartbeat): plan for plan in table_plans}
+            for future in as_completed(futures):
+                header_id, table_name = futures[future][:2]
+                try:
+                    moved[header_id] = future.result()
+                except Exception:
+                    logger.exception("  ❌ 表 %s (ID: %s) 进程内归档失败，下一轮重试", table_name, header_id,
+                                     extra={'target': self.target.name, 'table': table_name, 'phase': 'engine'})
+        return moved
+
+
+class LoadGuard:
+    """
+    数据库负载保护：每次迭代前采样主库 Threads_running、InnoDB history list length 和副本延迟，
+    负载达到阈值的 slowdown_ratio 时按比例放慢，超过阈值时暂停，直到所有指标回落到阈值 × resume_ratio 以下
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.replica_connections = {}
+        self.warned = set()  # 已提示过无法采样的指标，避免每次迭代重复输出
+        self.paused_seconds = 0.0
+        self.slowed_seconds = 0.0
+        self.pauses = 0
+
+    @property
+    def throttled_seconds(self):
+        return self.paused_seconds + self.slowed_seconds
+
+    def close(self):
+        for connection in self.replica_connections.values():
+            try:
+                connection.close()
+            except Exception:
+                pass
+        self.replica_connections = {}
+
+    def _warn_once(self, key, message):
+        if key not in self.warned:
+            self.warned.add(key)
+            logger.warning(message)
+
+    def _read(self, signal, reader):
+        """采样单个指标；没有权限或不支持时该指标不参与限流，连接断开则交给主循环重连"""
+        try:
+            return reader()
+        except Exception as e:
+            if is_connection_lost(e):
+                raise
+            self._warn_once(signal, f"  ⚠️  无法采样 {signal}: {e}，该指标不参与负载保护")
+            return None
+
+    @staticmethod
+    def _threads_running(db_cursor):
+        db_cursor.execute("SHOW GLOBAL STATUS LIKE 'Threads_running'")
+        row = db_cursor.fetchone()
+        return int(row[1]) if row and row[0] == 'Threads_running' else None
+
+    @staticmethod
+    def _history_list_length(db_cursor):
+        db_cursor.execute("SELECT `COUNT` FROM information_schema.INNODB_METRICS WHERE NAME = 'trx_rseg_history_len'")
+        row = db_cursor.fetchone()
+        return int(row[0]) if row else None
+
+    def _replica_status_lag(self, db_cursor, source):
+        """执行 SHOW REPLICA STATUS，返回各复制通道中的最大延迟；不是副本时返回 None"""
+        try:
+            db_cursor.execute("SHOW REPLICA STATUS")
+        except pymysql.err.ProgrammingError:
+            # MySQL 8.0.22 之前只支持 SHOW SLAVE STATUS
+            db_cursor.execute("SHOW SLAVE STATUS")
+        rows = db_cursor.fetchall()
+        if not rows or not db_cursor.description:
+            return None
+        names = [column[0] for column in db_cursor.description]
+        lags = []
+        for row in rows:
+            values = dict(zip(names, row))
+            lag = values.get('Seconds_Behind_Source', values.get('Seconds_Behind_Master'))
+            if lag is None:
+                self._warn_once(f"replica_stopped:{source}", f"  ⚠️  {source} 的复制线程未运行，无法获取延迟")
+            else:
+                lags.append(int(lag))
+        return max(lags) if lags else None
 
+    def _replica_lag(self, db_cursor):
+        # 未配置副本时检查归档连接本身（连接的是副本或级联复制的中间节点时有效）
+        if not self.target.replica_configs:
+            return self._read('replica_lag', lambda: self._replica_status_lag(db_cursor, '归档数据库'))
 
-def update_and_request():
+        lags = []
+        for replica_config in self.target.replica_configs:
+            source = f"{replica_config['host']}:{replica_config['port']}"
+            try:
+                connection = self.replica_connections.get(source)
+                if connection is None:
+                    connection = pymysql.connect(connect_timeout=5, **replica_config)
+                    self.replica_connections[source] = connection
+                with connection.cursor() as replica_cursor:
+                    lag = self._replica_status_lag(replica_cursor, source)
+                if lag is not None:
+                    lags.append(lag)
+            except Exception as e:
+                # 副本不可用不影响归档，下次采样时重新连接
+                logger.warning("  ⚠️  无法获取副本 %s 的延迟: %s", source, e)
+                connection = self.replica_connections.pop(source, None)
+                if connection:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+        return max(lags) if lags else None
+
+    def sample(self, db_cursor):
+        samples = {}
+        if LOAD_GUARD_MAX_THREADS_RUNNING:
+            samples['threads_running'] = self._read('Threads_running', lambda: self._threads_running(db_cursor))
+        if LOAD_GUARD_MAX_HISTORY_LIST_LENGTH:
+            samples['history_list_length'] = self._read(
+                'history list length', lambda: self._history_list_length(db_cursor))
+        if LOAD_GUARD_MAX_REPLICA_LAG_SECONDS:
+            samples['replica_lag_seconds'] = self._replica_lag(db_cursor)
+        self.target.metrics.set_db_load(samples)
+        return samples
+
+    @staticmethod
+    def load_ratio(samples):
+        """返回 (负载比例, 说明)：各指标与阈值之比的最大值"""
+        thresholds = {
+            'threads_running': LOAD_GUARD_MAX_THREADS_RUNNING,
+            'history_list_length': LOAD_GUARD_MAX_HISTORY_LIST_LENGTH,
+            'replica_lag_seconds': LOAD_GUARD_MAX_REPLICA_LAG_SECONDS,
+        }
+        ratio = 0.0
+        details = []
+        for signal, value in samples.items():
+            if value is None:
+                continue
+            ratio = max(ratio, value / thresholds[signal])
+            details.append(f"{signal}={value}/{thresholds[signal]}")
+        return ratio, ', '.join(details) or '无可用指标'
+
+    def pace(self, db_connection, db_cursor):
+        """在迭代前调用：按负载放慢或暂停，返回本次限流的秒数"""
+        ratio, details = self.load_ratio(self.sample(db_cursor))
+        if ratio >= 1:
+            # 暂停前结束当前事务，避免长时间持有的读视图本身推高 history list length
+            db_connection.commit()
+            self.pauses += 1
+            start = time.time()
+            logger.warning("  ⏸️  数据库负载超过阈值（%s），暂停归档，"
+                           "直到回落到阈值的 %.0f%% 以下", details, LOAD_GUARD_RESUME_RATIO * 100)
+            while ratio >= LOAD_GUARD_RESUME_RATIO:
+                if LOAD_GUARD_MAX_PAUSE_SECONDS and time.time() - start >= LOAD_GUARD_MAX_PAUSE_SECONDS:
+                    logger.warning("  ⚠️  已暂停 %s 秒，负载仍未回落（%s），继续归档", LOAD_GUARD_MAX_PAUSE_SECONDS, details)
+                    break
+                time.sleep(LOAD_GUARD_CHECK_INTERVAL_SECONDS)
+                ratio, details = self.load_ratio(self.sample(db_cursor))
+                db_connection.commit()
+            paused = time.time() - start
+            self.paused_seconds += paused
+            self.target.metrics.observe_throttle(paused, 'pause')
+            logger.info("  ▶️  暂停 %.1f 秒后恢复归档（%s）", paused, details,
+                        extra={'target': self.target.name, 'phase': 'throttle', 'duration': paused})
+            return paused
+
+        if LOAD_GUARD_SLOWDOWN_RATIO < 1 and ratio >= LOAD_GUARD_SLOWDOWN_RATIO:
+            delay = LOAD_GUARD_MAX_SLOWDOWN_SECONDS * (ratio - LOAD_GUARD_SLOWDOWN_RATIO) / (1 - LOAD_GUARD_SLOWDOWN_RATIO)
+            logger.info("  🐢 数据库负载偏高（%s），延迟 %.1f 秒后继续", details, delay,
+                        extra={'target': self.target.name, 'phase': 'throttle', 'duration': delay})
+            time.sleep(delay)
+            self.slowed_seconds += delay
+            self.target.metrics.observe_throttle(delay, 'slowdown')
+            return delay
+        return 0.0
+
+
+def update_and_request(target, checkpoint=None):
     """
     主循环函数：查询表头信息，更新归档规则值，请求API、并等待归档任务完成
+    每次提交后写入断点；数据库或 Redis 连接断开时自动重连，并从数据库中已提交的边界继续
     """
     db_connection = None
     redis_client = None
-    execution_times = []  # 存储每次归档执行的时间
+    lock_watcher = None
+    load_guard = LoadGuard(target) if LOAD_GUARD_ENABLED else None
+    schedule = create_schedule()
+    outside_window_seconds = 0.0
+    archiver = ChunkedArchiver(target) if ARCHIVE_ENGINE_ENABLED else None
+    engine_rows = 0
+    # 每次归档执行时间的流式统计：分位数草图 + 最长/最短迭代，不保留逐条记录
+    duration_stats = QuantileSketch(RUN_HISTORY_RELATIVE_ACCURACY)
+    longest_iteration = shortest_iteration = None
+    run_history = None
+    run_status = 'failed'
 
     try:
         # 连接数据库
         logger.info("正在连接数据库...")
-        db_connection = pymysql.connect(**DB_CONFIG)
+        db_connection = connect_database(target)
         db_cursor = db_connection.cursor()
 
         # 连接 Redis
         logger.info("正在连接 Redis...")
-        redis_client = redis.Redis(**REDIS_CONFIG)
-        # 尝试执行一个简单的 Redis 命令来测试连接
-        redis_client.ping()
+        redis_client = connect_redis(target)
         logger.info("Redis 连接成功。")
+        lock_watcher = create_lock_watcher(redis_client, target)
 
         # 查询所有 autoArchive=1 的表头信息，包括归档天数设置
         logger.info("正在查询 ttx_archive_rule_header 表中 autoArchive=1 的记录...")
@@ -503,157 +2014,315 @@ def update_and_request():
 
         if not table_records:
             logger.warning("未找到 autoArchive=1 的表记录，程序退出。")
-            return
+            return 'completed'
 
-        logger.info(f"共查询到 {len(table_records)} 个需要归档的表:")
+        if RUN_HISTORY_ENABLED:
+            run_history = RunHistory(RUN_HISTORY_FILE, RUN_HISTORY_RELATIVE_ACCURACY)
+            logger.info("📝 运行历史记录到 %s，本次运行编号 %s", RUN_HISTORY_FILE, run_history.start_run(target.name))
+
+        logger.info("共查询到 %s 个需要归档的表:", len(table_records))
         for record in table_records:
-            logger.info(f"  - ID: {record[0]}, TableName: {record[1]}, ArchiveDaysBefore: {record[2]}")
+            logger.info("  - ID: %s, TableName: %s, ArchiveDaysBefore: %s", record[0], record[1], record[2])
 
+        # 当前边界值只在启动时读取一次，之后保存在内存中
+        header_ids = [record[0] for record in table_records]
+        boundaries = load_id_boundaries(db_cursor, header_ids)
+        step_controller = create_step_controller()
         current_iteration = 0
 
-        for iteration in range(total_iterations):
-            current_iteration += 1
-            progress_percentage = (current_iteration / total_iterations) * 100
-
-            # 1. 检查 Redis 锁，等待归档任务完成
-            logger.info(f"[{progress_percentage:.1f}%] 检查 Redis 锁 {LOCK_KEY} 是否存在，以确定归档任务是否仍在执行...")
-            lock_check_start_time = time.time()
-            while True:
-                if redis_client.exists(LOCK_KEY):
-                    elapsed_time = int(time.time() - lock_check_start_time)
-                    logger.info(
-                        f"    锁 {LOCK_KEY} 存在，归档任务仍在执行中。已等待 {elapsed_time}s，继续等待 {WAIT_SECONDS_FOR_LOCK_CHECK} 秒后重试...")
-                    time.sleep(WAIT_SECONDS_FOR_LOCK_CHECK)
-                else:
-                    elapsed_time = int(time.time() - lock_check_start_time)
-                    logger.info(f"    锁 {LOCK_KEY} 不存在，归档任务已结束。等待了 {elapsed_time} 秒。")
-                    break
+        # 从断点恢复：迭代数和自适应步长取自断点，边界以数据库中已提交的值为准
+        if checkpoint:
+            current_iteration = checkpoint['iteration']
+            if step_controller:
+                step_controller.steps.update(checkpoint['steps'])
+            for header_id, value in checkpoint['boundaries'].items():
+                if boundaries.get(header_id) != value:
+                    logger.warning("  表头 %s 的断点边界 %s 与数据库中的 %s 不一致，以数据库为准", header_id, value, boundaries.get(header_id))
+            logger.info("♻️  从断点恢复：已完成 %s 次迭代（断点时间 %s）", current_iteration, checkpoint.get('updated_at'))
+
+        # 启动时计算一次每个表的可归档上界，边界越过上界的表不再推进
+        with target.metrics.time_db('find_upper_bounds'):
+            upper_bounds = find_archivable_upper_bounds(db_cursor, table_records)
+        target.metrics.set_progress(table_records, boundaries, upper_bounds)
+        active_records = [record for record in table_records
+                          if not is_caught_up(record[0], boundaries, upper_bounds)]
+        for header_id, table_name, _ in table_records:
+            if is_caught_up(header_id, boundaries, upper_bounds):
+                logger.info("  表 %s (ID: %s) 已无待归档数据，跳过", table_name, header_id)
+
+        # 估算积压和追平所需的迭代次数；total_iterations 为 auto 时一直运行到追平
+        run_until_drained = str(total_iterations).lower() == 'auto'
+        with target.metrics.time_db('estimate_backlog'):
+            estimator = BacklogEstimator(estimate_backlog(db_cursor, active_records, boundaries, upper_bounds), boundaries)
+        remaining = estimator.remaining(boundaries, upper_bounds)
+        current_steps = {header_id: step_controller.step(header_id) if step_controller else ARCHIVE_INCREMENT_VALUE
+                         for header_id in remaining}
+        iterations_needed = estimator.iterations_needed(remaining, current_steps)
+        for header_id, table_name, _ in active_records:
+            span, rows = remaining[header_id]
+            logger.info("  📦 表 %s: 剩余 id 跨度 %s，约 %s 行，按步长 %s 约需 %s 次迭代",
+                        table_name, span, rows if rows is not None else '未知', current_steps[header_id],
+                        math.ceil(span / max(current_steps[header_id], 1)))
+        if run_until_drained:
+            logger.info("📦 运行到追平为止，按当前步长预计需要 %s 次迭代", iterations_needed)
+        elif current_iteration + iterations_needed > total_iterations:
+            logger.warning("⚠️  按当前步长追平约需 %s 次迭代，超过剩余的 "
+                           "%s 次，运行结束时仍会有积压；"
+                           "可将 total_iterations 设置为 auto 运行到追平",
+                           iterations_needed, max(total_iterations - current_iteration, 0))
+        else:
+            logger.info("📦 按当前步长预计 %s 次迭代后追平", iterations_needed)
+        loop_start_time = time.time()
+
+        while run_until_drained or current_iteration < total_iterations:
+            if not active_records:
+                logger.info("🏁 所有表均已追平可归档上界，提前结束循环")
+                break
+
+            iteration = current_iteration
+            planned_iterations = current_iteration + max(iterations_needed, 1) if run_until_drained else total_iterations
+            progress_percentage = ((iteration + 1) / planned_iterations) * 100
 
-            logger.info(f"\n{'=' * 60}")
-            logger.info(
-                f"处理进度: [{current_iteration}/{total_iterations}] | 当前迭代: {iteration} | 完成率: {progress_percentage:.1f}%")
-            logger.info(f"{'=' * 60}")
-
-            # 记录归档开始时间
-            archive_start_time = time.time()
-            logger.info(
-                f"  🕐 归档任务开始时间: {datetime.fromtimestamp(archive_start_time).strftime('%Y-%m-%d %H:%M:%S')}")
-
-            # 2. 查询当前所有表头ID对应的现有value值，并递增{ARCHIVE_INCREMENT_VALUE}
-            for header_id, table_name, archive_days_before in table_records:
-                # 先查询当前的value值
-                select_sql = "SELECT value FROM ttx_archive_rule_term WHERE headerId=%s AND field='id' AND operator='<';"
-                db_cursor.execute(select_sql, (header_id,))
-                result = db_cursor.fetchone()
-
-                if result:
-                    current_value = int(result[0])
-                    new_value = current_value + ARCHIVE_INCREMENT_VALUE
-                    logger.info(f"  处理表 {table_name} (ID: {header_id}): 当前值 {current_value}, 更新为 {new_value}")
-
-                    # 执行更新
-                    update_sql = "UPDATE ttx_archive_rule_term SET `value`=%s WHERE headerId=%s AND field='id' AND operator='<';"
-                    db_cursor.execute(update_sql, (new_value, header_id))
-                    affected_rows = db_cursor.rowcount
-                    logger.info(f"    ✓ 更新了 {affected_rows} 条记录，value 设置为 {new_value}")
-                else:
-                    # 如果没有找到匹配的规则，插入默认值{DEFAULT_MIN_ID_VALUE}
-                    logger.info(
-                        f"  警告: 表 {table_name} (ID: {header_id}) 没有找到 field='id' 且 operator='<' 的规则，插入默认值{DEFAULT_MIN_ID_VALUE}")
-
-                    # 插入新的规则
-                    insert_sql = """
-                    INSERT INTO ttx_archive_rule_term (headerId, field, operator, value, created, lastUpdated, createdBy, lastUpdatedBy)
-                    VALUES (%s, 'id', '<', %s, NOW(), NOW(), 'SYSTEM', 'SYSTEM')
-                    ON DUPLICATE KEY UPDATE value = %s, lastUpdated = NOW(), lastUpdatedBy = 'SYSTEM';
-                    """
-                    db_cursor.execute(insert_sql, (header_id, DEFAULT_MIN_ID_VALUE, DEFAULT_MIN_ID_VALUE))
-                    affected_rows = db_cursor.rowcount
-                    logger.info(f"    ✓ 插入了 {affected_rows} 条记录，value 设置为 {DEFAULT_MIN_ID_VALUE}")
-
-            # 提交事务以确保更改生效
-            db_connection.commit()
-            logger.info(f"  ✓ 数据库事务提交成功")
-
-            # 3. 请求 API
-            logger.info(f"  → 正在请求 API: {API_URL}")
-            api_start_time = time.time()
             try:
-                # 使用会话对象，支持长连接
-                response = session.post(API_URL, timeout=30)
-                api_end_time = time.time()
-                api_duration = api_end_time - api_start_time
-                logger.info(f"  ← API 请求完成，状态码: {response.status_code}，耗时: {api_duration:.2f}秒")
-
-                # 根据您的 API 文档判断成功与否
-                if response.status_code == 200:
-                    logger.info(f"  ✓ API 请求成功")
-                else:
-                    logger.warning(f"  ⚠️  API 请求返回非200状态码: {response.status_code}")
-
-                # 可选：记录响应内容（如果需要调试）
-                # logger.debug(f"    响应内容: {response.text[:200]}...")  # 只记录前200字符
-
-            except requests.exceptions.Timeout:
-                logger.error(f"  ❌ API 请求超时 (30秒)")
-            except requests.exceptions.ConnectionError:
-                logger.error(f"  ❌ API 连接错误")
-            except requests.exceptions.RequestException as e:
-                logger.error(f"  ❌ API 请求发生错误: {e}")
-                # 如果API出错，您可能希望暂停或退出，这里只是打印错误继续循环
-                # raise # 取消注释这行可以让脚本在此处停止
-
-            # 等待归档任务完成
-            logger.info(f"  🔄 等待归档任务完成...")
-            archive_wait_start = time.time()
-            while True:
-                if redis_client.exists(LOCK_KEY):
-                    time.sleep(WAIT_SECONDS_FOR_LOCK_CHECK)
+                # 0. 不在归档时间窗口内：结束当前事务并写入断点，休眠到下一个窗口开始（不退出进程）
+                window = schedule.current_window() if schedule else None
+                if schedule and window is None:
+                    db_connection.commit()
+                    save_checkpoint(current_iteration, boundaries, step_controller.steps if step_controller else {},
+                                    target.checkpoint_file)
+                    next_start = schedule.next_window_start()
+                    logger.info("🌙 当前不在归档时间窗口内，已写入断点，休眠到 %s", next_start.strftime('%Y-%m-%d %H:%M'))
+                    sleep_start = time.time()
+                    time.sleep(max((next_start - datetime.now()).total_seconds(), 0))
+                    outside_window_seconds += time.time() - sleep_start
+                    # 长时间休眠后连接可能已被服务端关闭：数据库重连，Redis 重新检查并重建锁订阅
+                    # （空闲的 pubsub 连接可能已被服务端或中间网络设备断开，且不会报错）
+                    db_connection.ping(reconnect=True)
+                    lock_watcher.close()
+                    redis_client = connect_redis(target, redis_client)
+                    lock_watcher = create_lock_watcher(redis_client, target)
+                    continue
+
+                # 1. 检查 Redis 锁，等待归档任务完成
+                logger.info("[%.1f%%] 检查 Redis 锁 %s 是否存在，以确定归档任务是否仍在执行...", progress_percentage, target.lock_key)
+                elapsed_time, _ = wait_for_lock_release(target, lock_watcher)
+                target.metrics.observe_lock_wait(elapsed_time)
+                logger.info("    锁 %s 不存在，归档任务已结束。等待了 %.2f 秒。", target.lock_key, elapsed_time)
+
+                # 按数据库负载放慢或暂停，限流时间不计入本次归档耗时
+                throttle_seconds = load_guard.pace(db_connection, db_cursor) if load_guard else 0.0
+
+                logger.info("\n" + "=" * 60)
+                logger.info("处理进度: [%s/%s] | 当前迭代: %s | 完成率: %.1f%%",
+                            iteration + 1, planned_iterations, iteration, progress_percentage,
+                            extra={'target': target.name, 'iteration': iteration, 'phase': 'progress'})
+                logger.info("=" * 60)
+
+                # 记录归档开始时间
+                archive_start_time = time.time()
+                logger.info(
+                    "  🕐 归档任务开始时间: %s", datetime.fromtimestamp(archive_start_time).strftime('%Y-%m-%d %H:%M:%S'))
+
+                # 2. 基于内存中的当前边界值递增步长（固定为{ARCHIVE_INCREMENT_VALUE}或自适应），所有表一条语句批量更新
+                # 从当前边界定位下一个存在的 id，空区间直接跳过；新边界不超过可归档上界 + 1
+                old_boundaries = dict(boundaries)
+                with target.metrics.time_db('seek_next_ids'):
+                    next_ids = seek_next_ids(db_cursor, active_records, boundaries)
+                new_boundaries = {}
+                steps_used = {}
+                caught_up = set()
+                for header_id, table_name, archive_days_before in active_records:
+                    if header_id in boundaries:
+                        current_value = boundaries[header_id]
+                        next_id = next_ids.get(header_id)
+                        if next_id is None or next_id > upper_bounds[header_id]:
+                            logger.info("  表 %s (ID: %s): 边界 %s 之后没有可归档数据，停止推进", table_name, header_id, current_value)
+                            caught_up.add(header_id)
+                            continue
+                        if next_id > current_value:
+                            logger.info("  表 %s (ID: %s): 跳过空区间 [%s, %s)",
+                                        table_name, header_id, current_value, next_id)
+                        step = step_controller.step(header_id) if step_controller else ARCHIVE_INCREMENT_VALUE
+                        if window and window.step:
+                            # 窗口配置了步长：固定步长时直接使用，自适应步长时作为上限
+                            step = min(step, window.step) if step_controller else window.step
+                        steps_used[header_id] = step
+                        new_value = min(max(current_value, next_id) + step, upper_bounds[header_id] + 1)
+                        logger.info("  处理表 %s (ID: %s): 当前值 %s, 步长 %s, 更新为 %s",
+                                    table_name, header_id, current_value, step, new_value,
+                                    extra={'target': target.name, 'table': table_name, 'iteration': iteration,
+                                           'phase': 'boundary'})
+                    else:
+                        # 如果没有找到匹配的规则，插入默认值{DEFAULT_MIN_ID_VALUE}
+                        new_value = DEFAULT_MIN_ID_VALUE
+                        logger.info(
+                            "  警告: 表 %s (ID: %s) 没有找到 field='id' 且 operator='<' 的规则，插入默认值%s",
+                            table_name, header_id, DEFAULT_MIN_ID_VALUE)
+                    new_boundaries[header_id] = new_value
+
+                with target.metrics.time_db('save_boundaries'):
+                    updated_rows, inserted_rows = save_id_boundaries(db_cursor, new_boundaries, boundaries)
+                logger.info("    ✓ 批量更新了 %s 条、插入了 %s 条记录", updated_rows, inserted_rows)
+
+                # 提交事务以确保更改生效，提交成功后才更新内存中的边界值并写入断点
+                with target.metrics.time_db('commit'):
+                    db_connection.commit()
+                boundaries.update(new_boundaries)
+                target.metrics.set_progress(table_records, boundaries, upper_bounds)
+                current_iteration += 1
+                save_checkpoint(current_iteration, boundaries, step_controller.steps if step_controller else {},
+                                target.checkpoint_file)
+                logger.info("  ✓ 数据库事务提交成功")
+
+                # 本轮之后边界已越过上界的表，归档完本轮即追平，不再参与后续迭代
+                caught_up.update(header_id for header_id in new_boundaries
+                                 if is_caught_up(header_id, boundaries, upper_bounds))
+                if caught_up:
+                    active_records = [record for record in active_records if record[0] not in caught_up]
+                    logger.info("  🏁 %s 个表已追平可归档上界，剩余 %s 个表", len(caught_up), len(active_records))
+                if not new_boundaries:
+                    continue
+
+                # 自适应步长按窗口大小分摊耗时：归档接口不返回行数，使用 id 跨度（不在主库上额外 COUNT），
+                # 进程内归档时使用实际归档的行数；运行历史只记录实际归档的行数
+                window_sizes = {header_id: new_boundaries[header_id] - old_boundaries[header_id]
+                                for header_id in new_boundaries}
+                moved_rows = {}
+
+                # 3. 请求 API 并等待归档任务完成；启用进程内归档引擎时直接分块归档，不请求接口
+                if archiver:
+                    logger.info("  → 进程内归档 %s 个表（每块 %s 行，"
+                                "最多 %s 个表并行）",
+                                len(new_boundaries), ARCHIVE_ENGINE_CHUNK_SIZE, ARCHIVE_ENGINE_PARALLELISM)
+                    engine_start_time = time.time()
+                    with hold_archive_lock(target, lock_watcher) as heartbeat:
+                        moved_rows = archiver.archive(
+                            [(header_id, table_name, archive_days_before, boundaries[header_id])
+                             for header_id, table_name, archive_days_before in table_records
+                             if header_id in new_boundaries],
+                            heartbeat)
+                    api_duration = time.time() - engine_start_time
+                    archive_wait_duration = 0.0
+                    window_sizes = moved_rows
+                    engine_rows += sum(moved_rows.values())
+                    logger.info("  ✅ 进程内归档完成，共 %s 行，耗时: %.2f秒", sum(moved_rows.values()), api_duration)
                 else:
-                    break
-            archive_wait_duration = time.time() - archive_wait_start
-            logger.info(f"  ✅ 归档任务已完成，等待耗时: {archive_wait_duration:.2f}秒")
+                    api_duration, archive_wait_duration = request_archive_api(target, lock_watcher)
+
+            except (pymysql.Error, redis.RedisError) as e:
+                if not is_connection_lost(e):
+                    raise
+                # 连接断开：重建数据库连接和锁等待器，以数据库中已提交的边界为准继续
+                # 规则是累计的 id < X，提交后未触发的归档窗口会被下一次归档一并处理，不会遗漏
+                logger.warning("  ⚠️  第 %s 次迭代中连接断开: %s，正在重连...", iteration, e)
+                lock_watcher.close()
+                try:
+                    db_connection.close()
+                except Exception:
+                    pass
+                db_connection = connect_database(target)
+                db_cursor = db_connection.cursor()
+                redis_client = connect_redis(target, redis_client)
+                lock_watcher = create_lock_watcher(redis_client, target)
+                boundaries = retry_with_backoff(lambda: load_id_boundaries(db_cursor, header_ids), "重新读取边界")
+                logger.info("  ✓ 重连成功，从第 %s 次迭代继续", current_iteration)
+                continue
+
+            # 按本轮归档耗时调整各表步长，并输出步长和吞吐
+            if step_controller:
+                step_controller.update(window_sizes, api_duration + archive_wait_duration)
+                unit = '行' if archiver else 'id'
+                for header_id, table_name, _ in table_records:
+                    if header_id in window_sizes:
+                        logger.info("  📐 表 %s: 窗口 %s %s, 吞吐 %.1f %s/秒, 下一轮步长 %s",
+                                    table_name, window_sizes[header_id], unit,
+                                    step_controller.throughput.get(header_id, 0.0), unit,
+                                    step_controller.step(header_id),
+                                    extra={'target': target.name, 'table': table_name, 'iteration': iteration,
+                                           'phase': 'step'})
+                save_checkpoint(current_iteration, boundaries, step_controller.steps, target.checkpoint_file)
 
             # 计算本次归档的总耗时
             archive_total_duration = time.time() - archive_start_time
-            execution_times.append({
-                'iteration': iteration,
-                'duration': archive_total_duration,
-                'start_time': datetime.fromtimestamp(archive_start_time),
-                'end_time': datetime.fromtimestamp(time.time())
-            })
-
-            logger.info(f"  📊 本次归档总耗时: {archive_total_duration:.2f}秒 ({archive_total_duration / 60:.2f}分钟)")
-            logger.info(
-                f"  📅 归档时间段: {datetime.fromtimestamp(archive_start_time).strftime('%H:%M:%S')} -> {datetime.fromtimestamp(time.time()).strftime('%H:%M:%S')}")
+            target.metrics.observe_iteration(archive_total_duration)
+            duration_stats.add(archive_total_duration)
+            if longest_iteration is None or archive_total_duration > longest_iteration[1]:
+                longest_iteration = (iteration, archive_total_duration)
+            if shortest_iteration is None or archive_total_duration < shortest_iteration[1]:
+                shortest_iteration = (iteration, archive_total_duration)
+            if run_history:
+                table_stats = [(table_name, boundaries[header_id], steps_used.get(header_id), moved_rows.get(header_id))
+                               for header_id, table_name, _ in table_records if header_id in new_boundaries]
+                # 锁等待记录请求接口后等待归档任务释放锁的时间（即任务持锁时间），不是迭代开始前的检查
+                run_history.record_iteration(iteration, archive_start_time, archive_total_duration,
+                                             archive_wait_duration, api_duration, table_stats, throttle_seconds)
+
+            logger.info("  📊 本次归档总耗时: %.2f秒 (%.2f分钟)", archive_total_duration, archive_total_duration / 60,
+                        extra={'target': target.name, 'iteration': iteration, 'phase': 'iteration',
+                               'duration': archive_total_duration})
+
+            # 更新剩余积压和预计完成时间（不计窗口外休眠的时间）
+            remaining = estimator.remaining(boundaries, upper_bounds)
+            current_steps = {header_id: step_controller.step(header_id) if step_controller else steps_used.get(
+                header_id, ARCHIVE_INCREMENT_VALUE) for header_id in remaining}
+            iterations_needed = estimator.iterations_needed(
+                {header_id: remaining[header_id] for header_id, _, _ in active_records}, current_steps)
+            eta_seconds = estimator.eta_seconds(
+                {header_id: remaining[header_id] for header_id, _, _ in active_records}, boundaries,
+                time.time() - loop_start_time - outside_window_seconds)
+            target.metrics.set_estimate(table_records, remaining, eta_seconds)
+            remaining_rows = sum(remaining[header_id][1] or 0 for header_id, _, _ in active_records)
+            eta_text = (f"，预计 {(datetime.now() + timedelta(seconds=eta_seconds)).strftime('%m-%d %H:%M')} 完成"
+                        if eta_seconds is not None else '')
+            logger.info("  ⏳ 剩余积压: %s 个表，约 %s 行，预计还需 %s 次迭代、%s%s",
+                        len(active_records), remaining_rows, iterations_needed, format_duration(eta_seconds), eta_text,
+                        extra={'target': target.name, 'iteration': iteration, 'phase': 'estimate'})
+            logger.info("  📅 归档时间段: %s -> %s", datetime.fromtimestamp(archive_start_time).strftime('%H:%M:%S'),
+                        datetime.fromtimestamp(time.time()).strftime('%H:%M:%S'))
+
+        # 全部迭代正常结束，删除断点
+        clear_checkpoint(target.checkpoint_file)
 
         # 输出统计摘要
-        logger.info(f"\n{'=' * 70}")
-        logger.info(f"📊 归档任务执行统计摘要")
-        logger.info(f"{'=' * 70}")
-
-        if execution_times:
-            total_duration = sum(item['duration'] for item in execution_times)
-            avg_duration = total_duration / len(execution_times)
-            max_duration = max(execution_times, key=lambda x: x['duration'])
-            min_duration = min(execution_times, key=lambda x: x['duration'])
-
-            logger.info(f"总执行次数: {len(execution_times)}")
-            logger.info(f"总耗时: {total_duration:.2f}秒 ({total_duration / 60:.2f}分钟)")
-            logger.info(f"平均耗时: {avg_duration:.2f}秒 ({avg_duration / 60:.2f}分钟)")
-            logger.info(f"最长耗时: {max_duration['duration']:.2f}秒 (迭代: {max_duration['iteration']})")
-            logger.info(f"最短耗时: {min_duration['duration']:.2f}秒 (迭代: {min_duration['iteration']})")
-
-        logger.info(f"{'=' * 70}")
-        logger.info(f"🎉 所有循环执行完毕！总计处理了 {total_iterations} 次迭代")
-        logger.info(f"{'=' * 70}")
-
+        logger.info("\n" + "=" * 70)
+        logger.info("📊 归档任务执行统计摘要")
+        logger.info("=" * 70)
+
+        if duration_stats.count:
+            total_duration = duration_stats.total
+            avg_duration = duration_stats.mean
+
+            logger.info("总执行次数: %s", duration_stats.count)
+            logger.info("总耗时: %.2f秒 (%.2f分钟)", total_duration, total_duration / 60)
+            logger.info("平均耗时: %.2f秒 (%.2f分钟)", avg_duration, avg_duration / 60)
+            logger.info("耗时分位数: p50 %.2f秒, "
+                        "p95 %.2f秒, p99 %.2f秒",
+                        duration_stats.quantile(0.5), duration_stats.quantile(0.95), duration_stats.quantile(0.99))
+            logger.info("最长耗时: %.2f秒 (迭代: %s)", longest_iteration[1], longest_iteration[0])
+            logger.info("最短耗时: %.2f秒 (迭代: %s)", shortest_iteration[1], shortest_iteration[0])
+        if archiver:
+            logger.info("进程内归档: 共 %s 行", engine_rows)
+        if schedule:
+            logger.info("窗口外休眠: %.2f秒 (%.2f小时)", outside_window_seconds, outside_window_seconds / 3600)
+        if load_guard:
+            logger.info("负载限流: 共 %.2f秒（暂停 %s 次共 %.2f秒，放慢 %.2f秒）",
+                        load_guard.throttled_seconds, load_guard.pauses, load_guard.paused_seconds,
+                        load_guard.slowed_seconds)
+
+        logger.info("=" * 70)
+        logger.info("🎉 所有循环执行完毕！总计处理了 %s 次迭代", current_iteration)
+        logger.info("=" * 70)
+        run_status = 'completed'
+
+    except LockStuckError as e:
+        logger.error("归档锁卡住，已跳过本目标剩余的归档（断点已保留）: %s", e)
+        run_status = 'stuck'
     except pymysql.Error as e:
-        logger.error(f"数据库操作错误: {e}")
+        logger.error("数据库操作错误: %s", e)
     except redis.ConnectionError as e:
-        logger.error(f"Redis 连接错误: {e}")
+        logger.error("Redis 连接错误: %s", e)
     except Exception as e:
-        logger.error(f"脚本执行过程中发生未知错误: {e}")
+        logger.error("脚本执行过程中发生未知错误: %s", e)
         logger.exception("详细错误信息:")  # 记录完整的堆栈跟踪
     finally:
         # 关闭数据库连接
@@ -663,40 +2332,267 @@ def update_and_request():
                 db_connection.close()
                 logger.info("✓ 数据库连接已关闭")
             except Exception as e:
-                logger.error(f"关闭数据库连接时发生错误: {e}")
+                logger.error("关闭数据库连接时发生错误: %s", e)
         # 关闭 Redis 连接
         if redis_client:
             try:
+                if lock_watcher:
+                    lock_watcher.close()
                 logger.info("✓ Redis 连接已处理")
             except Exception as e:
-                logger.error(f"处理 Redis 连接时发生错误: {e}")
+                logger.error("处理 Redis 连接时发生错误: %s", e)
+        if load_guard:
+            load_guard.close()
+        if archiver:
+            archiver.close()
+        if run_history:
+            run_history.finish_run(run_status)
+            run_history.close()
+    return run_status
+
+
+# EXPLAIN 的访问类型中表示没有用索引定位的类型：ALL 为全表扫描，index 为全索引扫描
+FULL_SCAN_ACCESS_TYPES = {'ALL', 'index'}
+# 可以作为复合索引等值前缀的规则运算符，其余运算符（范围、LIKE、不等）只能在等值列之后使用一列
+EQUALITY_OPERATORS = {'=', '<=>', 'IN', 'IS'}
+# 归档条件的格式为 `field` operator %s，见 load_archive_conditions
+CONDITION_PATTERN = re.compile(r'^`(?P<field>[^`]+)`\s+(?P<operator>.+?)\s+%s$')
+
+
+def suggest_archive_index(table_name, where_conditions):
+    """
+    按归档条件建议复合索引：等值条件的列在前（按规则顺序），最后是 created，
+    使 MIN(id) 和可归档上界查询都能变为 (等值列, created) 上的范围扫描；InnoDB 二级索引自带主键，无需加 id
+    返回 (列列表, 建索引语句)
+    """
+    equality_columns = []
+    for condition in where_conditions:
+        match = CONDITION_PATTERN.match(condition)
+        if not match or match.group('field') == 'created':
+            continue
+        if match.group('operator').strip().upper() in EQUALITY_OPERATORS and match.group('field') not in equality_columns:
+            equality_columns.append(match.group('field'))
+    columns = equality_columns + ['created']
+    index_name = f"idx_archive_{'_'.join(columns)}"[:64]
+    column_list = ', '.join(f"`{column}`" for column in columns)
+    return columns, f"ALTER TABLE `{table_name}` ADD INDEX `{index_name}` ({column_list})"
+
+
+def load_table_indexes(db_cursor, table_name):
+    """SHOW INDEX：返回 {索引名: [按顺序的列名]}"""
+    db_cursor.execute(f"SHOW INDEX FROM `{table_name}`")
+    columns = [column[0].lower() for column in db_cursor.description or []]
+    indexes = {}
+    for row in sorted(db_cursor.fetchall(), key=lambda row: (row[columns.index('key_name')],
+                                                             int(row[columns.index('seq_in_index')]))):
+        indexes.setdefault(row[columns.index('key_name')], []).append(row[columns.index('column_name')])
+    return indexes
+
+
+def find_matching_index(indexes, suggested_columns):
+    """已有索引的前缀与建议的列相同（等值列顺序不限，created 紧随其后）时返回该索引名"""
+    equality_columns = set(suggested_columns[:-1])
+    for index_name, index_columns in indexes.items():
+        prefix = index_columns[:len(suggested_columns)]
+        if len(prefix) == len(suggested_columns) and set(prefix[:-1]) == equality_columns \
+                and prefix[-1] == suggested_columns[-1]:
+            return index_name
+    return None
+
+
+def explain_query(db_cursor, table_name, sql, params, analyze=False):
+    """
+    对查询执行 EXPLAIN，返回该表的访问类型、使用的索引和估算行数；
+    analyze 为 True 时再执行 EXPLAIN ANALYZE（MySQL 8.0.18+，会真正执行查询），不支持时记为 None
+    """
+    db_cursor.execute(f"EXPLAIN {sql}", params)
+    columns = [column[0].lower() for column in db_cursor.description or []]
+    rows = [dict(zip(columns, row)) for row in db_cursor.fetchall()]
+    # 多行时取本表的那一行；MIN(id) 被优化掉时 table 为空，取第一行
+    plan = next((row for row in rows if row.get('table') == table_name), rows[0] if rows else {})
+    extra = plan.get('extra') or ''
+    access_type = plan.get('type')
+    result = {
+        'access_type': access_type,
+        'key': plan.get('key'),
+        'possible_keys': plan.get('possible_keys'),
+        'rows': int(plan['rows']) if plan.get('rows') is not None else None,
+        'filtered': float(plan['filtered']) if plan.get('filtered') is not None else None,
+        'extra': extra,
+        'full_scan': access_type in FULL_SCAN_ACCESS_TYPES or (access_type is None and 'optimized away' not in extra),
+    }
+    if analyze:
+        result['analyze'] = None
+        try:
+            db_cursor.execute(f"EXPLAIN ANALYZE {sql}", params)
+            result['analyze'] = "\n".join(str(row[0]) for row in db_cursor.fetchall())
+        except pymysql.Error as e:
+            if is_connection_lost(e):
+                raise
+            logger.warning("  ⚠️  表 %s 不支持 EXPLAIN ANALYZE，只使用 EXPLAIN: %s", table_name, e)
+    return result
+
+
+def explain_target(target, analyze=False):
+    """
+    --explain：为目标中每个 autoArchive=1 的表构建与运行时完全相同的归档条件查询，
+    执行 EXPLAIN 报告访问类型和估算行数，并建议能把查询变为范围扫描的复合索引
+    """
+    report = {'target': target.name, 'tables': [], 'full_scans': 0}
+    connection = pymysql.connect(**target.db_config)
+    try:
+        with connection.cursor() as db_cursor:
+            db_cursor.execute("SELECT id, tableName, archiveDaysBefore FROM ttx_archive_rule_header WHERE autoArchive=1")
+            for header_id, table_name, archive_days_before in db_cursor.fetchall():
+                _, where_conditions, params = load_archive_conditions(db_cursor, header_id, archive_days_before)
+                queries = {
+                    'initial_boundary': build_min_id_query(table_name, where_conditions),
+                    'upper_bound': build_upper_bound_query(table_name, where_conditions),
+                }
+                table_report = {'header_id': header_id, 'table': table_name, 'conditions': where_conditions,
+                                'params': params, 'queries': {}}
+                for name, sql in queries.items():
+                    table_report['queries'][name] = dict(sql=sql, **explain_query(db_cursor, table_name, sql, params,
+                                                                                  analyze))
+                    report['full_scans'] += table_report['queries'][name]['full_scan']
+
+                columns, ddl = suggest_archive_index(table_name, where_conditions)
+                existing_index = find_matching_index(load_table_indexes(db_cursor, table_name), columns)
+                table_report['suggested_index'] = {'columns': columns, 'ddl': None if existing_index else ddl,
+                                                   'existing_index': existing_index}
+                report['tables'].append(table_report)
+                logger.info("  表 %s: %s；%s", table_name,
+                            "，".join("%s %s/%s 估算 %s 行" % (name, plan['access_type'], plan['key'], plan['rows'])
+                                     for name, plan in table_report['queries'].items()),
+                            "已有索引 %s" % existing_index if existing_index else "建议: %s" % ddl)
+    finally:
+        connection.close()
+    return report
 
 
-if __name__ == "__main__":
+def run_explain(targets, analyze=False):
+    """输出所有目标的 EXPLAIN 报告（JSON，写到标准输出），存在全表扫描时返回退出码 1，可用于审核规则变更"""
+    reports = [explain_target(target, analyze) for target in targets]
+    print(json.dumps(reports, ensure_ascii=False, indent=2, default=str))
+    return 1 if any(report['full_scans'] for report in reports) else 0
+
+
+def log_long_connection_support(url):
+    """检查API是否支持长连接并输出结果"""
+    logger.info("\n--- 检查API长连接支持情况 ---")
+    if check_long_connection_support(url):
+        logger.info("✅ API 支持长连接，将使用连接池和会话复用优化性能")
+    else:
+        logger.warning("⚠️  API 可能不支持长连接，但仍将尝试使用连接池")
+
+
+def startup_probe():
+    """
+    --startup-probe：连接第一个目标的数据库执行 SELECT 1 后立即退出，
+    供 startup_benchmark.py 测量各打包方式从启动到首条查询完成的耗时
+    """
+    target = load_targets()[0]
+    result = {'ok': True, 'error': None}
+    try:
+        connection = pymysql.connect(connect_timeout=5, **target.db_config)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute("SELECT 1")
+            db_cursor.fetchone()
+        connection.close()
+    except Exception as e:
+        result = {'ok': False, 'error': str(e)}
+    print(f"STARTUP_PROBE {json.dumps(result, ensure_ascii=False)}", flush=True)
+
+
+def run_target(target, fresh=False):
+    """
+    运行单个归档目标的完整流程（长连接检查、初始化或断点恢复、归档循环），返回运行状态
+    任何异常只影响当前目标，不影响其他并发运行的目标
+    """
+    if threading.current_thread() is not threading.main_thread():
+        threading.current_thread().name = target.name
+    try:
+        # 检查API是否支持长连接：只输出日志，放到后台线程，不阻塞首条数据库查询
+        threading.Thread(target=log_long_connection_support, args=(target.api_url,),
+                         name=f"{target.name}-check", daemon=True).start()
+
+        # 存在断点时跳过初始化，直接从断点继续；--fresh 忽略断点重新初始化
+        checkpoint = None if fresh else load_checkpoint(target.checkpoint_file)
+        if checkpoint:
+            logger.info("\n--- 发现断点文件 %s，跳过初始化步骤 ---\n", target.checkpoint_file)
+        else:
+            # 先执行初始化
+            logger.info("\n--- 开始执行初始化步骤 ---")
+            initialize_and_update(target)
+            logger.info("\n--- 初始化步骤完成，开始执行归档任务 ---\n")
+
+        # 再执行归档任务
+        return update_and_request(target, checkpoint)
+    except Exception as e:
+        logger.error("归档目标 %s 执行失败: %s", target.name, e)
+        logger.exception("详细错误信息:")
+        return 'failed'
+
+
+def parse_arguments():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='WMS 归档任务管理脚本')
+    parser.add_argument('--fresh', action='store_true', help='忽略断点文件，重新初始化后从头执行')
+    parser.add_argument('--report', nargs='?', type=int, const=10, default=None, metavar='N',
+                        help=f'对比 {RUN_HISTORY_FILE} 中最近 N 次运行（默认10次）的耗时分位数和吞吐后退出')
+    parser.add_argument('--startup-probe', action='store_true', help='执行一次 SELECT 1 后退出，用于启动耗时基准测试')
+    parser.add_argument('--explain', action='store_true',
+                        help='对每个归档表的条件查询执行 EXPLAIN，以 JSON 输出访问类型、估算行数和建议的复合索引后退出；'
+                             '存在全表扫描时退出码为 1')
+    parser.add_argument('--explain-analyze', action='store_true',
+                        help='与 --explain 一起使用，同时执行 EXPLAIN ANALYZE（会真正执行查询）')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.report is not None:
+        history = RunHistory(RUN_HISTORY_FILE, RUN_HISTORY_RELATIVE_ACCURACY)
+        print(format_report(history, args.report))
+        history.close()
+        return
+    if args.startup_probe:
+        startup_probe()
+        return
+    if args.explain or args.explain_analyze:
+        raise SystemExit(run_explain(load_targets(), args.explain_analyze))
     start_time = time.time()
     logger.info("=" * 70)
     logger.info("🚀 开始执行 WMS 归档任务管理脚本")
     logger.info("📋 脚本将先进行初始化，然后统计每次归档任务的执行时间")
     logger.info("=" * 70)
 
-    # 检查API是否支持长连接
-    logger.info("\n--- 检查API长连接支持情况 ---")
-    is_long_connection_supported = check_long_connection_support(API_URL)
-    if is_long_connection_supported:
-        logger.info("✅ API 支持长连接，将使用连接池和会话复用优化性能")
-    else:
-        logger.warning("⚠️  API 可能不支持长连接，但仍将尝试使用连接池")
+    targets = load_targets()
+    if len(targets) > 1:
+        # 多个目标并发运行时，在日志中带上目标名（工作线程以目标名命名；JSON Lines 自带 thread 字段）
+        LOG_HANDLE.set_text_format('%(asctime)s | %(levelname)-8s | [%(threadName)s] %(message)s')
 
-    # 先执行初始化
-    logger.info("\n--- 开始执行初始化步骤 ---")
-    initialize_and_update()
-    logger.info("\n--- 初始化步骤完成，开始执行归档任务 ---\n")
+    # 启动可选的 Prometheus 指标服务
+    start_metrics_server()
 
-    # 再执行归档任务
-    update_and_request()
+    if len(targets) == 1:
+        results = {targets[0].name: run_target(targets[0], args.fresh)}
+    else:
+        logger.info("共 %s 个归档目标，最多同时运行 %s 个: %s", len(targets), TARGETS_CONCURRENCY, ', '.join(t.name for t in targets))
+        results = {}
+        with ThreadPoolExecutor(max_workers=TARGETS_CONCURRENCY) as executor:
+            futures = {executor.submit(run_target, target, args.fresh): target for target in targets}
+            for future in as_completed(futures):
+                results[futures[future].name] = future.result()
 
     end_time = time.time()
     duration = end_time - start_time
     logger.info("=" * 70)
-    logger.info(f"🏁 脚本执行完成，总耗时: {duration:.2f} 秒 ({duration / 60:.2f} 分钟)")
+    for name, status in results.items():
+        logger.info("  目标 %s: %s", name, status)
+    logger.info("🏁 脚本执行完成，总耗时: %.2f 秒 (%.2f 分钟)", duration, duration / 60)
     logger.info("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
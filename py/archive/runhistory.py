@@ -0,0 +1,271 @@
+import json
+import math
+import sqlite3
+import time
+from datetime import datetime
+
+# 默认的运行历史文件
+DEFAULT_HISTORY_FILE = 'archive-history.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    target      TEXT NOT NULL DEFAULT 'default',
+    started_at  REAL NOT NULL,
+    finished_at REAL,
+    status      TEXT NOT NULL DEFAULT 'running',
+    iterations  INTEGER NOT NULL DEFAULT 0,
+    rows_moved  INTEGER
+);
+CREATE TABLE IF NOT EXISTS iterations (
+    run_id       INTEGER NOT NULL,
+    iteration    INTEGER NOT NULL,
+    started_at   REAL NOT NULL,
+    duration     REAL NOT NULL,
+    lock_wait    REAL NOT NULL,
+    api_seconds  REAL NOT NULL,
+    rows_moved   INTEGER
+);
+CREATE TABLE IF NOT EXISTS table_iterations (
+    run_id     INTEGER NOT NULL,
+    iteration  INTEGER NOT NULL,
+    table_name TEXT NOT NULL,
+    boundary   INTEGER NOT NULL,
+    step       INTEGER,
+    rows_moved INTEGER
+);
+CREATE TABLE IF NOT EXISTS sketches (
+    run_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    sketch TEXT NOT NULL,
+    PRIMARY KEY (run_id, metric)
+) WITHOUT ROWID;
+"""
+
+
+class QuantileSketch:
+    """
+    对数分桶的分位数草图（DDSketch）：只保存各桶计数，内存与记录数无关，
+    分位数的相对误差不超过 relative_accuracy；同参数的草图可直接合并（桶计数相加）
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            index = math.ceil(math.log(value) / self.log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("只能合并相同精度的草图")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q):
+        """返回第 q 分位数（0 <= q <= 1），没有数据时返回 None"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'bins': {str(index): count for index, count in self.bins.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'])
+        sketch.bins = {int(index): count for index, count in data['bins'].items()}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.total = data['total']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
+
+
+class RunHistory:
+    """
+    归档运行历史：每次迭代和每个表的耗时、步长、归档行数追加写入 SQLite，
+    统计量以分位数草图的形式按运行保存，每次迭代后落盘，进程被杀也不会丢失
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_FILE, relative_accuracy=0.01):
+        self.path = path
+        self.relative_accuracy = relative_accuracy
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.run_id = None
+        self.sketches = {}
+        self.iterations = 0
+        self.rows_moved = None
+
+    def close(self):
+        self.connection.close()
+
+    def start_run(self, target='default'):
+        with self.connection:
+            cursor = self.connection.execute("INSERT INTO runs (target, started_at) VALUES (?, ?)", (target, time.time()))
+        self.run_id = cursor.lastrowid
+        self.sketches = {}
+        self.iterations = 0
+        self.rows_moved = None
+        return self.run_id
+
+    def sketch(self, metric):
+        if metric not in self.sketches:
+            self.sketches[metric] = QuantileSketch(self.relative_accuracy)
+        return self.sketches[metric]
+
+    def record_iteration(self, iteration, started_at, duration, lock_wait, api_seconds, table_stats,
+                         throttle_seconds=0.0):
+        """
+        记录一次迭代；table_stats 为 [(表名, 边界值, 步长, 归档行数)]，行数为实际归档的行数，
+        未知时（通过归档接口归档，接口不返回行数）为 None，不计入行数和吞吐；
+        lock_wait 为请求接口后等待归档任务释放锁的时间，throttle_seconds 为迭代前因数据库负载放慢或暂停的时间
+        """
+        known_rows = [rows for _, _, _, rows in table_stats if rows is not None]
+        rows_moved = sum(known_rows) if known_rows else None
+        self.iterations += 1
+        if rows_moved is not None:
+            self.rows_moved = (self.rows_moved or 0) + rows_moved
+
+        self.sketch('iteration_seconds').add(duration)
+        self.sketch('lock_wait_seconds').add(lock_wait)
+        self.sketch('api_seconds').add(api_seconds)
+        self.sketch('throttle_seconds').add(throttle_seconds)
+        if duration > 0 and rows_moved is not None:
+            self.sketch('rows_per_second').add(rows_moved / duration)
+            for table_name, _, _, rows in table_stats:
+                if rows is not None:
+                    self.sketch(f"table:{table_name}:rows_per_second").add(rows / duration)
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO iterations (run_id, iteration, started_at, duration, lock_wait, api_seconds, rows_moved) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.run_id, iteration, started_at, duration, lock_wait, api_seconds, rows_moved))
+            self.connection.executemany(
+                "INSERT INTO table_iterations (run_id, iteration, table_name, boundary, step, rows_moved) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.run_id, iteration, table_name, boundary, step, rows)
+                 for table_name, boundary, step, rows in table_stats])
+            self._save_sketches()
+
+    def _save_sketches(self):
+        self.connection.executemany(
+            "INSERT INTO sketches (run_id, metric, sketch) VALUES (?, ?, ?) "
+            "ON CONFLICT (run_id, metric) DO UPDATE SET sketch=excluded.sketch",
+            [(self.run_id, metric, json.dumps(sketch.to_dict())) for metric, sketch in self.sketches.items()])
+        self.connection.execute("UPDATE runs SET iterations=?, rows_moved=? WHERE run_id=?",
+                                (self.iterations, self.rows_moved, self.run_id))
+
+    def finish_run(self, status):
+        with self.connection:
+            self.connection.execute("UPDATE runs SET finished_at=?, status=? WHERE run_id=?",
+                                    (time.time(), status, self.run_id))
+
+    def load_sketches(self, run_id):
+        cursor = self.connection.execute("SELECT metric, sketch FROM sketches WHERE run_id=?", (run_id,))
+        return {metric: QuantileSketch.from_dict(json.loads(sketch)) for metric, sketch in cursor.fetchall()}
+
+    def recent_runs(self, limit=10):
+        cursor = self.connection.execute(
+            "SELECT run_id, target, started_at, finished_at, status, iterations, rows_moved FROM runs "
+            "ORDER BY run_id DESC LIMIT ?", (limit,))
+        return list(reversed(cursor.fetchall()))
+
+
+def _format_seconds(value):
+    return '-' if value is None else f"{value:.1f}"
+
+
+def _format_change(current, previous):
+    if current is None or not previous:
+        return ''
+    return f" ({(current - previous) / previous * 100:+.0f}%)"
+
+
+def format_report(history, limit=10):
+    """
+    对比最近 limit 次运行：迭代耗时 p50/p95/p99、吞吐 p50（只在行数已知时统计）、负载限流总时间，以及每个表的吞吐 p50，
+    括号内为相对同一目标上一次运行的变化，用于观察随表增长归档吞吐是否下降
+    """
+    runs = history.recent_runs(limit)
+    if not runs:
+        return "没有运行历史记录"
+
+    lines = [f"{'运行':>6} {'目标':<16} {'开始时间':<19} {'状态':<9} {'迭代':>6} {'归档行数':>10} "
+             f"{'p50(秒)':>9} {'p95(秒)':>9} {'p99(秒)':>9} {'吞吐p50(行/秒)':>20} {'限流(秒)':>10}"]
+    table_lines = []
+    previous = {}
+    previous_tables = {}
+    for run_id, target, started_at, _, status, iterations, rows_moved in runs:
+        sketches = history.load_sketches(run_id)
+        durations = sketches.get('iteration_seconds', QuantileSketch())
+        throughput = sketches.get('rows_per_second', QuantileSketch()).quantile(0.5)
+        p50 = durations.quantile(0.5)
+        lines.append(
+            f"{run_id:>6} {target:<16} {datetime.fromtimestamp(started_at).strftime('%Y-%m-%d %H:%M:%S'):<19} "
+            f"{status:<9} {iterations:>6} {'-' if rows_moved is None else rows_moved:>10} "
+            f"{_format_seconds(p50) + _format_change(p50, previous.get(target, {}).get('p50')):>9} "
+            f"{_format_seconds(durations.quantile(0.95)):>9} {_format_seconds(durations.quantile(0.99)):>9} "
+            f"{_format_seconds(throughput) + _format_change(throughput, previous.get(target, {}).get('throughput')):>20} "
+            f"{_format_seconds(sketches['throttle_seconds'].total if 'throttle_seconds' in sketches else None):>10}")
+        previous[target] = {'p50': p50, 'throughput': throughput}
+
+        for metric, sketch in sorted(sketches.items()):
+            if metric.startswith('table:'):
+                table_name = metric.split(':')[1]
+                table_throughput = sketch.quantile(0.5)
+                table_lines.append(
+                    f"{run_id:>6} {target:<16} {table_name:<40} {_format_seconds(table_throughput)}"
+                    f"{_format_change(table_throughput, previous_tables.get((target, table_name)))}")
+                previous_tables[(target, table_name)] = table_throughput
+
+    if table_lines:
+        lines.append("")
+        lines.append(f"{'运行':>6} {'目标':<16} {'表名':<40} 吞吐p50(行/秒)")
+        lines.extend(table_lines)
+    return "\n".join(lines)
@@ -0,0 +1,585 @@
+"""
+WMS 归档驱动的离线模拟与基准测试
+
+用本地替身运行真实的 main.py 驱动逻辑，不接触生产数据库、Redis 和归档接口：
+- SQLite 承载 ttx_archive_rule_header / ttx_archive_rule_term 和若干合成业务表（行数、id 间隔、created 分布可配置）
+- 进程内的 Redis 替身，支持锁键和 keyspace 通知
+- 本地 HTTP 归档接口：收到请求后持有锁键，持锁时间与 id 窗口内的行数成正比，随后删除窗口内满足条件的行
+运行结束后输出端到端耗时、空闲时间（没有归档任务持锁的时间）和各类语句数，便于可重复地对比不同策略
+
+示例：
+    python simulate.py --tables 3 --rows 200000 --iterations 50
+    python simulate.py --set ADAPTIVE_STEP_ENABLED=false --set BOUNDARY_SEARCH_ENABLED=false
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yaml
+
+import main
+
+RULE_SCHEMA = """
+CREATE TABLE ttx_archive_rule_header (
+    id                INTEGER PRIMARY KEY,
+    tableName         TEXT NOT NULL,
+    autoArchive       INTEGER NOT NULL DEFAULT 1,
+    archiveDaysBefore INTEGER
+);
+CREATE TABLE ttx_archive_rule_term (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    headerId      INTEGER NOT NULL,
+    field         TEXT NOT NULL,
+    operator      TEXT NOT NULL,
+    value         TEXT,
+    created       DATETIME,
+    lastUpdated   DATETIME,
+    createdBy     TEXT,
+    lastUpdatedBy TEXT,
+    UNIQUE (headerId, field, operator)
+);
+"""
+
+SIM_LOCK_KEY = 'sim:archive:lock'
+# 合成表中满足规则条件的状态值
+ARCHIVABLE_STATUS = 9
+
+sqlite3.register_converter('DATETIME', lambda value: datetime.strptime(value.decode()[:19], '%Y-%m-%d %H:%M:%S'))
+
+
+class StatementCounter:
+    """按语句类型统计驱动执行的 SQL 语句数（多个连接、多个线程共享）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, kind):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+EXPLAIN_COLUMNS = ('id', 'select_type', 'table', 'type', 'possible_keys', 'key', 'key_len', 'ref', 'rows',
+                   'filtered', 'Extra')
+SHOW_INDEX_COLUMNS = ('Table', 'Non_unique', 'Key_name', 'Seq_in_index', 'Column_name')
+
+
+def explain_access(details):
+    """把 SQLite EXPLAIN QUERY PLAN 的描述转换为 MySQL EXPLAIN 的 (type, key)"""
+    for detail in details:
+        match = re.match(r'(SCAN|SEARCH) \S+(?: USING (?:COVERING )?INDEX (\S+))?', detail)
+        if not match:
+            continue
+        if 'INTEGER PRIMARY KEY' in detail:
+            return 'range', 'PRIMARY'
+        if match.group(1) == 'SCAN':
+            return ('index', match.group(2)) if match.group(2) else ('ALL', None)
+        # 没有 USING 的 SEARCH 为 MIN/MAX(rowid) 优化，沿主键定位
+        return 'range', match.group(2) or 'PRIMARY'
+    return None, None
+
+
+class LoadProfile:
+    """
+    模拟主库负载：--load-profile "0:80,3:5" 表示开始后 0 秒起 Threads_running 为 80，3 秒起为 5
+    """
+
+    def __init__(self, spec=''):
+        self.points = sorted((float(offset), int(value)) for offset, value in
+                             (item.split(':') for item in spec.split(',') if item))
+        self.started = time.time()
+
+    def threads_running(self):
+        value = 1
+        for offset, point_value in self.points:
+            if time.time() - self.started >= offset:
+                value = point_value
+        return value
+
+
+class SQLiteCursor:
+    """PyMySQL 游标的 SQLite 替身：把 %s 占位符和 MySQL 专有语法转换为 SQLite 语法"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.sqlite.cursor()
+        self.rowcount = -1
+        self._rows = None
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def execute(self, sql, params=None):
+        kind = sql.lstrip().split(None, 1)[0].upper()
+        self.connection.counter.add(kind)
+        self.connection.questions += 1
+        if kind == 'EXPLAIN':
+            # 按 MySQL EXPLAIN 的列返回：访问类型和索引取自 SQLite 的查询计划，rows 用实际行数代替优化器估算；
+            # EXPLAIN ANALYZE 返回一行树形文本
+            query = sql.lstrip()[len('EXPLAIN'):].lstrip()
+            analyze = query.upper().startswith('ANALYZE ')
+            query = translate_sql(query[len('ANALYZE '):] if analyze else query)
+            self.cursor.execute(f"EXPLAIN QUERY PLAN {query}", list(params or []))
+            details = [row[-1] for row in self.cursor.fetchall()]
+            started = time.perf_counter()
+            # 估算行数取满足 WHERE 的行数（去掉选择列、ORDER BY 和 LIMIT），与 MySQL 的 rows 含义一致
+            count_query = re.sub(r'\s+ORDER BY .*$', '', re.sub(r'^SELECT .+? FROM', 'SELECT COUNT(*) FROM', query))
+            self.cursor.execute(count_query, list(params or []))
+            rows = self.cursor.fetchone()[0]
+            table_name = re.search(r'FROM `?(\w+)`?', query).group(1)
+            access_type, key = explain_access(details)
+            if analyze:
+                self.description = [('EXPLAIN',)]
+                self._rows = [(f"-> {'; '.join(details)}  (actual time={(time.perf_counter() - started) * 1000:.3f} "
+                               f"rows={rows} loops=1)",)]
+            else:
+                self.description = [(name,) for name in EXPLAIN_COLUMNS]
+                self._rows = [(1, 'SIMPLE', table_name, access_type, key, key, None, None, rows, 100.0, 'Using where')]
+            return len(self._rows)
+        if kind == 'SHOW' and 'INDEX' in sql.upper():
+            # SHOW INDEX FROM `表名`：INTEGER PRIMARY KEY 记为 PRIMARY(id)，其余取自 SQLite 的索引信息
+            table_name = re.search(r'FROM `?(\w+)`?', sql).group(1)
+            self.description = [(name,) for name in SHOW_INDEX_COLUMNS]
+            self._rows = [(table_name, 0, 'PRIMARY', 1, 'id')]
+            for _, index_name, unique, *_ in self.cursor.execute(f"PRAGMA index_list(`{table_name}`)").fetchall():
+                for seqno, _, column_name in self.cursor.execute(f"PRAGMA index_info(`{index_name}`)").fetchall():
+                    self._rows.append((table_name, 0 if unique else 1, index_name, seqno + 1, column_name))
+            return len(self._rows)
+        if kind == 'SHOW':
+            # 支持 read_session_counters 使用的会话计数（SQLite 没有 Handler_read_* 计数，记为 0）
+            # 和负载保护使用的 Threads_running；模拟库不是副本，SHOW REPLICA STATUS 返回空
+            self.description = None
+            if 'Threads_running' in sql:
+                self._rows = [('Threads_running', str(self.connection.load_profile.threads_running()))]
+            elif 'REPLICA' in sql or 'SLAVE' in sql:
+                self._rows = []
+            else:
+                self._rows = [('Questions', str(self.connection.questions))]
+            return len(self._rows)
+        self._rows = None
+        self.cursor.execute(translate_sql(sql), list(params or []))
+        self.rowcount = self.cursor.rowcount
+        self.description = self.cursor.description
+        return self.rowcount
+
+    def fetchone(self):
+        if self._rows is not None:
+            return self._rows.pop(0) if self._rows else None
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows, self._rows = self._rows, []
+            return rows
+        return self.cursor.fetchall()
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    """PyMySQL 连接的 SQLite 替身"""
+
+    def __init__(self, path, counter, load_profile=None):
+        self.sqlite = sqlite3.connect(path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self.sqlite.create_function('NOW', 0, lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        self.counter = counter
+        self.load_profile = load_profile or LoadProfile()
+        self.questions = 0
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def ping(self, reconnect=True):
+        return True
+
+    def commit(self):
+        self.sqlite.commit()
+
+    def rollback(self):
+        self.sqlite.rollback()
+
+    def close(self):
+        self.sqlite.close()
+
+
+def translate_sql(sql):
+    """把驱动使用的 MySQL 语法转换为 SQLite 语法"""
+    sql = sql.replace('%s', '?').replace(' FOR UPDATE', '')
+    sql = re.sub(r'CREATE TABLE IF NOT EXISTS (\S+) LIKE (\S+)', r'CREATE TABLE IF NOT EXISTS \1 AS SELECT * FROM \2 WHERE 0', sql)
+    sql = sql.replace('ON DUPLICATE KEY UPDATE', 'ON CONFLICT DO UPDATE SET')
+    return re.sub(r'\bVALUES\((\w+)\)', r'excluded.\1', sql)
+
+
+class FakePubSub:
+    """Redis 发布订阅的替身"""
+
+    def __init__(self, server):
+        self.server = server
+        self.channels = set()
+        self.messages = queue.Queue()
+
+    def subscribe(self, *channels):
+        self.channels.update(channels)
+        self.server.subscribers.add(self)
+
+    def get_message(self, ignore_subscribe_messages=True, timeout=0.0):
+        try:
+            return self.messages.get(timeout=timeout) if timeout else self.messages.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.server.subscribers.discard(self)
+
+
+class FakeRedis:
+    """进程内的 Redis 替身：只实现驱动和模拟归档接口用到的命令，删除键时发出 keyspace 通知"""
+
+    def __init__(self):
+        self.keys = {}
+        self.subscribers = set()
+        self._lock = threading.Lock()
+
+    def ping(self):
+        return True
+
+    def exists(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if key in self.keys)
+
+    def set(self, key, value, nx=False, ex=None):
+        # 替身不支持过期时间，ex 只用于兼容调用
+        with self._lock:
+            if nx and key in self.keys:
+                return None
+            self.keys[key] = value
+        return True
+
+    def get(self, key):
+        with self._lock:
+            return self.keys.get(key)
+
+    def ttl(self, key):
+        # 替身不支持过期时间：存在的键返回 -1，不存在返回 -2
+        with self._lock:
+            return -1 if key in self.keys else -2
+
+    def eval(self, script, numkeys, key, expected, *args):
+        # 只支持驱动使用的比较后删除 / 比较后续期脚本（替身没有过期时间，续期只检查持有者）
+        if script not in (main.COMPARE_AND_DELETE_SCRIPT, main.COMPARE_AND_EXPIRE_SCRIPT):
+            raise NotImplementedError("FakeRedis 只支持 COMPARE_AND_DELETE_SCRIPT 和 COMPARE_AND_EXPIRE_SCRIPT")
+        with self._lock:
+            if self.keys.get(key) != expected:
+                return 0
+        if script == main.COMPARE_AND_EXPIRE_SCRIPT:
+            return 1
+        return self.delete(key)
+
+    def delete(self, *keys):
+        with self._lock:
+            deleted = [key for key in keys if self.keys.pop(key, None) is not None]
+        for key in deleted:
+            self.publish(f"__keyspace@0__:{key}", 'del')
+        return len(deleted)
+
+    def publish(self, channel, data):
+        for pubsub in list(self.subscribers):
+            if channel in pubsub.channels:
+                pubsub.messages.put({'type': 'message', 'channel': channel, 'data': data})
+
+    def config_get(self, name):
+        return {name: 'Kgx'}
+
+    def config_set(self, name, value):
+        return True
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+
+class FakeArchiveService:
+    """
+    模拟归档接口：收到 POST 后立即持有锁键，按 id < X 窗口内满足条件的行数计算持锁时间，
+    到时删除这些行并释放锁键；记录每次归档的行数和持锁时间
+    """
+
+    def __init__(self, db_path, redis_client, lock_key, base_seconds, seconds_per_row, crash_job=None, drop_trigger=None):
+        self.db_path = db_path
+        # 故障注入：第 crash_job 次归档任务崩溃且不释放锁（锁没有过期时间），第 drop_trigger 次请求被丢弃
+        self.crash_job = crash_job
+        self.drop_trigger = drop_trigger
+        self.triggers = 0
+        self.redis_client = redis_client
+        self.lock_key = lock_key
+        self.base_seconds = base_seconds
+        self.seconds_per_row = seconds_per_row
+        self.jobs = []
+        self._lock = threading.Lock()
+        self.server = None
+
+    def trigger(self):
+        with self._lock:
+            self.triggers += 1
+            if self.triggers == self.drop_trigger:
+                return True
+            if self.redis_client.exists(self.lock_key):
+                return False
+            self.redis_client.set(self.lock_key, f"archive-job-{self.triggers}")
+            if self.triggers == self.crash_job:
+                return True
+        threading.Thread(target=self._run_job, daemon=True).start()
+        return True
+
+    def _run_job(self):
+        start = time.time()
+        rows = 0
+        rule_connection = SQLiteConnection(self.db_path, StatementCounter())
+        connection = rule_connection.sqlite
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT id, tableName, archiveDaysBefore FROM ttx_archive_rule_header WHERE autoArchive=1")
+            plans = []
+            for header_id, table_name, archive_days_before in cursor.fetchall():
+                cursor.execute("SELECT value FROM ttx_archive_rule_term WHERE headerId=? AND field='id' AND operator='<'",
+                               (header_id,))
+                row = cursor.fetchone()
+                if not row:
+                    continue
+                _, where_conditions, params = main.load_archive_conditions(
+                    rule_connection.cursor(), header_id, archive_days_before)
+                where_clause = ' AND '.join(['id < ?'] + [condition.replace('%s', '?') for condition in where_conditions])
+                plans.append((table_name, where_clause, [int(row[0])] + params))
+
+            for table_name, where_clause, params in plans:
+                cursor.execute(f"SELECT COUNT(*) FROM `{table_name}` WHERE {where_clause}", params)
+                rows += cursor.fetchone()[0]
+            time.sleep(self.base_seconds + rows * self.seconds_per_row)
+            for table_name, where_clause, params in plans:
+                cursor.execute(f"DELETE FROM `{table_name}` WHERE {where_clause}", params)
+            connection.commit()
+        finally:
+            connection.close()
+            with self._lock:
+                self.jobs.append({'rows': rows, 'seconds': time.time() - start})
+            self.redis_client.delete(self.lock_key)
+
+    def start(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.send_response(200)
+                self.end_headers()
+
+            def do_POST(self):
+                accepted = service.trigger()
+                self.send_response(200 if accepted else 409)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/archive"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+
+
+def create_database(path, tables, rows, id_gap, span_days, archive_days_before, match_ratio, disorder_ratio, seed):
+    """
+    创建规则表和合成业务表：id 以 1~id_gap 的随机间隔递增，created 在 span_days 天内随 id 线性增长，
+    disorder_ratio 比例的行 created 随机打乱（模拟补录），match_ratio 比例的行满足规则条件 status = 9
+    """
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    connection.executescript(RULE_SCHEMA)
+    start = datetime.now() - timedelta(days=span_days)
+    for index in range(tables):
+        table_name = f"sim_table_{index + 1}"
+        connection.execute(f"CREATE TABLE `{table_name}` (id INTEGER PRIMARY KEY, created DATETIME NOT NULL, "
+                           f"status INTEGER NOT NULL, payload TEXT)")
+
+        def generate():
+            current_id = 0
+            for position in range(rows):
+                current_id += rng.randint(1, id_gap)
+                if rng.random() < disorder_ratio:
+                    created = start + timedelta(seconds=rng.uniform(0, span_days * 86400))
+                else:
+                    created = start + timedelta(seconds=span_days * 86400 * position / rows)
+                status = ARCHIVABLE_STATUS if rng.random() < match_ratio else 1
+                yield current_id, created.strftime('%Y-%m-%d %H:%M:%S'), status, 'x' * 32
+
+        connection.executemany(f"INSERT INTO `{table_name}` VALUES (?, ?, ?, ?)", generate())
+        connection.execute("INSERT INTO ttx_archive_rule_header (id, tableName, autoArchive, archiveDaysBefore) "
+                           "VALUES (?, ?, 1, ?)", (index + 1, table_name, archive_days_before))
+        connection.execute("INSERT INTO ttx_archive_rule_term (headerId, field, operator, value, createdBy, lastUpdatedBy) "
+                           "VALUES (?, 'status', '=', ?, 'SIM', 'SIM')", (index + 1, str(ARCHIVABLE_STATUS)))
+    connection.commit()
+    connection.close()
+
+
+def count_remaining(path):
+    """统计仍满足归档条件（规则条件 + created < 阈值）的行数"""
+    connection = sqlite3.connect(path)
+    remaining = 0
+    for _, table_name, archive_days_before in connection.execute(
+            "SELECT id, tableName, archiveDaysBefore FROM ttx_archive_rule_header").fetchall():
+        threshold = datetime.combine((datetime.now() - timedelta(days=archive_days_before)).date(), datetime.min.time())
+        remaining += connection.execute(f"SELECT COUNT(*) FROM `{table_name}` WHERE status=? AND created < ?",
+                                        (ARCHIVABLE_STATUS, threshold.strftime('%Y-%m-%d %H:%M:%S'))).fetchone()[0]
+    connection.close()
+    return remaining
+
+
+def apply_overrides(overrides):
+    """--set NAME=VALUE：覆盖 main 模块中的配置常量，用于对比不同策略"""
+    for override in overrides:
+        name, _, raw_value = override.partition('=')
+        if not hasattr(main, name):
+            raise SystemExit(f"main 中没有配置项 {name}")
+        setattr(main, name, yaml.safe_load(raw_value))
+
+
+def run_simulation(args):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='archive-sim-')
+    os.makedirs(work_dir, exist_ok=True)
+    db_path = os.path.join(work_dir, 'sim.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    create_database(db_path, args.tables, args.rows, args.id_gap, args.span_days, args.archive_days_before,
+                    args.match_ratio, args.disorder_ratio, args.seed)
+    initial_remaining = count_remaining(db_path)
+    if args.index:
+        # 在每个合成表上创建二级索引，用于对比 --explain 的结果
+        connection = sqlite3.connect(db_path)
+        for (table_name,) in connection.execute("SELECT tableName FROM ttx_archive_rule_header").fetchall():
+            connection.execute(f"CREATE INDEX `idx_{table_name}_sim` ON `{table_name}` ({args.index})")
+        connection.commit()
+        connection.close()
+
+    counter = StatementCounter()
+    fake_redis = FakeRedis()
+    service = FakeArchiveService(db_path, fake_redis, SIM_LOCK_KEY, args.base_seconds, args.seconds_per_row,
+                                 args.crash_job, args.drop_trigger)
+    api_url = service.start()
+
+    # 用本地替身替换数据库和 Redis 连接，驱动逻辑保持不变
+    load_profile = LoadProfile(args.load_profile)
+    main.pymysql.connect = lambda **kwargs: SQLiteConnection(db_path, counter, load_profile)
+    main.redis.Redis = lambda **kwargs: fake_redis
+    main.total_iterations = args.iterations
+    main.RUN_HISTORY_ENABLED = bool(args.history)
+    main.RUN_HISTORY_FILE = args.history or main.RUN_HISTORY_FILE
+    apply_overrides(args.set)
+
+    sim_config = {
+        'database': {'host': 'sqlite', 'port': 0, 'user': 'sim', 'password': '', 'database': db_path, 'charset': 'utf8mb4'},
+        'redis': {'host': 'fake', 'port': 0, 'password': None, 'db': 0, 'decode_responses': True},
+        'api': {'url': api_url},
+        'lock': {'key': SIM_LOCK_KEY, 'wait_seconds': 30},
+    }
+    target = main.ArchiveTarget('simulation', sim_config)
+    target.checkpoint_file = os.path.join(work_dir, 'archive-checkpoint.json')
+
+    if args.explain:
+        service.stop()
+        return {'explain': main.explain_target(target, analyze=True), 'work_dir': work_dir}
+
+    start = time.time()
+    status = main.run_target(target, fresh=True)
+    run_seconds = time.time() - start
+    service.stop()
+
+    lock_held = sum(job['seconds'] for job in service.jobs)
+    remaining_after = count_remaining(db_path)
+    return {
+        'status': status,
+        'run_seconds': round(run_seconds, 3),
+        'archive_jobs': len(service.jobs),
+        'lock_held_seconds': round(lock_held, 3),
+        'dead_seconds': round(run_seconds - lock_held, 3),
+        # 归档接口和进程内归档引擎都只移走满足条件的行，按前后差值统计
+        'rows_archived': initial_remaining - remaining_after,
+        'rows_eligible_before': initial_remaining,
+        'rows_eligible_after': remaining_after,
+        'statements': counter.total,
+        'statements_by_kind': dict(sorted(counter.counts.items())),
+        'work_dir': work_dir,
+    }
+
+
+# 解析命令行参数
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='WMS 归档驱动离线模拟与基准测试')
+    parser.add_argument('--tables', type=int, default=3, help='合成业务表数量，默认为3')
+    parser.add_argument('--rows', type=int, default=100000, help='每个表的行数，默认为100000')
+    parser.add_argument('--id-gap', type=int, default=3, help='相邻 id 的最大间隔（1~N 随机），默认为3')
+    parser.add_argument('--span-days', type=int, default=365, help='created 覆盖的天数，默认为365')
+    parser.add_argument('--archive-days-before', type=int, default=90, help='归档天数（archiveDaysBefore），默认为90')
+    parser.add_argument('--match-ratio', type=float, default=0.8, help='满足规则条件的行比例，默认为0.8')
+    parser.add_argument('--disorder-ratio', type=float, default=0.0, help='created 随机打乱的行比例，默认为0')
+    parser.add_argument('--iterations', type=lambda value: value if value == 'auto' else int(value), default=50,
+                        help='驱动的迭代次数，auto 表示运行到追平，默认为50')
+    parser.add_argument('--base-seconds', type=float, default=0.05, help='模拟归档任务的固定耗时（秒），默认为0.05')
+    parser.add_argument('--seconds-per-row', type=float, default=0.00001, help='模拟归档任务每行耗时（秒），默认为0.00001')
+    parser.add_argument('--load-profile', default='', metavar='SECONDS:THREADS,...',
+                        help='模拟主库 Threads_running 随时间的变化，如 "0:80,3:5"，用于观察负载保护的暂停和放慢')
+    parser.add_argument('--crash-job', type=int, default=None, metavar='N',
+                        help='第 N 次请求的归档任务崩溃且不释放锁，用于验证 lock_wait.stale_policy')
+    parser.add_argument('--drop-trigger', type=int, default=None, metavar='N',
+                        help='第 N 次请求返回成功但不启动归档任务（触发丢失）')
+    parser.add_argument('--index', default=None, metavar='COLUMNS',
+                        help='在每个合成表上创建二级索引，如 "status, created"')
+    parser.add_argument('--explain', action='store_true',
+                        help='不运行归档，只输出 main.py --explain 的报告（含 EXPLAIN ANALYZE）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子，保证结果可重复')
+    parser.add_argument('--work-dir', default=None, help='模拟数据库和断点文件的目录，默认为临时目录')
+    parser.add_argument('--history', default=None, help='把本次模拟写入指定的运行历史文件（可用 main.py --report 对比）')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='覆盖 main.py 的配置常量，如 ADAPTIVE_STEP_ENABLED=false，可重复')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    return parser.parse_args()
+
+
+def main_entry():
+    args = parse_arguments()
+    result = run_simulation(args)
+    if args.json or args.explain:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    print(f"\n{'=' * 60}")
+    print(f"模拟结果（{result['status']}）")
+    print(f"  端到端耗时:   {result['run_seconds']:.2f}秒")
+    print(f"  归档任务:     {result['archive_jobs']} 次，持锁 {result['lock_held_seconds']:.2f}秒")
+    print(f"  空闲时间:     {result['dead_seconds']:.2f}秒（无归档任务持锁）")
+    print(f"  归档行数:     {result['rows_archived']} / 初始可归档 {result['rows_eligible_before']}，"
+          f"剩余 {result['rows_eligible_after']}")
+    print(f"  SQL 语句数:   {result['statements']} {result['statements_by_kind']}")
+    print(f"  工作目录:     {result['work_dir']}")
+
+
+if __name__ == "__main__":
+    main_entry()
@@ -0,0 +1,174 @@
+"""
+WMS 归档工具的启动耗时基准测试
+
+对每种打包方式重复执行 `--startup-probe`（连接数据库执行一次 SELECT 1 后退出），
+测量从进程启动到首条查询完成的耗时。首次运行（冷启动）单独列出：
+onefile 每次都要解压到临时目录，zipapp 只在首次运行时解压依赖到缓存目录。
+
+示例：
+    python startup_benchmark.py --runs 10
+    python startup_benchmark.py --mode source --mode zipapp --importtime
+    python startup_benchmark.py --command custom="/opt/wms/wms-archive-tool-linux"
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROBE_PREFIX = 'STARTUP_PROBE '
+
+
+def default_commands(dist_dir):
+    """按 build.py 的输出目录约定查找各打包方式的产物，不存在的跳过"""
+    if platform.system() == "Windows":
+        exe_name = "wms-archive-tool.exe"
+    elif platform.system() == "Darwin":
+        exe_name = "wms-archive-tool-mac"
+    else:
+        exe_name = "wms-archive-tool-linux"
+    platform_dir = Path(dist_dir) / platform.system().lower()
+
+    commands = {'source': [sys.executable, 'main.py']}
+    exe_path = platform_dir / exe_name
+    if exe_path.is_file():
+        commands['onefile'] = [str(exe_path)]
+    elif exe_path.is_dir() and (exe_path / exe_name).is_file():
+        commands['onedir'] = [str(exe_path / exe_name)]
+    zipapp_path = platform_dir / "wms-archive-tool.pyz"
+    if zipapp_path.is_file():
+        commands['zipapp'] = [sys.executable, str(zipapp_path)]
+    return commands
+
+
+def run_probe(command, env, timeout):
+    """启动一次进程，返回 (到探测输出的耗时, 探测结果)"""
+    started = time.perf_counter()
+    process = subprocess.Popen(command + ['--startup-probe'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               text=True, env=env)
+    result = None
+    elapsed = None
+    try:
+        for line in process.stdout:
+            if line.startswith(PROBE_PREFIX):
+                elapsed = time.perf_counter() - started
+                result = json.loads(line[len(PROBE_PREFIX):])
+                break
+        process.wait(timeout=timeout)
+    finally:
+        if process.poll() is None:
+            process.kill()
+    return elapsed, result
+
+
+def benchmark(name, command, runs, timeout):
+    """
+    重复运行 runs 次；zipapp 使用新的缓存目录，使首次运行包含解压依赖的开销
+    """
+    env = dict(os.environ)
+    cache_dir = None
+    if name == 'zipapp':
+        cache_dir = tempfile.mkdtemp(prefix='wms-archive-cache-')
+        env['WMS_ARCHIVE_CACHE'] = cache_dir
+
+    timings = []
+    errors = []
+    try:
+        for _ in range(runs):
+            elapsed, result = run_probe(command, env, timeout)
+            if elapsed is None:
+                errors.append('进程未输出探测结果')
+                continue
+            if not result.get('ok'):
+                errors.append(result.get('error'))
+            timings.append(elapsed)
+    finally:
+        if cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    warm = timings[1:]
+    return {
+        'mode': name,
+        'command': ' '.join(command),
+        'runs': len(timings),
+        'cold': round(timings[0], 3) if timings else None,
+        'warm_min': round(min(warm), 3) if warm else None,
+        'warm_median': round(statistics.median(warm), 3) if warm else None,
+        'warm_max': round(max(warm), 3) if warm else None,
+        'errors': sorted(set(filter(None, errors))),
+    }
+
+
+def import_profile(limit=15):
+    """用 -X importtime 统计源码方式启动时累计耗时最多的导入，检查是否有不必要的提前导入"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', 'main.py', '--startup-probe'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( +)(\S+)', line)
+        # 只统计顶层导入（缩进为一个空格），其累计耗时已包含子模块
+        if match and len(match.group(3)) == 1:
+            entries.append((int(match.group(2)), match.group(4)))
+    return sorted(entries, reverse=True)[:limit]
+
+
+def format_results(results):
+    lines = [f"{'方式':<10} {'次数':>4} {'冷启动(秒)':>12} {'热启动min':>10} {'热启动p50':>10} {'热启动max':>10}"]
+    for result in results:
+        def value(key):
+            return '-' if result[key] is None else f"{result[key]:.3f}"
+        lines.append(f"{result['mode']:<10} {result['runs']:>4} {value('cold'):>12} {value('warm_min'):>10} "
+                     f"{value('warm_median'):>10} {value('warm_max'):>10}")
+        for error in result['errors']:
+            lines.append(f"{'':<10} 探测失败: {error}")
+    return "\n".join(lines)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='WMS 归档工具各打包方式的启动耗时基准测试（启动到首条查询完成）')
+    parser.add_argument('--runs', type=int, default=5, help='每种方式的运行次数，第一次计为冷启动，默认5次')
+    parser.add_argument('--mode', action='append', default=None,
+                        help='只测试指定方式（source/onefile/onedir/zipapp），可重复指定')
+    parser.add_argument('--command', action='append', default=[], metavar='NAME=CMD',
+                        help='追加自定义命令，如 prod="/opt/wms/wms-archive-tool-linux"')
+    parser.add_argument('--dist-dir', default='dist', help='build.py 的输出目录，默认为 dist')
+    parser.add_argument('--timeout', type=float, default=60, help='单次运行的超时时间（秒）')
+    parser.add_argument('--importtime', action='store_true', help='同时输出源码方式启动时耗时最多的导入')
+    parser.add_argument('--json', action='store_true', help='以 JSON 格式输出结果')
+    return parser.parse_args()
+
+
+def main_entry():
+    args = parse_arguments()
+    commands = default_commands(args.dist_dir)
+    for item in args.command:
+        name, _, command = item.partition('=')
+        commands[name] = shlex.split(command)
+    if args.mode:
+        missing = [mode for mode in args.mode if mode not in commands]
+        if missing:
+            print(f"未找到以下打包方式的产物，请先运行 build.py --mode: {', '.join(missing)}", file=sys.stderr)
+        commands = {name: command for name, command in commands.items() if name in args.mode}
+
+    results = [benchmark(name, command, args.runs, args.timeout) for name, command in commands.items()]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(format_results(results))
+
+    if args.importtime:
+        print("\n源码方式耗时最多的顶层导入（累计，微秒）:")
+        for cumulative, module in import_profile():
+            print(f"{cumulative:>10}  {module}")
+
+
+if __name__ == "__main__":
+    main_entry()
@@ -0,0 +1,368 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Set
+
+# 配置日志格式
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(threadName)s] %(levelname)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Dockerfile 所在目录，构建上下文为仓库根目录（COPY 使用 docker-images/xxx 路径）
+DOCKERFILE_DIR = 'docker-images'
+BUILD_CONTEXT = '.'
+
+# 各 Dockerfile 产出的镜像标签和平台，与 .github/workflows/tengine*.yaml 保持一致
+BUILD_TARGETS = {
+    'tengine-base': {'tag': 'tengine:base-latest', 'platforms': 'linux/amd64,linux/arm64'},
+    'tengine-wms': {'tag': 'tengine:wms-base-latest', 'platforms': 'linux/amd64'},
+    'tengine-ots': {'tag': 'tengine:ots-base-latest', 'platforms': 'linux/amd64'},
+    'tengine': {'tag': 'tengine:latest', 'platforms': 'linux/amd64'},
+    'linux_amd64/tengine-base': {'tag': 'tengine:linux_amd64-base-latest', 'platforms': 'linux/amd64'},
+    'linux_amd64/tengine-wms-base': {'tag': 'tengine:linux_amd64-wms-base-latest', 'platforms': 'linux/amd64'},
+    'linux_amd64/tengine-ots-base': {'tag': 'tengine:linux_amd64-ots-base-latest', 'platforms': 'linux/amd64'},
+}
+
+DEFAULT_CACHE_DIR = '.buildcache'
+FINGERPRINT_FILE = 'fingerprints.json'
+
+
+class BuildNode:
+    """DAG 中的一个节点：一个 Dockerfile 及其产出的镜像"""
+
+    def __init__(self, name: str, dockerfile: str, tag: str, platforms: str):
+        self.name = name
+        self.dockerfile = dockerfile
+        self.tag = tag
+        self.platforms = platforms
+        self.base_images: List[str] = []
+        self.copy_sources: List[str] = []
+        self.parents: Dict[str, str] = {}  # 父节点名 -> Dockerfile 中引用的 FROM 镜像
+        self.fingerprint = ''
+        self.status = 'pending'
+        self.duration = 0.0
+
+
+# 读取 Dockerfile 指令，合并以反斜杠续行的行
+def read_instructions(dockerfile: str) -> List[str]:
+    instructions = []
+    current = ''
+    with open(dockerfile, 'r', encoding='utf-8') as f:
+        for raw_line in f:
+            line = raw_line.strip()
+            if not current and (not line or line.startswith('#')):
+                continue
+            if line.endswith('\\'):
+                current += line[:-1] + ' '
+                continue
+            current += line
+            instructions.append(current.strip())
+            current = ''
+    if current:
+        instructions.append(current.strip())
+    return instructions
+
+
+# 解析 FROM 基础镜像和 COPY/ADD 的本地输入文件
+def parse_dockerfile(node: BuildNode):
+    stages: Set[str] = set()
+    for instruction in read_instructions(node.dockerfile):
+        keyword, _, rest = instruction.partition(' ')
+        keyword = keyword.upper()
+        if keyword == 'FROM':
+            tokens = [token for token in rest.split() if not token.startswith('--')]
+            if tokens and tokens[0] not in stages:
+                node.base_images.append(tokens[0])
+            if len(tokens) >= 3 and tokens[1].upper() == 'AS':
+                stages.add(tokens[2])
+        elif keyword in ('COPY', 'ADD'):
+            rest = rest.strip()
+            if rest.startswith('['):
+                tokens = json.loads(rest)
+            else:
+                tokens = shlex.split(rest)
+            if any(token.startswith('--from') for token in tokens):
+                continue
+            tokens = [token for token in tokens if not token.startswith('--')]
+            node.copy_sources.extend(token for token in tokens[:-1] if '://' not in token)
+
+
+# 扫描 docker-images 目录，按 FROM 关系建立依赖图
+def load_graph(dockerfile_dir: str = DOCKERFILE_DIR) -> Dict[str, BuildNode]:
+    nodes = {}
+    for name, target in BUILD_TARGETS.items():
+        dockerfile = os.path.join(dockerfile_dir, name)
+        if not os.path.exists(dockerfile):
+            logger.warning("Dockerfile 不存在，已跳过: %s", dockerfile)
+            continue
+        node = BuildNode(name, dockerfile, target['tag'], target['platforms'])
+        parse_dockerfile(node)
+        nodes[name] = node
+
+    # FROM 镜像的 仓库名:标签 与某个节点的产出标签一致时，视为依赖该节点（忽略仓库地址）
+    producers = {node.tag: node.name for node in nodes.values()}
+    for node in nodes.values():
+        for base_image in node.base_images:
+            parent = producers.get(base_image.split('/')[-1])
+            if parent and parent != node.name:
+                node.parents[parent] = base_image
+
+    check_acyclic(nodes)
+    return nodes
+
+
+def check_acyclic(nodes: Dict[str, BuildNode]):
+    visiting, done = set(), set()
+
+    def visit(name: str):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dockerfile 之间存在循环依赖: {name}")
+        visiting.add(name)
+        for parent in nodes[name].parents:
+            visit(parent)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in nodes:
+        visit(name)
+
+
+# 按拓扑顺序计算指纹：Dockerfile、COPY 输入、构建参数和父节点指纹，任一变化都会触发重建
+def compute_fingerprints(nodes: Dict[str, BuildNode], build_args: List[str]):
+    def fingerprint(node: BuildNode) -> str:
+        if node.fingerprint:
+            return node.fingerprint
+        digest = hashlib.sha256()
+        with open(node.dockerfile, 'rb') as f:
+            digest.update(f.read())
+        for arg in sorted(build_args):
+            digest.update(arg.encode('utf-8'))
+        for path in sorted(expand_sources(node.copy_sources)):
+            digest.update(path.encode('utf-8'))
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+            else:
+                logger.warning("%s: COPY 输入不存在: %s", node.name, path)
+                digest.update(b'<missing>')
+        for parent in sorted(node.parents):
+            digest.update(fingerprint(nodes[parent]).encode('utf-8'))
+        node.fingerprint = digest.hexdigest()
+        return node.fingerprint
+
+    for node in nodes.values():
+        fingerprint(node)
+
+
+# 展开 COPY 源路径中的通配符和目录
+def expand_sources(sources: List[str]) -> List[str]:
+    paths = []
+    for source in sources:
+        matches = glob.glob(os.path.join(BUILD_CONTEXT, source)) or [os.path.join(BUILD_CONTEXT, source)]
+        for match in matches:
+            if os.path.isdir(match):
+                for root, _, files in os.walk(match):
+                    paths.extend(os.path.join(root, file) for file in files)
+            else:
+                paths.append(match)
+    return [os.path.normpath(path) for path in paths]
+
+
+# 补全镜像仓库地址和命名空间
+def full_tag(tag: str, registry: Optional[str], namespace: Optional[str]) -> str:
+    if registry and namespace:
+        return f"{registry}/{namespace}/{tag}"
+    return tag
+
+
+# 把 xxx-latest / latest 标签替换为版本号标签，如 tengine:base-latest -> tengine:base-v0.3
+def version_tag(tag: str, version: str) -> str:
+    repository, _, name = tag.rpartition(':')
+    if name == 'latest':
+        return f"{repository}:{version}"
+    return f"{repository}:{re.sub(r'latest$', version, name)}"
+
+
+# 构建单个节点
+def build_node(node: BuildNode, nodes: Dict[str, BuildNode], args) -> bool:
+    registry = os.getenv('ALIYUN_REGISTRY')
+    namespace = os.getenv('ALIYUN_NAME_SPACE')
+    cache_dir = os.path.join(args.cache_dir, node.name.replace('/', '__'))
+    new_cache_dir = f"{cache_dir}.new"
+
+    command = ['docker', 'buildx', 'build', '-f', node.dockerfile,
+               '-t', full_tag(node.tag, registry, namespace)]
+    if args.version:
+        command.extend(['-t', full_tag(version_tag(node.tag, args.version), registry, namespace)])
+    if args.push:
+        command.extend(['--platform', node.platforms, '--push'])
+    else:
+        # 多平台镜像无法加载到本地，未推送时只构建本机平台
+        command.append('--load')
+    for build_arg in args.build_arg:
+        command.extend(['--build-arg', build_arg])
+    # 父节点在本次构建中产出时，用命名上下文覆盖 FROM，保证子节点基于刚构建的父镜像
+    for parent, base_image in node.parents.items():
+        parent_tag = full_tag(nodes[parent].tag, registry, namespace)
+        command.extend(['--build-context', f"{base_image}=docker-image://{parent_tag}"])
+    if not args.no_cache:
+        if os.path.isdir(cache_dir):
+            command.extend(['--cache-from', f"type=local,src={cache_dir}"])
+        command.extend(['--cache-to', f"type=local,dest={new_cache_dir},mode=max"])
+    command.append(BUILD_CONTEXT)
+
+    logger.info("开始构建 %s: %s", node.name, ' '.join(command))
+    start = time.time()
+    try:
+        subprocess.run(command, check=True)
+    except subprocess.CalledProcessError as e:
+        node.duration = time.time() - start
+        logger.error("构建 %s 失败: %s", node.name, e)
+        return False
+    node.duration = time.time() - start
+
+    # 用新导出的缓存替换旧缓存，避免本地缓存无限增长
+    if os.path.isdir(new_cache_dir):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(new_cache_dir, cache_dir)
+    logger.info("构建 %s 完成，耗时 %.1fs", node.name, node.duration)
+    return True
+
+
+# 未变化的节点不重建，只在仓库中为已有镜像追加版本号标签
+def retag_node(node: BuildNode, version: str) -> bool:
+    registry = os.getenv('ALIYUN_REGISTRY')
+    namespace = os.getenv('ALIYUN_NAME_SPACE')
+    source = full_tag(node.tag, registry, namespace)
+    target = full_tag(version_tag(node.tag, version), registry, namespace)
+    logger.info("%s 未变化，追加标签: %s", node.name, target)
+    try:
+        subprocess.run(['docker', 'buildx', 'imagetools', 'create', '-t', target, source], check=True)
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error("为 %s 追加标签失败: %s", node.name, e)
+        return False
+
+
+# 选出需要构建的节点：指定目标及其全部祖先
+def select_nodes(nodes: Dict[str, BuildNode], targets: List[str]) -> Dict[str, BuildNode]:
+    if not targets:
+        return nodes
+    selected = {}
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in nodes:
+            raise ValueError(f"未知的构建目标: {name}，可选: {', '.join(nodes)}")
+        if name not in selected:
+            selected[name] = nodes[name]
+            stack.extend(nodes[name].parents)
+    return selected
+
+
+def load_fingerprints(cache_dir: str) -> Dict[str, str]:
+    path = os.path.join(cache_dir, FINGERPRINT_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_fingerprints(cache_dir: str, fingerprints: Dict[str, str]):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, FINGERPRINT_FILE)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(fingerprints, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+# 按依赖关系并行构建：父节点完成后子节点才会开始，互不依赖的节点同时构建
+def build_graph(nodes: Dict[str, BuildNode], args) -> bool:
+    previous = load_fingerprints(args.cache_dir)
+    fingerprints = dict(previous)
+
+    for node in nodes.values():
+        if not args.force and previous.get(node.name) == node.fingerprint:
+            node.status = 'unchanged'
+            if args.push and args.version and not retag_node(node, args.version):
+                node.status = 'failed'
+
+    with ThreadPoolExecutor(max_workers=args.jobs, thread_name_prefix='build') as executor:
+        running = {}
+        while True:
+            for node in nodes.values():
+                if node.status != 'pending':
+                    continue
+                parent_states = [nodes[parent].status for parent in node.parents if parent in nodes]
+                if any(state in ('failed', 'skipped') for state in parent_states):
+                    node.status = 'skipped'
+                    logger.warning("%s 的父镜像构建失败，已跳过", node.name)
+                elif all(state in ('built', 'unchanged') for state in parent_states):
+                    node.status = 'running'
+                    running[executor.submit(build_node, node, nodes, args)] = node
+
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                node.status = 'built' if future.result() else 'failed'
+                if node.status == 'built':
+                    fingerprints[node.name] = node.fingerprint
+                    save_fingerprints(args.cache_dir, fingerprints)
+
+    logger.info("=" * 60)
+    logger.info("构建耗时统计")
+    for node in nodes.values():
+        logger.info("  %-32s %-10s %8.1fs", node.name, node.status, node.duration)
+    logger.info("=" * 60)
+    return all(node.status in ('built', 'unchanged') for node in nodes.values())
+
+
+# 解析命令行参数
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='按 FROM 依赖关系并行构建 docker-images 下的 Tengine 镜像')
+    parser.add_argument('targets', nargs='*', help=f"构建目标（默认全部），会同时构建其父镜像，可选: {', '.join(BUILD_TARGETS)}")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 2, help='并行构建的节点数，默认为CPU核数')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'本地构建缓存目录，默认为{DEFAULT_CACHE_DIR}')
+    parser.add_argument('--push', action='store_true', help='构建多平台镜像并推送到 ALIYUN_REGISTRY/ALIYUN_NAME_SPACE')
+    parser.add_argument('--version', default=None, help='额外打版本号标签，如 v0.3 会生成 tengine:base-v0.3')
+    parser.add_argument('--build-arg', action='append', default=[], help='构建参数，如 TENGINE_VERSION=3.1.0，可重复')
+    parser.add_argument('--force', action='store_true', help='忽略指纹，重建全部选中的节点')
+    parser.add_argument('--no-cache', action='store_true', help='不使用也不导出构建缓存')
+    parser.add_argument('--dry-run', action='store_true', help='只打印依赖图和需要重建的节点')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    nodes = select_nodes(load_graph(), args.targets)
+    compute_fingerprints(nodes, args.build_arg)
+
+    previous = load_fingerprints(args.cache_dir)
+    for node in nodes.values():
+        changed = args.force or previous.get(node.name) != node.fingerprint
+        parents = ', '.join(node.parents) or '-'
+        logger.info("%s: 依赖 [%s] %s", node.name, parents, '需要重建' if changed else '未变化')
+    if args.dry_run:
+        return
+
+    if not build_graph(nodes, args):
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import argparse
+import gzip
+import io
+import json
+import logging
+import posixpath
+import re
+import subprocess
+import tarfile
+import tempfile
+from typing import Dict, List, Optional, Set
+
+from registry import RegistryClient, parse_image_reference
+
+logger = logging.getLogger(__name__)
+
+# eStargz 镜像的标签后缀，与原镜像一同推送
+ESTARGZ_TAG_SUFFIX = '-esgz'
+# eStargz 层末尾固定长度的 footer，记录 TOC 的偏移量
+ESTARGZ_FOOTER_SIZE = 51
+TOC_FILE_NAME = 'stargz.index.json'
+
+INDEX_MEDIA_TYPES = (
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+)
+MANIFEST_ACCEPT = ', '.join(INDEX_MEDIA_TYPES + (
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+))
+
+
+# 计算 eStargz 镜像的目标引用：在原标签后追加后缀
+def estargz_reference(new_image: str) -> str:
+    repository, _, tag = new_image.rpartition(':')
+    if not repository or '/' in tag:
+        return f"{new_image}:latest{ESTARGZ_TAG_SUFFIX}"
+    return f"{repository}:{tag}{ESTARGZ_TAG_SUFFIX}"
+
+
+# 使用 buildx 把镜像层重新压缩为带 TOC 的 eStargz 格式并推送
+def convert_to_estargz(image: str, target_image: str, platform: Optional[str] = None):
+    """
+    eStargz 兼容普通 gzip 层，不支持懒加载的运行时仍可正常拉取；
+    containerd stargz-snapshotter 等运行时可按 TOC 只拉取启动所需的文件
+    """
+    output = (f"type=image,name={target_image},push=true,compression=estargz,"
+              f"force-compression=true,oci-mediatypes=true")
+    command = ['docker', 'buildx', 'build', '--output', output, '-f', '-']
+    if platform:
+        command.extend(['--platform', platform])
+
+    with tempfile.TemporaryDirectory() as context_dir:
+        command.append(context_dir)
+        logger.info("生成 eStargz 镜像: %s", target_image)
+        subprocess.run(command, input=f"FROM {image}\n", text=True, check=True)
+
+
+# TOC 中的路径统一去掉开头的 ./ 和 /
+def normalize_path(name: str) -> str:
+    return re.sub(r'^(\./|/)+', '', name)
+
+
+class LayerIndex:
+    """单个 eStargz 层的 TOC：每个文件在压缩流中的位置和长度"""
+
+    def __init__(self, digest: str, size: int, toc_offset: int, entries: List[Dict]):
+        self.digest = digest
+        self.size = size
+        self.toc_offset = toc_offset
+        self.spans: Dict[str, int] = {}
+        self.files: Set[str] = set()
+
+        # 每个条目的压缩数据从 offset 开始，到下一个条目的 offset 结束
+        located = sorted((entry for entry in entries if entry.get('offset')), key=lambda entry: entry['offset'])
+        for current, following in zip(located, located[1:] + [None]):
+            end = following['offset'] if following else toc_offset
+            name = normalize_path(current['name'])
+            self.spans[name] = self.spans.get(name, 0) + end - current['offset']
+        for entry in entries:
+            self.files.add(normalize_path(entry['name']))
+
+    @property
+    def toc_bytes(self) -> int:
+        # TOC 加 footer，懒加载启动前必须先读取
+        return self.size - self.toc_offset
+
+
+# 在多架构清单列表中选出指定平台的清单
+def _select_manifest(client: RegistryClient, registry_host: str, repository: str, reference: str,
+                     platform: Optional[str]) -> Dict:
+    _, _, body = client.request('GET', registry_host, repository, f"manifests/{reference}",
+                                {'Accept': MANIFEST_ACCEPT})
+    manifest = json.loads(body.decode('utf-8'))
+    if manifest.get('mediaType') not in INDEX_MEDIA_TYPES and 'manifests' not in manifest:
+        return manifest
+
+    os_name, _, arch = (platform or 'linux/amd64').partition('/')
+    for candidate in manifest.get('manifests', []):
+        candidate_platform = candidate.get('platform', {})
+        if candidate_platform.get('os') == os_name and candidate_platform.get('architecture') == arch:
+            return _select_manifest(client, registry_host, repository, candidate['digest'], platform)
+    raise ValueError(f"清单列表中没有平台 {platform or 'linux/amd64'}")
+
+
+def _read_range(client: RegistryClient, registry_host: str, repository: str, digest: str,
+                start: int, end: int) -> bytes:
+    status, _, body = client.request('GET', registry_host, repository, f"blobs/{digest}",
+                                     {'Range': f"bytes={start}-{end}"})
+    if status not in (200, 206):
+        raise ValueError(f"读取层 {digest} 失败，状态码 {status}")
+    # 不支持 Range 的仓库会返回整个层
+    return body[start:end + 1] if status == 200 else body
+
+
+# 读取单个层的 eStargz TOC，非 eStargz 层返回 None
+def read_layer_index(client: RegistryClient, registry_host: str, repository: str,
+                     layer: Dict) -> Optional[LayerIndex]:
+    size = layer['size']
+    footer = _read_range(client, registry_host, repository, layer['digest'], size - ESTARGZ_FOOTER_SIZE, size - 1)
+    match = re.search(rb'([0-9a-f]{16})STARGZ', footer)
+    if not match:
+        return None
+
+    toc_offset = int(match.group(1), 16)
+    toc_blob = _read_range(client, registry_host, repository, layer['digest'], toc_offset,
+                           size - ESTARGZ_FOOTER_SIZE - 1)
+    with tarfile.open(fileobj=io.BytesIO(gzip.decompress(toc_blob))) as toc_tar:
+        toc = json.load(toc_tar.extractfile(TOC_FILE_NAME))
+    return LayerIndex(layer['digest'], size, toc_offset, toc.get('entries', []))
+
+
+# 未提供访问列表时，估算启动所需文件：入口程序、动态库和 /etc 下的配置
+def default_startup_files(config: Dict, layers: List[LayerIndex]) -> Set[str]:
+    all_files = set().union(*(layer.files for layer in layers)) if layers else set()
+    image_config = config.get('config', {})
+    command = (image_config.get('Entrypoint') or []) + (image_config.get('Cmd') or [])
+    search_path = ['usr/local/sbin', 'usr/local/bin', 'usr/sbin', 'usr/bin', 'sbin', 'bin']
+
+    wanted = set()
+    if command:
+        executable = command[0]
+        if executable.startswith('/'):
+            wanted.add(normalize_path(executable))
+        else:
+            wanted.update(posixpath.join(directory, executable) for directory in search_path)
+
+    for name in all_files:
+        if name.startswith('etc/') or re.search(r'(^|/)lib[^/]*/.*\.so(\.|$)', name):
+            wanted.add(name)
+    return wanted & all_files
+
+
+# 对比懒加载启动前需要拉取的字节数与完整拉取的字节数
+def benchmark(image: str, platform: Optional[str] = None, access_list: Optional[List[str]] = None) -> Dict:
+    client = RegistryClient()
+    registry_host, repository, reference = parse_image_reference(image)
+    manifest = _select_manifest(client, registry_host, repository, reference, platform)
+    _, _, config_body = client.request('GET', registry_host, repository, f"blobs/{manifest['config']['digest']}")
+    config = json.loads(config_body.decode('utf-8'))
+
+    layers = []
+    plain_layers = 0
+    for layer in manifest['layers']:
+        layer_index = read_layer_index(client, registry_host, repository, layer)
+        if layer_index:
+            layers.append(layer_index)
+        else:
+            plain_layers += layer['size']
+
+    wanted = {normalize_path(path) for path in access_list} if access_list else default_startup_files(config, layers)
+
+    full_pull = sum(layer['size'] for layer in manifest['layers'])
+    toc_bytes = sum(layer.toc_bytes for layer in layers)
+    file_bytes = sum(span for layer in layers for name, span in layer.spans.items() if name in wanted)
+    # 非 eStargz 层无法懒加载，必须完整拉取
+    lazy_pull = toc_bytes + file_bytes + plain_layers
+
+    return {
+        'image': image,
+        'platform': platform or 'linux/amd64',
+        'layers': len(manifest['layers']),
+        'estargz_layers': len(layers),
+        'startup_files': len(wanted),
+        'full_pull_bytes': full_pull,
+        'lazy_pull_bytes': lazy_pull,
+        'toc_bytes': toc_bytes,
+        'ratio': round(lazy_pull / full_pull, 4) if full_pull else None,
+    }
+
+
+# 解析命令行参数
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='eStargz 懒加载镜像：首次启动所需字节数基准测试')
+    parser.add_argument('image', help='eStargz 镜像引用，如 registry/ns/nginx:1.27-esgz')
+    parser.add_argument('--platform', default=None, help='平台，默认为 linux/amd64')
+    parser.add_argument('--access-list', default=None,
+                        help='启动时访问的文件列表（每行一个路径，可由 strace/fanotify 采集）；未提供时按入口程序和动态库估算')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    args = parse_arguments()
+    access_list = None
+    if args.access_list:
+        with open(args.access_list, 'r', encoding='utf-8') as f:
+            access_list = [line.strip() for line in f if line.strip()]
+
+    result = benchmark(args.image, args.platform, access_list)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    logger.info("完整拉取 %.1f MB, 懒加载首次启动需要 %.1f MB (%.1f%%)", result['full_pull_bytes'] / 1024 / 1024,
+                result['lazy_pull_bytes'] / 1024 / 1024, (result['ratio'] or 0) * 100)
+
+
+if __name__ == "__main__":
+    main()
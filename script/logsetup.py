@@ -0,0 +1,137 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import sys
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s [%(processName)s] %(levelname)s: %(message)s'
+
+# JSON Lines 中作为独立字段输出的 extra 字段
+EVENT_FIELDS = ('image', 'phase', 'duration')
+
+# 工作进程中渲染异常堆栈使用的默认格式
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    每条日志输出为一行 JSON：时间、级别、进程/线程、消息，以及 fields 中出现的 extra 字段；
+    与 py/archive/logsetup.py 和 script/logsetup.py 中的定义保持一致（CI 会比对两份源码）
+    """
+
+    def __init__(self, fields=(), datefmt=None):
+        super().__init__(datefmt=datefmt)
+        self.fields = fields
+
+    def format(self, record):
+        event = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.processName,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for field in self.fields:
+            value = getattr(record, field, None)
+            if value is not None:
+                event[field] = round(value, 3) if field == 'duration' else value
+        # 跨进程传递的日志在工作进程中已把异常渲染为 exc_text
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            event['exception'] = record.exc_text
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+# 同步写入进程间队列（multiprocessing.SimpleQueue）：任务返回前日志已写完，
+# Pool 退出时终止工作进程不会丢失日志，也不会在队列锁被持有时杀掉后台写入线程导致主进程卡住
+class ProcessQueueHandler(logging.handlers.QueueHandler):
+    # 消息格式化留给主进程的后台线程：只把无法序列化的 exc_info 渲染为 exc_text，msg/args 原样传递
+    # （标准 QueueHandler.prepare 会在工作进程格式化整条消息并清空 exc_info）
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put(record)
+        except Exception:
+            # 参数无法序列化时退回到在工作进程合并消息（SimpleQueue 先序列化再写入，失败时队列不受影响）
+            record.msg = record.getMessage()
+            record.args = None
+            self.queue.put(record)
+
+
+# 从 multiprocessing.SimpleQueue 读取日志（SimpleQueue 没有 block/nowait 参数）
+class ProcessQueueListener(logging.handlers.QueueListener):
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        return self.queue.get()
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def setup_logging(level: str = 'INFO', json_lines: bool = False, use_queue: bool = True) -> None:
+    """
+    配置主进程的根 logger：use_queue 为 True 时工作进程和主进程的日志都写入进程间队列，
+    由后台线程格式化并写到 stderr；为 False 时直接同步写出（工作进程 fork 后继承同样的配置）
+    """
+    global _listener, _queue
+    stop_logging()
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonLinesFormatter(EVENT_FIELDS) if json_lines else logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.setLevel(level.upper())
+
+    if not use_queue:
+        root.addHandler(handler)
+        return
+    _queue = multiprocessing.SimpleQueue()
+    root.addHandler(ProcessQueueHandler(_queue))
+    _listener = ProcessQueueListener(_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+# 停止后台线程，写出队列中剩余的日志
+def stop_logging() -> None:
+    global _listener, _queue
+    if _listener:
+        _listener.stop()
+    _listener = None
+    _queue = None
+
+
+# 当前的进程间日志队列，未启用队列时返回 None
+def get_log_queue():
+    return _queue
+
+
+def configure_worker(log_queue, level: int = logging.INFO) -> None:
+    """
+    multiprocessing.Pool 的 initializer：把工作进程的日志写入主进程的队列；
+    log_queue 为 None 时保留继承的配置（fork 方式启动时与主进程相同，spawn 方式启动时输出到 stderr）
+    """
+    if log_queue is None:
+        if not logging.getLogger().handlers:
+            logging.basicConfig(level=level)
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(ProcessQueueHandler(log_queue))
+    root.setLevel(level)
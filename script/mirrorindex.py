@@ -0,0 +1,125 @@
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional
+
+# 默认的映射索引文件
+DEFAULT_INDEX_FILE = 'mirror-index.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mirror_index (
+    source      TEXT NOT NULL,
+    platform    TEXT NOT NULL DEFAULT '',
+    target      TEXT NOT NULL,
+    digest      TEXT,
+    size        INTEGER,
+    mirrored_at REAL NOT NULL,
+    PRIMARY KEY (source, platform)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_mirror_index_target ON mirror_index (target);
+"""
+
+
+class MirrorIndex:
+    """
+    上游镜像 -> 转存镜像的映射索引，存放在单个 SQLite 文件中
+    以 (上游引用, 平台) 为主键，每次同步后增量更新
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_FILE):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def upsert(self, records: List[Dict]):
+        """批量写入同步记录，同一 (上游引用, 平台) 以最新一次同步为准"""
+        rows = [(record['source'], record.get('platform') or '', record['target'], record.get('digest'),
+                 record.get('size'), record.get('mirrored_at', time.time())) for record in records]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO mirror_index (source, platform, target, digest, size, mirrored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (source, platform) DO UPDATE SET target=excluded.target, digest=excluded.digest, "
+                "size=excluded.size, mirrored_at=excluded.mirrored_at",
+                rows
+            )
+
+    def lookup(self, source: str, platform: str = '') -> Optional[Dict]:
+        """按上游引用和平台查询转存结果，未找到时返回 None"""
+        cursor = self.connection.execute(
+            "SELECT source, platform, target, digest, size, mirrored_at FROM mirror_index "
+            "WHERE source=? AND platform=?", (source, platform or ''))
+        row = cursor.fetchone()
+        return _row_to_dict(row) if row else None
+
+    def reverse_lookup(self, target: str) -> List[Dict]:
+        """按转存后的镜像引用反查上游镜像"""
+        cursor = self.connection.execute(
+            "SELECT source, platform, target, digest, size, mirrored_at FROM mirror_index WHERE target=?",
+            (target,))
+        return [_row_to_dict(row) for row in cursor.fetchall()]
+
+    def all(self) -> List[Dict]:
+        cursor = self.connection.execute(
+            "SELECT source, platform, target, digest, size, mirrored_at FROM mirror_index ORDER BY source, platform")
+        return [_row_to_dict(row) for row in cursor.fetchall()]
+
+
+def _row_to_dict(row) -> Dict:
+    source, platform, target, digest, size, mirrored_at = row
+    return {
+        'source': source,
+        'platform': platform,
+        'target': target,
+        'digest': digest,
+        'size': size,
+        'mirrored_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mirrored_at)),
+    }
+
+
+# 解析命令行参数
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='查询镜像转存映射索引')
+    parser.add_argument('--index-file', default=DEFAULT_INDEX_FILE, help=f'映射索引文件路径，默认为{DEFAULT_INDEX_FILE}')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    lookup_parser = subparsers.add_parser('lookup', help='按上游镜像查询转存镜像')
+    lookup_parser.add_argument('source', help='上游镜像引用，如 mysql:lts')
+    lookup_parser.add_argument('--platform', default='', help='平台，如 linux/arm64')
+
+    reverse_parser = subparsers.add_parser('reverse', help='按转存镜像反查上游镜像')
+    reverse_parser.add_argument('target', help='转存后的完整镜像引用')
+
+    subparsers.add_parser('list', help='列出全部映射')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    with MirrorIndex(args.index_file) as index:
+        if args.command == 'lookup':
+            record = index.lookup(args.source, args.platform)
+            if not record:
+                print(f"未找到 {args.source} 的映射", file=sys.stderr)
+                sys.exit(1)
+            result = record
+        elif args.command == 'reverse':
+            result = index.reverse_lookup(args.target)
+        else:
+            result = index.all()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
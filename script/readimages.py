@@ -1,16 +1,21 @@
 import subprocess
 import os
 import re
+import json
+import time
+import random
 import argparse
 import logging
-from typing import List, Dict, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Set, Tuple, Optional
 from multiprocessing import Pool, cpu_count, current_process
 
-# 配置日志格式
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(processName)s] %(levelname)s: %(message)s'
-)
+from lazypull import ESTARGZ_TAG_SUFFIX, convert_to_estargz, estargz_reference
+from mirrorindex import MirrorIndex, DEFAULT_INDEX_FILE
+from registry import RegistryClient
+from logsetup import configure_worker, get_log_queue, setup_logging
+from tagpattern import is_tag_pattern, select_tags
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,10 +29,10 @@ def docker_login():
         )
         logger.info("Docker登录成功")
     except subprocess.CalledProcessError as e:
-        logger.error(f"Docker登录失败: {e}")
+        logger.error("Docker登录失败: %s", e)
         raise
     except KeyError as e:
-        logger.error(f"环境变量缺失: {e}")
+        logger.error("环境变量缺失: %s", e)
         raise
 
 
@@ -67,21 +72,43 @@ def preprocess_images(image_lines: List[str]) -> Set[str]:
     return duplicate_images
 
 
-# 处理单个镜像
-def process_single_image(args: Tuple[str, Set[str], str, str, str]):
-    line, duplicate_images, aliyun_registry, aliyun_namespace, platform_prefix = args
+# 读取已推送镜像的清单摘要和大小，用于写入映射索引
+def inspect_pushed_image(new_image: str) -> Tuple[Optional[str], Optional[int]]:
+    try:
+        output = subprocess.run(
+            ['docker', 'image', 'inspect', '--format', '{{json .RepoDigests}}|{{.Size}}', new_image],
+            check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except subprocess.CalledProcessError as e:
+        logger.warning("读取镜像 %s 的摘要失败: %s", new_image, e)
+        return None, None
+
+    repo_digests, _, size = output.rpartition('|')
+    repository = new_image.rsplit(':', 1)[0]
+    digest = None
+    for repo_digest in json.loads(repo_digests or '[]'):
+        name, _, value = repo_digest.partition('@')
+        if name == repository:
+            digest = value
+            break
+    return digest, int(size) if size.isdigit() else None
+
+
+# 处理单个镜像，返回写入映射索引的同步记录
+def process_single_image(args: Tuple[str, Set[str], str, str, str, bool]) -> Optional[Dict]:
+    line, duplicate_images, aliyun_registry, aliyun_namespace, platform_prefix, lazy_pull = args
     try:
         line = line.strip()
         if not line or re.match(r'^\s*#', line):
-            return
+            return None
 
-        logger.info(f"处理镜像行: {line}")
+        logger.info("处理镜像行: %s", line, extra={'phase': 'parse'})
 
         platform = None
         platform_match = re.search(r'--platform[= ](\S+)', line)
         if platform_match:
             platform = platform_match.group(1)
-        logger.debug(f"检测到平台参数: {platform}")
+        logger.debug("检测到平台参数: %s", platform)
 
         parts = line.split()
         image = parts[-1].split('@')[0]
@@ -102,37 +129,89 @@ def process_single_image(args: Tuple[str, Set[str], str, str, str]):
 
         new_image = f"{aliyun_registry}/{aliyun_namespace}/{platform_prefix}{name_space_prefix}{image_name_tag}"
 
-        logger.info(f"拉取镜像: {image}")
+        image_start = time.time()
+        logger.info("拉取镜像: %s", image, extra={'image': image, 'phase': 'pull'})
         pull_command = ['docker', 'pull']
         if platform:
             pull_command.extend(['--platform', platform])
         pull_command.append(image)
         subprocess.run(pull_command, check=True)
+        pull_duration = time.time() - image_start
 
-        logger.info(f"重标签镜像: {new_image}")
+        logger.info("重标签镜像: %s", new_image, extra={'image': image, 'phase': 'tag'})
         subprocess.run(['docker', 'tag', image, new_image], check=True)
 
-        logger.info(f"推送镜像: {new_image}")
+        logger.info("推送镜像: %s", new_image, extra={'image': image, 'phase': 'push'})
+        push_start = time.time()
         subprocess.run(['docker', 'push', new_image], check=True)
+        push_duration = time.time() - push_start
+        digest, size = inspect_pushed_image(new_image)
 
-        logger.info(f"清理镜像: {image}")
+        # 额外推送一份带 TOC 的 eStargz 镜像，供支持懒加载的运行时使用；
+        # 转换失败不影响普通镜像的同步结果，之后只需重试转换
+        estargz_failed = lazy_pull and not try_convert_to_estargz(new_image, platform)
+
+        logger.info("清理镜像: %s", image, extra={'image': image, 'phase': 'cleanup'})
         subprocess.run(['docker', 'rmi', '-f', image], check=True)
-        logger.info(f"清理镜像: {new_image}")
+        logger.info("清理镜像: %s", new_image, extra={'image': image, 'phase': 'cleanup'})
         subprocess.run(['docker', 'rmi', '-f', new_image], check=True)
+        image_duration = time.time() - image_start
+        logger.info("镜像同步完成: %s -> %s (拉取 %.1fs, 推送 %.1fs, 共 %.1fs)",
+                    image, new_image, pull_duration, push_duration, image_duration,
+                    extra={'image': image, 'phase': 'done', 'duration': image_duration})
 
         logger.debug("检查磁盘空间...")
         subprocess.run(['df', '-hT'])
 
+        record = {
+            'source': image,
+            'platform': platform or '',
+            'target': new_image,
+            'digest': digest,
+            'size': size,
+            'mirrored_at': time.time(),
+        }
+        if estargz_failed:
+            record['estargz_pending'] = True
+        return record
+
     except subprocess.CalledProcessError as e:
-        print(f"命令执行失败：{e}")
+        logger.error("命令执行失败：%s", e, extra={'image': line, 'phase': 'failed'})
         raise
     except Exception as e:
-        print(f"处理镜像时发生错误：{e}")
+        logger.exception("处理镜像时发生错误：%s", e, extra={'image': line, 'phase': 'failed'})
         raise
 
 
+# 推送已同步镜像的 eStargz 版本，失败时只记录警告并返回 False
+def try_convert_to_estargz(new_image: str, platform: Optional[str] = None) -> bool:
+    try:
+        convert_to_estargz(new_image, estargz_reference(new_image), platform)
+        return True
+    except Exception as e:
+        logger.warning("生成 eStargz 镜像失败，普通镜像已同步: %s (%s)", new_image, e,
+                       extra={'image': new_image, 'phase': 'estargz'})
+        return False
+
+
+# 把同步记录增量写入映射索引
+def record_mirror_results(index_file: str, records: List[Optional[Dict]]):
+    records = [record for record in records if record]
+    if not index_file or not records:
+        return
+    with MirrorIndex(index_file) as index:
+        index.upsert(records)
+    logger.info("映射索引已更新: %s (%s 条记录)", index_file, len(records))
+
+
+# 创建镜像处理进程池，工作进程的日志经主进程的日志队列写出
+def create_pool(size: int):
+    return Pool(size, initializer=configure_worker, initargs=(get_log_queue(), logging.getLogger().level))
+
+
 # 处理镜像：拉取、重标签、推送、清理
-def process_images(image_lines: List[str], duplicate_images: Set[str]):
+def process_images(image_lines: List[str], duplicate_images: Set[str], index_file: str = DEFAULT_INDEX_FILE,
+                   lazy_pull: bool = False):
     aliyun_registry = os.getenv('ALIYUN_REGISTRY')
     aliyun_namespace = os.getenv('ALIYUN_NAME_SPACE')
 
@@ -140,20 +219,265 @@ def process_images(image_lines: List[str], duplicate_images: Set[str]):
         raise ValueError("环境变量 ALIYUN_REGISTRY 或 ALIYUN_NAME_SPACE 未设置")
 
     pool_size = cpu_count() * 2
-    logger.info(f"使用 {pool_size} 个并发进程处理镜像")
+    logger.info("使用 %s 个并发进程处理镜像", pool_size)
 
-    args_list = [(line, duplicate_images, aliyun_registry, aliyun_namespace, '') for line in image_lines]
+    args_list = [(line, duplicate_images, aliyun_registry, aliyun_namespace, '', lazy_pull) for line in image_lines]
 
-    with Pool(pool_size) as pool:
+    with create_pool(pool_size) as pool:
         logger.info("开始并行处理镜像")
-        pool.map(process_single_image, args_list)
+        results = pool.map(try_process_single_image, args_list)
         logger.info("完成镜像处理")
 
+    # 成功的镜像先写入映射索引，再对失败的镜像整体报错
+    record_mirror_results(index_file, [record for _, record in results])
+    pending = [record['target'] for _, record in results if record and record.get('estargz_pending')]
+    if pending:
+        logger.warning("%s 个镜像的 eStargz 版本生成失败，下次运行时重试: %s", len(pending), ', '.join(pending))
+    failed = [args[0] for (ok, _), args in zip(results, args_list) if not ok]
+    if failed:
+        raise RuntimeError(f"{len(failed)} 个镜像处理失败: {', '.join(failed)}")
+
+
+# 处理单个镜像，失败时返回 (False, None) 而不是中断整批处理
+def try_process_single_image(args: Tuple[str, Set[str], str, str, str, bool]) -> Tuple[bool, Optional[Dict]]:
+    try:
+        return True, process_single_image(args)
+    except Exception as e:
+        logger.error("镜像同步失败: %s (%s)", args[0], e)
+        return False, None
+
+
+# 读取监听状态文件：镜像 -> {digest, etag, estargz_pending}
+def load_watch_state(state_file: str) -> Dict[str, Dict]:
+    if not os.path.exists(state_file):
+        return {}
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("读取监听状态文件 %s 失败，按首次运行处理（只记录当前摘要，不同步）: %s", state_file, e)
+        return {}
+
+
+# 原子写入监听状态文件，避免中途退出导致文件损坏
+def save_watch_state(state_file: str, state: Dict[str, Dict]):
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+
+# 以条件请求检查单个镜像的源清单，返回 (镜像行, 新状态, 是否变化)
+def check_image_changed(client: RegistryClient, line: str,
+                        state: Dict[str, Dict]) -> Tuple[str, Optional[Dict[str, str]], bool]:
+    image = line.split()[-1]
+    previous = state.get(image, {})
+    try:
+        status, digest, etag = client.head_manifest(image, previous.get('etag'))
+    except Exception as e:
+        logger.warning("检查镜像 %s 失败，本轮跳过: %s", image, e)
+        return line, None, False
+
+    if status == 304:
+        return line, None, False
+    if status != 200 or not digest:
+        logger.warning("检查镜像 %s 返回状态码 %s，本轮跳过", image, status)
+        return line, None, False
+
+    changed = digest != previous.get('digest')
+    return line, {'digest': digest, 'etag': etag}, changed
+
+
+# 监听模式：周期性检查浮动标签，只同步源清单发生变化的镜像
+def watch_images(image_lines: List[str], interval: float, jitter: float, state_file: str, concurrency: int,
+                 expand_lines: Callable[[List[str]], List[str]], index_file: str = DEFAULT_INDEX_FILE,
+                 lazy_pull: bool = False):
+    aliyun_registry = os.getenv('ALIYUN_REGISTRY')
+    aliyun_namespace = os.getenv('ALIYUN_NAME_SPACE')
+
+    if not aliyun_registry or not aliyun_namespace:
+        raise ValueError("环境变量 ALIYUN_REGISTRY 或 ALIYUN_NAME_SPACE 未设置")
+
+    logger.info("进入监听模式: 间隔 %ss, 抖动 ±%.0f%%", interval, jitter * 100)
+
+    client = RegistryClient()
+    state = load_watch_state(state_file)
+    # 没有历史状态时（首次运行或状态文件损坏），第一轮只把当前摘要记为基线，不重新同步全部镜像
+    baseline = not state
+    pool_size = cpu_count() * 2
+
+    while True:
+        round_start = time.time()
+        # 每轮重新展开标签模式，新发布的匹配标签会被自动纳入监听
+        current_lines = expand_lines(image_lines)
+        duplicate_images = preprocess_images(current_lines)
+        # 固定摘要的镜像不会变化，无需监听
+        watch_lines = [line for line in current_lines if '@' not in line.split()[-1]]
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda line: check_image_changed(client, line, state), watch_lines))
+
+        if baseline:
+            for line, new_state, _ in results:
+                if new_state:
+                    state[line.split()[-1]] = new_state
+            logger.info("首次运行，已记录 %s 个镜像的当前摘要作为基线，本轮不同步；"
+                        "之后只同步摘要发生变化的镜像", len(state))
+            results = []
+            baseline = False
+
+        changed = [(line, new_state) for line, new_state, is_changed in results if is_changed]
+        # 未变化但 ETag 更新的镜像直接记录（保留待重试的 eStargz 转换），变化的镜像在同步成功后再记录
+        for line, new_state, is_changed in results:
+            if new_state and not is_changed:
+                image = line.split()[-1]
+                pending = state.get(image, {}).get('estargz_pending')
+                state[image] = dict(new_state, estargz_pending=pending) if pending else new_state
+
+        logger.info("本轮检查完成: %s 个镜像, %s 个发生变化, "
+                    "耗时 %.2fs", len(watch_lines), len(changed), time.time() - round_start)
+
+        if changed:
+            args_list = [(line, duplicate_images, aliyun_registry, aliyun_namespace, '', lazy_pull)
+                         for line, _ in changed]
+            with create_pool(min(pool_size, len(args_list))) as pool:
+                outcomes = pool.map(try_process_single_image, args_list)
+            for (line, new_state), (ok, record) in zip(changed, outcomes):
+                if ok:
+                    if record and record.get('estargz_pending'):
+                        new_state = dict(new_state, estargz_pending={'target': record['target'],
+                                                                     'platform': record['platform']})
+                    state[line.split()[-1]] = new_state
+                else:
+                    logger.warning("镜像 %s 同步失败，将在下一轮重试", line)
+            record_mirror_results(index_file, [record for _, record in outcomes])
+
+        # 普通镜像已同步但 eStargz 转换失败的镜像，只重试转换
+        changed_images = {line.split()[-1] for line, _ in changed}
+        retry_images = [image for image, entry in state.items()
+                        if entry.get('estargz_pending') and image not in changed_images]
+        if retry_images:
+            logger.info("重试 %s 个镜像的 eStargz 转换", len(retry_images))
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(retry_images)))) as executor:
+                converted = list(executor.map(
+                    lambda image: try_convert_to_estargz(state[image]['estargz_pending']['target'],
+                                                         state[image]['estargz_pending']['platform'] or None),
+                    retry_images))
+            for image, ok in zip(retry_images, converted):
+                if ok:
+                    state[image].pop('estargz_pending')
+
+        save_watch_state(state_file, state)
+
+        sleep_seconds = max(0.0, interval * random.uniform(1 - jitter, 1 + jitter))
+        logger.info("等待 %.1fs 后进行下一轮检查", sleep_seconds)
+        time.sleep(sleep_seconds)
+
+
+# 读取标签列表缓存文件：仓库 -> {etag, tags, fetched_at}
+def load_tag_cache(cache_file: str) -> Dict[str, Dict]:
+    if not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("读取标签缓存文件 %s 失败，将重新获取: %s", cache_file, e)
+        return {}
+
+
+# 获取单个仓库的标签列表，优先使用有效期内的缓存，过期后以 ETag 条件请求刷新
+def fetch_repository_tags(client: RegistryClient, repository: str, cached: Optional[Dict],
+                          cache_ttl: float) -> Optional[Dict]:
+    now = time.time()
+    if cached and now - cached.get('fetched_at', 0) < cache_ttl:
+        return cached
+
+    status, tags, etag = client.list_tags(repository, cached.get('etag') if cached else None)
+    if status == 304 and cached:
+        return dict(cached, fetched_at=now)
+    if status != 200 or tags is None:
+        logger.warning("获取仓库 %s 的标签列表失败，状态码 %s", repository, status)
+        return cached
+    return {'etag': etag, 'tags': tags, 'fetched_at': now}
+
+
+# 展开镜像列表中的标签模式（如 redis:7.* 或 mysql:>=8.4.1,<8.5），可用 --latest=N 只保留最新的N个
+def expand_image_patterns(image_lines: List[str], cache_file: str, cache_ttl: float,
+                          concurrency: int) -> List[str]:
+    pattern_lines = []
+    for line in image_lines:
+        image = line.split()[-1]
+        last_segment = image.split('/')[-1]
+        if '@' not in image and ':' in last_segment and is_tag_pattern(last_segment.split(':', 1)[1]):
+            repository, pattern = image.rsplit(':', 1)
+            pattern_lines.append((line, repository, pattern))
+
+    if not pattern_lines:
+        return image_lines
+
+    expand_start = time.time()
+    cache = load_tag_cache(cache_file)
+    client = RegistryClient()
+    repositories = sorted({repository for _, repository, _ in pattern_lines})
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(repositories)))) as executor:
+        results = executor.map(lambda repo: fetch_repository_tags(client, repo, cache.get(repo), cache_ttl),
+                               repositories)
+        for repository, entry in zip(repositories, results):
+            if entry:
+                cache[repository] = entry
+
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_file, cache_file)
+
+    expansions = {}
+    for line, repository, pattern in pattern_lines:
+        latest_match = re.search(r'--latest[= ](\d+)', line)
+        latest = int(latest_match.group(1)) if latest_match else 0
+        options = re.sub(r'--latest[= ]\d+\s*', '', line).split()[:-1]
+        tags = select_tags(pattern, cache.get(repository, {}).get('tags', []), latest)
+        if not tags:
+            logger.warning("标签模式 %s:%s 没有匹配到任何标签", repository, pattern)
+        logger.info("标签模式 %s:%s 展开为: %s", repository, pattern, ', '.join(tags))
+        expansions[line] = [' '.join(options + [f"{repository}:{tag}"]) for tag in tags]
+
+    expanded_lines = []
+    seen = set()
+    for line in image_lines:
+        for expanded in expansions.get(line, [line]):
+            if expanded not in seen:
+                seen.add(expanded)
+                expanded_lines.append(expanded)
+
+    logger.info("标签模式展开完成: %s 个模式, %s 个仓库, "
+                "%s 行镜像, 耗时 %.2fs",
+                len(pattern_lines), len(repositories), len(expanded_lines), time.time() - expand_start)
+    return expanded_lines
+
 
 # 解析命令行参数
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Docker镜像拉取推送工具')
     parser.add_argument('--image-file', default='images.txt', help='镜像列表文件路径，默认为images.txt')
+    parser.add_argument('--watch', action='store_true', help='监听模式：持续检查浮动标签，变化后立即同步')
+    parser.add_argument('--watch-interval', type=float, default=300, help='监听模式的检查间隔（秒），默认300')
+    parser.add_argument('--watch-jitter', type=float, default=0.1, help='检查间隔的随机抖动比例，默认0.1')
+    parser.add_argument('--watch-state', default='.watch-state.json', help='监听状态文件路径，默认为.watch-state.json')
+    parser.add_argument('--watch-concurrency', type=int, default=16, help='并发检查清单的线程数，默认16')
+    parser.add_argument('--tag-cache', default='.tag-cache.json', help='标签列表缓存文件路径，默认为.tag-cache.json')
+    parser.add_argument('--tag-cache-ttl', type=float, default=600, help='标签列表缓存有效期（秒），过期后以ETag条件请求刷新，默认600')
+    parser.add_argument('--index-file', default=DEFAULT_INDEX_FILE,
+                        help=f'源镜像到转存镜像的映射索引文件，默认为{DEFAULT_INDEX_FILE}，传空字符串可禁用')
+    parser.add_argument('--lazy-pull', action='store_true',
+                        help=f'同时推送带 TOC 的 eStargz 懒加载镜像（标签追加 {ESTARGZ_TAG_SUFFIX} 后缀），需要 docker buildx')
+    parser.add_argument('--tag-concurrency', type=int, default=16, help='并发获取标签列表的线程数，默认16')
+    parser.add_argument('--log-level', default='INFO', help='日志级别，默认为INFO')
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text',
+                        help='日志格式：text 为文本；json 为 JSON Lines，每行一个事件，带 image/phase/duration 字段')
+    parser.add_argument('--log-sync', action='store_true', help='在调用方同步写日志，不使用后台日志线程')
     return parser.parse_args()
 
 
@@ -162,35 +486,47 @@ def read_image_lines(file_path: str) -> List[str]:
     """读取镜像列表文件，返回非空且非注释的行"""
     image_lines = []
     try:
-        logger.info(f"开始读取镜像文件: {file_path}")
+        logger.info("开始读取镜像文件: %s", file_path)
         with open(file_path, 'r') as file:
             for line_number, line in enumerate(file, 1):
                 line = line.strip()
                 if not line or re.match(r'^\s*#', line):
                     continue
                 image_lines.append(line)
-        logger.info(f"成功读取 {len(image_lines)} 行有效镜像信息")
+        logger.info("成功读取 %s 行有效镜像信息", len(image_lines))
         return image_lines
     except FileNotFoundError:
-        logger.error(f"错误: 找不到文件 {file_path}")
+        logger.error("错误: 找不到文件 %s", file_path)
         exit(1)
     except Exception as e:
-        logger.error(f"读取文件 {file_path} 时出错: {e}")
+        logger.error("读取文件 %s 时出错: %s", file_path, e)
         exit(1)
 
 
 # 主函数
 def main():
+    args = parse_arguments()
+    # 工作进程的日志经进程间队列汇总到主进程，由后台线程统一写出
+    setup_logging(args.log_level, args.log_format == 'json', not args.log_sync)
     try:
         logger.info("开始执行镜像处理流程")
-        args = parse_arguments()
 #         docker_login()
         image_lines = read_image_lines(args.image_file)
-        duplicates = preprocess_images(image_lines)
-        process_images(image_lines, duplicates)
+
+        def expand_lines(lines: List[str]) -> List[str]:
+            return expand_image_patterns(lines, args.tag_cache, args.tag_cache_ttl, args.tag_concurrency)
+
+        if args.watch:
+            watch_images(image_lines, args.watch_interval, args.watch_jitter,
+                         args.watch_state, args.watch_concurrency, expand_lines, args.index_file,
+                         args.lazy_pull)
+        else:
+            image_lines = expand_lines(image_lines)
+            duplicates = preprocess_images(image_lines)
+            process_images(image_lines, duplicates, args.index_file, args.lazy_pull)
         logger.info("镜像处理流程完成")
     except Exception as e:
-        logger.error(f"脚本执行失败: {e}")
+        logger.error("脚本执行失败: %s", e)
         exit(1)
 
 
@@ -0,0 +1,168 @@
+import json
+import re
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+# Docker Hub 的实际仓库地址
+DOCKER_HUB_REGISTRY = 'registry-1.docker.io'
+
+# HEAD 清单时声明接受的清单类型（优先返回多架构清单列表，摘要与 docker pull 一致）
+MANIFEST_ACCEPT = ', '.join([
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+])
+
+REQUEST_TIMEOUT = 30
+
+# 标签列表分页大小
+TAGS_PAGE_SIZE = 1000
+
+
+# 解析镜像引用，返回 (仓库地址, 仓库路径, 标签或摘要)
+def parse_image_reference(image: str) -> Tuple[str, str, str]:
+    reference = 'latest'
+    if '@' in image:
+        image, reference = image.split('@', 1)
+    else:
+        last_segment = image.split('/')[-1]
+        if ':' in last_segment:
+            image, reference = image.rsplit(':', 1)
+
+    segments = image.split('/')
+    first = segments[0]
+    if len(segments) > 1 and ('.' in first or ':' in first or first == 'localhost'):
+        registry_host = first
+        repository = '/'.join(segments[1:])
+    else:
+        registry_host = DOCKER_HUB_REGISTRY
+        repository = image
+
+    if registry_host in ('docker.io', 'index.docker.io'):
+        registry_host = DOCKER_HUB_REGISTRY
+    if registry_host == DOCKER_HUB_REGISTRY and '/' not in repository:
+        repository = f"library/{repository}"
+
+    return registry_host, repository, reference
+
+
+# 解析 WWW-Authenticate 头中的 Bearer 认证参数
+def parse_bearer_challenge(header: str) -> Dict[str, str]:
+    if not header or not header.lower().startswith('bearer '):
+        return {}
+    return dict(re.findall(r'(\w+)="([^"]*)"', header))
+
+
+class RegistryClient:
+    """
+    Docker Registry HTTP API v2 的轻量客户端，仅依赖标准库
+    匿名令牌按 (仓库地址, 仓库路径) 缓存，可在多个线程间共享
+    """
+
+    def __init__(self, timeout: int = REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self._tokens: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def _fetch_token(self, challenge: Dict[str, str]) -> Optional[str]:
+        realm = challenge.get('realm')
+        if not realm:
+            return None
+        query = {key: value for key, value in challenge.items() if key in ('service', 'scope')}
+        url = f"{realm}?{urllib.parse.urlencode(query)}" if query else realm
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            payload = json.loads(response.read().decode('utf-8'))
+        return payload.get('token') or payload.get('access_token')
+
+    def request(self, method: str, registry_host: str, repository: str, path: str,
+                headers: Optional[Dict[str, str]] = None):
+        """
+        发送请求并返回 (状态码, 响应头, 响应体)；遇到 401 时自动获取匿名令牌并重试一次
+        304 等非 2xx 状态码不会抛出异常，由调用方判断
+        """
+        url = path if path.startswith('http') else f"https://{registry_host}/v2/{repository}/{path}"
+        cache_key = (registry_host, repository)
+
+        for attempt in range(2):
+            request_headers = dict(headers or {})
+            with self._lock:
+                token = self._tokens.get(cache_key)
+            if token:
+                request_headers['Authorization'] = f"Bearer {token}"
+
+            request = urllib.request.Request(url, method=method, headers=request_headers)
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    body = response.read() if method != 'HEAD' else b''
+                    return response.status, response.headers, body
+            except urllib.error.HTTPError as e:
+                if e.code == 401 and attempt == 0:
+                    challenge = parse_bearer_challenge(e.headers.get('WWW-Authenticate', ''))
+                    new_token = self._fetch_token(challenge)
+                    if new_token:
+                        with self._lock:
+                            self._tokens[cache_key] = new_token
+                        continue
+                return e.code, e.headers, b''
+
+        return 401, {}, b''
+
+    def head_manifest(self, image: str, etag: Optional[str] = None) -> Tuple[int, Optional[str], Optional[str]]:
+        """
+        以条件请求 HEAD 镜像清单，返回 (状态码, 摘要, ETag)
+        携带上次的 ETag 时，未变化的清单返回 304，且不计入 Docker Hub 的拉取次数
+        """
+        registry_host, repository, reference = parse_image_reference(image)
+        headers = {'Accept': MANIFEST_ACCEPT}
+        if etag:
+            headers['If-None-Match'] = etag
+
+        status, response_headers, _ = self.request('HEAD', registry_host, repository,
+                                                   f"manifests/{reference}", headers)
+        digest = response_headers.get('Docker-Content-Digest') if response_headers else None
+        new_etag = response_headers.get('ETag') if response_headers else None
+        return status, digest, new_etag or digest
+
+    def list_tags(self, image: str, etag: Optional[str] = None) -> Tuple[int, Optional[List[str]], Optional[str]]:
+        """
+        分页获取仓库的全部标签，返回 (状态码, 标签列表, ETag)
+        携带上次的 ETag 时，首页返回 304 表示标签列表未变化，此时标签列表为 None
+        """
+        registry_host, repository, _ = parse_image_reference(image)
+        headers = {'Accept': 'application/json'}
+        if etag:
+            headers['If-None-Match'] = etag
+
+        path = f"tags/list?n={TAGS_PAGE_SIZE}"
+        tags: List[str] = []
+        first_etag = None
+        first_page = True
+
+        while path:
+            status, response_headers, body = self.request('GET', registry_host, repository, path,
+                                                          headers if first_page else {'Accept': 'application/json'})
+            if first_page:
+                if status == 304:
+                    return status, None, etag
+                first_etag = response_headers.get('ETag') if response_headers else None
+                first_page = False
+            if status != 200:
+                return status, None, None
+
+            tags.extend(json.loads(body.decode('utf-8')).get('tags') or [])
+            path = self._next_page(registry_host, response_headers.get('Link', ''))
+
+        return 200, tags, first_etag
+
+    @staticmethod
+    def _next_page(registry_host: str, link_header: str) -> Optional[str]:
+        # Link: </v2/library/redis/tags/list?last=7.0&n=1000>; rel="next"
+        match = re.search(r'<([^>]+)>\s*;\s*rel="?next"?', link_header or '')
+        if not match:
+            return None
+        target = match.group(1)
+        return target if target.startswith('http') else f"https://{registry_host}{target}"
@@ -0,0 +1,119 @@
+import fnmatch
+import re
+from typing import List, Optional, Tuple
+
+# 语义化版本范围的比较符，如 >=8.4.1,<8.5、^8.4、~8.4.1
+RANGE_PATTERN = re.compile(r'^(>=|<=|>|<|=|\^|~)?v?(\d+|[xX*])(?:\.(\d+|[xX*]))?(?:\.(\d+|[xX*]))?$')
+# 带 x/X 通配段的版本号，如 7.x、8.4.X
+X_RANGE_TAG = re.compile(r'^v?(\d+|[xX])(?:\.(\d+|[xX])){0,2}$')
+# 纯版本号标签，如 8.4.3、v1.2
+VERSION_TAG = re.compile(r'^v?(\d+)(?:\.(\d+))?(?:\.(\d+))?$')
+
+
+# 判断标签是否为需要展开的模式（通配符或版本范围）
+def is_tag_pattern(tag: str) -> bool:
+    if any(ch in tag for ch in '*?['):
+        return True
+    if X_RANGE_TAG.match(tag) and any(part in ('x', 'X') for part in tag.lstrip('v').split('.')):
+        return True
+    return tag[:1] in ('>', '<', '=', '^', '~')
+
+
+# 把版本号解析为三元组，非纯版本号返回 None
+def parse_version(tag: str) -> Optional[Tuple[int, int, int]]:
+    match = VERSION_TAG.match(tag)
+    if not match:
+        return None
+    return tuple(int(part) if part else 0 for part in match.groups())
+
+
+# 排序键：纯版本号按数值比较，其余标签按自然顺序（数字段按数值）比较
+def tag_sort_key(tag: str):
+    version = parse_version(tag)
+    if version is not None:
+        return (1, version, tag)
+    natural = tuple((0, int(part), '') if part.isdigit() else (1, 0, part)
+                    for part in re.split(r'(\d+)', tag) if part)
+    return (0, natural, tag)
+
+
+def _range_bounds(comparator: str) -> List[Tuple[str, Tuple[int, int, int]]]:
+    """
+    把单个比较表达式转换为 (操作符, 版本) 约束列表
+    x/X/* 表示通配，^/~ 按 npm 语义展开为上下界；
+    省略的版本段按 npm 语义处理：>7 即 >=8.0.0，<=7.2 即 <7.3.0
+    """
+    match = RANGE_PATTERN.match(comparator)
+    if not match:
+        raise ValueError(f"无法解析的版本范围: {comparator}")
+    operator, *raw_parts = match.groups()
+    parts = [part for part in raw_parts if part is not None]
+    wildcard_at = next((index for index, part in enumerate(parts) if part in ('x', 'X', '*')), len(parts))
+    numbers = [int(part) for part in parts[:wildcard_at]]
+    lower = tuple(numbers + [0] * (3 - len(numbers)))
+
+    if operator in (None, '=') and wildcard_at < 3:
+        # 8.4 或 8.4.x 视为 8.4 的全部补丁版本
+        if not numbers:
+            return []
+        upper = numbers[:-1] + [numbers[-1] + 1]
+        return [('>=', lower), ('<', tuple(upper + [0] * (3 - len(upper))))]
+    if operator == '^':
+        significant = next((index for index, value in enumerate(lower) if value != 0), len(numbers) - 1)
+        significant = min(significant, max(len(numbers) - 1, 0))
+        upper = list(lower[:significant]) + [lower[significant] + 1]
+        return [('>=', lower), ('<', tuple(upper + [0] * (3 - len(upper))))]
+    if operator in ('>', '<=') and wildcard_at < 3:
+        # 部分版本号表示整个区间：大于区间即大于等于下一个区间的起点，小于等于区间即小于下一个区间的起点
+        if not numbers:
+            return [('<', (0, 0, 0))] if operator == '>' else []
+        upper = numbers[:-1] + [numbers[-1] + 1]
+        return [('>=' if operator == '>' else '<', tuple(upper + [0] * (3 - len(upper))))]
+    if operator == '~':
+        bump = 0 if len(numbers) == 1 else 1
+        upper = list(lower[:bump]) + [lower[bump] + 1]
+        return [('>=', lower), ('<', tuple(upper + [0] * (3 - len(upper))))]
+    return [(operator or '=', lower)]
+
+
+# 判断标签是否匹配模式
+def match_tag(pattern: str, tag: str) -> bool:
+    if any(ch in pattern for ch in '*?[') and pattern[:1] not in ('>', '<', '=', '^', '~'):
+        return fnmatch.fnmatchcase(tag, pattern)
+
+    version = parse_version(tag)
+    if version is None:
+        return False
+    for comparator in pattern.split(','):
+        for operator, bound in _range_bounds(comparator.strip()):
+            if operator == '>=' and not version >= bound:
+                return False
+            if operator == '>' and not version > bound:
+                return False
+            if operator == '<=' and not version <= bound:
+                return False
+            if operator == '<' and not version < bound:
+                return False
+            if operator == '=' and not version == bound:
+                return False
+    return True
+
+
+# 从标签列表中筛选匹配模式的标签，按从新到旧排序；latest 大于0时只保留最新的 latest 个
+def select_tags(pattern: str, tags: List[str], latest: int = 0) -> List[str]:
+    matched = sorted((tag for tag in tags if match_tag(pattern, tag)), key=tag_sort_key, reverse=True)
+    return matched[:latest] if latest > 0 else matched
+
+
+if __name__ == "__main__":
+    # 自检：python script/tagpattern.py
+    tags = ['6.2.14', '7.0.0', '7.0.1', '7.2.4', '7.4.0', '8.0.0', '8.0.2', 'latest', '7.2-alpine']
+    assert is_tag_pattern('7.x') and is_tag_pattern('8.4.X') and is_tag_pattern('>7')
+    assert not is_tag_pattern('7.2') and not is_tag_pattern('latest') and not is_tag_pattern('alpine-x')
+    assert select_tags('7.x', tags) == ['7.4.0', '7.2.4', '7.0.1', '7.0.0']
+    assert select_tags('>7', tags) == ['8.0.2', '8.0.0']
+    assert select_tags('>7.2', tags) == ['8.0.2', '8.0.0', '7.4.0']
+    assert select_tags('<=7', tags) == ['7.4.0', '7.2.4', '7.0.1', '7.0.0', '6.2.14']
+    assert select_tags('^7.2', tags) == ['7.4.0', '7.2.4']
+    assert select_tags('>=7.0.1,<8', tags) == ['7.4.0', '7.2.4', '7.0.1']
+    print("tagpattern 自检通过")